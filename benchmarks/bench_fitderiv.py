@@ -0,0 +1,39 @@
+'''
+End-to-end benchmarks of fitderiv, from the data to the statistics of the inferred growth rate.
+'''
+import numpy as np
+from diaux import fitderiv as fd
+from . import curves
+from .bench_gaussianprocess import densemax
+
+
+
+class FitDeriv:
+    params= (['nn', 'sqexp', 'matern', 'maternss'], [50, 200, 1000, 5000], ['logistic', 'diauxic'])
+    param_names= ['kernel', 'N', 'curve']
+    timeout= 600
+
+    def setup(self, kernel, n, curve):
+        # sampling the statistics needs the full covariance of the fit unless it is a state-space model
+        if n > densemax and kernel != 'maternss':
+            raise NotImplementedError
+        self.t, self.od= getattr(curves, curve)(n)
+
+    def time_fitderiv(self, kernel, n, curve):
+        fd.fitderiv(self.t, self.od, cvfn= kernel, noruns= 2, quiet= True, seed= 0)
+
+
+
+class FitReplicates:
+    params= ([1, 4, 16], [False, True])
+    param_names= ['noreps', 'batch']
+    timeout= 600
+
+    def setup(self, noreps, batch):
+        if noreps == 1 and batch:
+            raise NotImplementedError
+        self.t= curves.logistic(100)[0]
+        self.od= np.column_stack([curves.logistic(100, seed= i)[1] for i in range(noreps)])
+
+    def time_fitderiv(self, noreps, batch):
+        fd.fitderiv(self.t, self.od, noruns= 2, quiet= True, batch= batch, seed= 0)
@@ -0,0 +1,157 @@
+'''
+Benchmarks of the Gaussian process hot paths for each covariance function and a range of numbers of data points.
+
+Combinations that would take minutes, the O(N^3) dense solvers for the largest data sets, are skipped.
+'''
+import numpy as np
+from diaux import gaussianprocess as gp
+from . import curves
+
+kernels= ['ln', 'nn', 'sqexp', 'sqexplin', 'matern', 'maternss']
+sizes= [50, 200, 1000, 5000]
+# bounds on the hyperparameters in log10 space
+bounds= {'ln': {0: (-4,4), 1: (-4,4), 2: (-5,2)},
+         'nn': {0: (-1,5), 1: (-7,-2), 2: (-6,2)},
+         'sqexp': {0: (-5,5), 1: (-6,2), 2: (-5,2)},
+         'sqexplin': {0: (-5,5), 1: (-6,2), 2: (-4,4), 3: (-5,2)},
+         'matern': {0: (-5,5), 1: (-4,4), 2: (-5,2)},
+         'maternss': {0: (-5,5), 1: (-4,4), 2: (-5,2)}}
+# largest number of data points for kernel matrices that are factorized densely
+densemax= 1000
+
+
+def makegp(kernel, n):
+    '''
+    Returns a Gaussian process for a logistic curve of n points, with hyperparameters fit to a shorter version of the curve.
+    '''
+    t, od= curves.logistic(n)
+    g= getattr(gp, kernel + 'GP')(bounds[kernel], t, np.log(od))
+    ts, ods= curves.logistic(50)
+    gs= getattr(gp, kernel + 'GP')(bounds[kernel], ts, np.log(ods))
+    gs.findhyperparameters(2, seed= 0)
+    g.lth_opt= gs.lth_opt
+    return g
+
+
+def isfast(g):
+    '''
+    Returns True if the likelihood of g is not found with a dense Cholesky decomposition.
+    '''
+    return isinstance(g, gp.maternssGP) or g.usetoeplitz(g.lth_opt) or g.xu is not None
+
+
+
+class KernelMatrix:
+    params= (kernels, sizes)
+    param_names= ['kernel', 'N']
+
+    def setup(self, kernel, n):
+        if n > densemax:
+            raise NotImplementedError
+        self.g= makegp(kernel, n)
+
+    def time_kernelmatrix(self, kernel, n):
+        self.g.kernelmatrix(self.g.lth_opt, self.g.x)
+
+    def peakmem_kernelmatrix(self, kernel, n):
+        self.g.kernelmatrix(self.g.lth_opt, self.g.x)
+
+
+
+class Likelihood:
+    params= (kernels, sizes)
+    param_names= ['kernel', 'N']
+
+    def setup(self, kernel, n):
+        self.g= makegp(kernel, n)
+        if n > densemax and not isfast(self.g):
+            raise NotImplementedError
+        self.lth= self.g.lth_opt
+
+    def time_nlml(self, kernel, n):
+        # clear the cache so that the kernel matrix is factorized every time
+        self.g._factor= None
+        self.g.nlml(self.lth)
+
+    def time_jacnlml(self, kernel, n):
+        self.g._factor= None
+        self.g.jacnlml(self.lth)
+
+    def time_nlmljac(self, kernel, n):
+        self.g._factor= None
+        self.g.nlmljac(self.lth)
+
+
+
+class FindHyperparameters:
+    params= (kernels, sizes)
+    param_names= ['kernel', 'N']
+    timeout= 300
+
+    def setup(self, kernel, n):
+        self.g= makegp(kernel, n)
+        if n > densemax and not isfast(self.g):
+            raise NotImplementedError
+
+    def time_findhyperparameters(self, kernel, n):
+        self.g.findhyperparameters(1, seed= 0)
+
+    def track_funcalls(self, kernel, n):
+        self.g.findhyperparameters(1, seed= 0)
+        return self.g.fitrecord['funcalls']
+
+
+
+class Predict:
+    params= (kernels, sizes, [0, 1, 2])
+    param_names= ['kernel', 'N', 'derivs']
+
+    def setup(self, kernel, n, derivs):
+        if kernel == 'ln' and derivs > 0:
+            # the linear covariance function has no derivatives
+            raise NotImplementedError
+        self.g= makegp(kernel, n)
+        if n > densemax and not isfast(self.g):
+            raise NotImplementedError
+        self.g.nlml(self.g.lth_opt)
+
+    def time_predict(self, kernel, n, derivs):
+        self.g.predict(self.g.x, derivs= derivs, full_cov= False)
+
+
+
+class PredictFullCov(Predict):
+    params= (kernels[:-1], [n for n in sizes if n <= densemax], [0, 1, 2])
+
+    def time_predict(self, kernel, n, derivs):
+        self.g.predict(self.g.x, derivs= derivs)
+
+
+
+class Sample:
+    params= (kernels, sizes)
+    param_names= ['kernel', 'N']
+
+    def setup(self, kernel, n):
+        self.g= makegp(kernel, n)
+        if n > densemax and not isfast(self.g):
+            raise NotImplementedError
+        self.g.predict(self.g.x, derivs= 0 if kernel == 'ln' else 2, full_cov= False)
+        self.g.sample(1, rng= 0)
+
+    def time_sample(self, kernel, n):
+        # the factorization of the covariance of the prediction is cached by the first sample
+        self.g.sample(100, rng= 0)
+
+
+
+class Sparse:
+    params= ([1000, 5000, 20000], [50, 200])
+    param_names= ['N', 'M']
+
+    def setup(self, n, m):
+        t, od= curves.diauxic(n)
+        self.g= gp.sqexpGP(bounds['sqexp'], t, np.log(od), inducing= m)
+
+    def time_findhyperparameters(self, n, m):
+        self.g.findhyperparameters(1, seed= 0)
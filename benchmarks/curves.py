@@ -0,0 +1,41 @@
+'''
+Synthetic growth curves for the benchmarks, generated with a fixed seed so that every run times the same data.
+'''
+import numpy as np
+
+
+def logistic(n, tmax= 24, noise= 0.02, seed= 0):
+    '''
+    Returns time points and a noisy logistic growth curve of optical densities.
+
+    Arguments
+    --
+    n: number of time points
+    tmax: duration of the curve
+    noise: standard deviation of the multiplicative noise
+    seed: seed for the noise
+    '''
+    rng= np.random.default_rng(seed)
+    t= np.linspace(0, tmax, n)
+    od= 0.01*np.exp(0.6*t)/(1 + 0.01*(np.exp(0.6*t) - 1))
+    return t, od*np.exp(noise*rng.standard_normal(n))
+
+
+def diauxic(n, tmax= 24, noise= 0.02, seed= 0):
+    '''
+    Returns time points and a noisy diauxic growth curve of optical densities: growth on a preferred nutrient, a lag while switching, and slower growth on the second nutrient.
+
+    Arguments
+    --
+    n: number of time points
+    tmax: duration of the curve
+    noise: standard deviation of the multiplicative noise
+    seed: seed for the noise
+    '''
+    rng= np.random.default_rng(seed)
+    t= np.linspace(0, tmax, n)
+    # log of the first growth phase saturating at an OD of 0.3
+    first= np.log(0.01) + np.logaddexp(0, 1.2*(t - 4)) - np.logaddexp(0, 1.2*(t - 4) - np.log(30))
+    # log of the second growth phase tripling the OD after a lag of a few hours
+    second= np.logaddexp(0, 0.6*(t - 15)) - np.logaddexp(0, 0.6*(t - 15) - np.log(3))
+    return t, np.exp(first + second + noise*rng.standard_normal(n))
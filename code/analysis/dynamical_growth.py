@@ -66,58 +66,23 @@ args = (gamma_max,
 #%%
 # Specify the nutrient resets
 nutrient_dict = {-1: nutrients}
-colnames_anchor = ['protein_mass', 'ribosome_mass', 'metabolic_mass', 'precursors']
-colnames = [f'{k}__{i}' for i in range(num_muts) for k in colnames_anchor]
-colnames.append('nutrients')
+colnames = ['protein_mass', 'ribosome_mass', 'metabolic_mass', 'precursors']
 
 # Specify the dilution parameters
 dilutions = 25 
 target_mass = 0.04 * OD_CONV
-dilution_df = diaux.model.dilution_cycle(time, diaux.model.single_nutrient, 
+traj, times = diaux.model.dilution_cycle(time, diaux.model.single_nutrient, 
                                     flat_params, args, num_dilutions=dilutions, 
                                     target_mass=target_mass,
                                     nutrient_dict=nutrient_dict,
-                                    colnames=colnames,
-                                    num_muts=num_muts)
+                                    num_muts=num_muts,
+                                    return_array=True)
 
 #%%
-shared_dfs = pd.DataFrame(['time'])
-anchors = []
-for col in colnames:
-        _dilution_df = pd.DataFrame([])
-        if '__' in col:
-                name, mut = col.split('__')
-                if name not in anchors:
-                        anchors.append(name)
-# N_muts = 5 
-_dfs = []
-for n in range(num_muts):
-        _df = pd.DataFrame([])
-        for i, name in enumerate(anchors):
-                _df['time'] = dilution_df['time']
-                _df['idx'] = n
-                _df[name] = dilution_df[f'{name}__{n}']
-        _dfs.append(_df)
-
-unique  = pd.concat(_dfs)               
-for i, x in enumerate(phi_X):
-        unique.loc[unique['idx'] == i, 'phi_X'] = x
-
-
-#                 _dilution_df[name] = dilution_df[col] 
-#                 _dilution_df['idx'] = mut
-#                 _dilution_df['time'] = dilution_df['time']
-#                 shared_dfs = shared_dfs.merge(_dilution_df, on='time') 
-#         else:
-#                 _dilution_df[col] = dilution_df[col]
-#                 _dilution_df['time'] = dilution_df['time']
-#                 tidy_dfs[1].append(_dilution_df) 
-
-
-# unique = pd.concat(tidy_dfs[0], join='outer', sort=False)
-# unique = unique.pivot(index='idx', columns=['value'])
-# # shared = pd.concat(tidy_dfs[1],sort=False)
-# unique
+unique = diaux.model.tidy_dilution(traj, times, colnames, 
+                                   shared_colnames=['nutrients'],
+                                   num_muts=num_muts)
+unique['phi_X'] = phi_X[unique['idx'].values]
 
 
 #%%
@@ -1,11 +1,11 @@
 #%%
 import numpy as np 
 import pandas as pd 
-import tqdm
 # import bokeh.io 
 # import bokeh.plotting
 # import bokeh.widgets
 import scipy.integrate
+import diaux.model
 import diaux.viz
 import altair as alt
 colors, palette = diaux.viz.altair_style()
@@ -86,37 +86,7 @@ df['od'] = df['dM_dt'].values /(OD_CONV)
 alt.Chart(df).mark_line().encode(x='time:Q', y=alt.Y('od:Q'))
 
 # %%
-
-def diauxic_nutrient(params, t, gamma_max, nu_x_max, nu_y_max, theta_0, K_mx, K_my, 
-                    phi_x_max, phi_y_max, phi_R, omega_x, omega_y,  vol):
-    M, Mr, Mx, My, m, n_x, n_y = params
-
-    # Compute the nutrient mass fraction
-    theta =  m / M
-    c_x = (n_x / (AVO * vol))
-    c_y = (n_y / (AVO * vol))
-
-    # Compute the translational capacity
-    gamma = gamma_max * theta / (theta + theta_0)
-    nu_x = nu_x_max * c_x / (c_x + K_mx)
-    nu_y = nu_y_max * c_y / (c_y + K_my)
-
-    # Define the allocation     
-    phi_X = phi_x_max * (c_x / (c_x + K_mx))  
-    phi_Y = phi_y_max * (1 - (c_x / (c_x + K_mx)))
-    # phi_R = 1 - (phi_O + phi_X + phi_Y)
-
-    # Describe biomass accumulation
-    dM_dt = gamma * Mr 
-    dMr_dt = phi_R * dM_dt
-    dMx_dt = phi_X * dM_dt 
-    dMy_dt = phi_Y * dM_dt 
-
-    # Describe amino acid concentrations
-    dm_dt = nu_x * Mx + nu_y * My - dM_dt
-    dnx_dt = -nu_x * Mx / omega_x
-    dny_dt = -nu_y * My / omega_y
-    return [dM_dt, dMr_dt, dMx_dt, dMy_dt, dm_dt, dnx_dt, dny_dt]
+from diaux.model import diauxic_nutrient, diauxic_nutrient_jacobian
 
 # Constants
 gamma_max = (17.1 * 3600) / 7459 # in s^-1 using numbers for E. coli
@@ -158,10 +128,11 @@ time = np.linspace(time_start, time_end, n_steps)
 
 # Pack up parameters and arguments
 _params = [M, Mr, Mx, My, m, n_x, n_y]
-_args = (gamma_max, nu_x_max, nu_y_max, theta_0, K_mx, 
-         K_my, phi_x, phi_y, phi_R, omega_x, omega_y, VOL)
+_args = (gamma_max, nu_x_max, nu_y_max, theta_0, K_mx, K_my, omega_x, 
+         omega_y, phi_R, phi_x, phi_y, 1, VOL)
 # Define the time steps
-out = scipy.integrate.odeint(diauxic_nutrient, _params, time, args=_args)
+out = scipy.integrate.odeint(diauxic_nutrient, _params, time, args=_args,
+                             Dfun=diauxic_nutrient_jacobian)
 
 df = pd.DataFrame(out, columns=['dM_dt', 'dMr_dt', 'dMx_dt', 'dMy_dt', 'dm_dt', 'dnx_dt', 'dny_dt'])
 df['time'] = time
@@ -186,27 +157,25 @@ time_end = 10
 time = np.linspace(time_start, time_end, n_steps)
 
 # Pack up parameters and arguments
-dfs = []
-for i, phi in enumerate(tqdm.tqdm(phi_y)):
-    _params = [M, Mr, Mx, My, m, n_x, n_y]
-    _args = (gamma_max, nu_x_max, nu_y_max, theta_0, K_mx, 
-             K_my, phi_x, phi, phi_R, omega_x, omega_y, VOL)
-    # Define the time steps
-    out = scipy.integrate.odeint(diauxic_nutrient, _params, time, args=_args)
-
-    df = pd.DataFrame(out, columns=['dM_dt', 'dMr_dt', 'dMx_dt', 'dMy_dt', 'dm_dt', 'dnx_dt', 'dny_dt'])
-    df['time'] = time
-    df['theta'] = df['dm_dt'].values / df['dM_dt'].values
-    df['phi_R'] = df['dMr_dt'].values / df['dM_dt'].values
-    df['phi_x'] = df['dMx_dt'].values / df['dM_dt'].values
-    df['phi_y'] = df['dMy_dt'].values / df['dM_dt'].values
-    df['dcx_dt'] = df['dnx_dt'].values / (AVO * VOL)
-    df['dcy_dt'] = df['dny_dt'].values / (AVO * VOL)
-    df['od'] = df['dM_dt'].values /(OD_CONV)
-    df['phi_y_max'] = phi
-    dfs.append(df)
-
-titrate_phi_df = pd.concat(dfs, sort=False)
+_params = [M, Mr, Mx, My, m, n_x, n_y]
+_args = (gamma_max, nu_x_max, nu_y_max, theta_0, K_mx, K_my, omega_x, 
+         omega_y, phi_R, phi_x, phi_y, 1, VOL)
+
+# Integrate all allocations together
+out = diaux.model.integrate_sweep(diauxic_nutrient, _params, time, _args,
+                                  jac=diauxic_nutrient_jacobian)
+
+titrate_phi_df = pd.DataFrame(out.reshape(-1, out.shape[-1]), 
+            columns=['dM_dt', 'dMr_dt', 'dMx_dt', 'dMy_dt', 'dm_dt', 'dnx_dt', 'dny_dt'])
+titrate_phi_df['time'] = np.tile(time, len(phi_y))
+titrate_phi_df['theta'] = titrate_phi_df['dm_dt'].values / titrate_phi_df['dM_dt'].values
+titrate_phi_df['phi_R'] = titrate_phi_df['dMr_dt'].values / titrate_phi_df['dM_dt'].values
+titrate_phi_df['phi_x'] = titrate_phi_df['dMx_dt'].values / titrate_phi_df['dM_dt'].values
+titrate_phi_df['phi_y'] = titrate_phi_df['dMy_dt'].values / titrate_phi_df['dM_dt'].values
+titrate_phi_df['dcx_dt'] = titrate_phi_df['dnx_dt'].values / (AVO * VOL)
+titrate_phi_df['dcy_dt'] = titrate_phi_df['dny_dt'].values / (AVO * VOL)
+titrate_phi_df['od'] = titrate_phi_df['dM_dt'].values /(OD_CONV)
+titrate_phi_df['phi_y_max'] = np.repeat(phi_y, len(time))
 #%%
 from altair_saver import save
 base = alt.Chart(titrate_phi_df)
@@ -2,52 +2,17 @@
 import numpy as np 
 import scipy.integrate
 import pandas as pd 
+import diaux.model
 import diaux.viz 
 import altair as alt 
 from altair_saver import save
 colors, palette = diaux.viz.altair_style()
 alt.data_transformers.disable_max_rows()
 
-# Define the equations for growth on a single nutrient
-def dual_nutrient_dynamics(params, time, gamma_max, nu_x_max, nu_y_max, phi_R, phi_x_max,
-                             phi_y_max, phi_y_steady, theta_0, Km_x, Km_y, omega_x, 
-                             omega_y):
-    """
-    Defines the complete dynamical model for growth on a single carbon source. 
-
-    Parameters
-    ----------
-    params: list, of order [M, theta_a, c]
-        List of the model parameters which
-    """
-    # Unpack the initial conditions 
-    M, M_x, M_y, theta_a, c_x, c_y = params  
-
-    # Compute necessary quantities
-    gamma = gamma_max * theta_a / (theta_a + theta_0) # Translational capacity
-    nu_x = nu_x_max * c_x / (c_x + Km_x) # Nutritional capacity
-    nu_y = nu_y_max * c_y / (c_y + Km_y) # Nutritional capacity
-
-    # Define dependencies 
-    # ALlocation for glucose
-    phi_x = phi_x_max * c_x / (c_x + Km_x)
-
-    # M_y = (1 - phi_O - phi_x - phi_R) * M
-    phi_y = phi_y_max * (1 - (1 + Km_x/c_x)**-1) #* (1 - (1 + phi_y_steady/(M_y/M))**-1)
-
-
-    # Define the system of equations
-    dM_dt = phi_R * M * gamma
-
-    dMx_dt = phi_x * dM_dt
-    dMy_dt = phi_y * dM_dt
-
-    # dMp_dt = (phi_R_max - phi_R) * dM_dt
-    dtheta_dt = M * (nu_x * phi_x + nu_y * phi_y) - dM_dt 
-    dcx_dt = -nu_x * phi_x * M / omega_x
-    dcy_dt = -nu_y * phi_y * M / omega_y
-    return [dM_dt, dMx_dt, dMy_dt, dtheta_dt, dcx_dt, dcy_dt] 
-
+# Define the conversion factors
+OD_CONV = 6E17
+AVO = 6.022E23
+VOL = 1E-3
 
 omega_x = 0.3
 omega_y = 0.2
@@ -62,27 +27,35 @@ nu_x_max = 2.5
 nu_y_max = 2
 phi_x_max = 0.3
 phi_y_max = 0.02
-phi_y_steady = 0.01
-M = 0.001
-theta_a = 0.1 * M
 theta_0 = 0.001 * 20
+
+# Set up the initial conditions
+M = 0.04 * OD_CONV
+M_r = phi_R * M
+M_x = phi_x_max * M
+M_y = 0
+theta_a = 0.1 * M
+n_x = c_x * AVO * VOL
+n_y = c_y * AVO * VOL
+
 n_steps = 500
 t_start = 0
 t_end = 50
-dt = (t_start - t_end) / n_steps 
 time = np.linspace(t_start, t_end, n_steps)
-out = scipy.integrate.odeint(dual_nutrient_dynamics, [M, theta_a, c_x, c_y],
-                             time, args=(gamma_max, nu_x_max, nu_y_max, phi_R,
-                                         phi_x_max, phi_y_max, phi_y_steady,theta_0, Km_x, Km_y, 
-                                         omega_x, omega_y))
+args = (gamma_max, nu_x_max, nu_y_max, theta_0, Km_x, Km_y, omega_x, omega_y,
+        phi_R, phi_x_max, phi_y_max, 1, VOL)
+out = scipy.integrate.odeint(diaux.model.diauxic_nutrient, 
+                             [M, M_r, M_x, M_y, theta_a, n_x, n_y], time, 
+                             args=args, Dfun=diaux.model.diauxic_nutrient_jacobian)
 
 
-df = pd.DataFrame(out, columns=['dM_dt', 'dtheta_dt', 'dcx_dt', 'dcy_dt'])
+df = pd.DataFrame(out, columns=['dM_dt', 'dMr_dt', 'dMx_dt', 'dMy_dt', 
+                                'dtheta_dt', 'dnx_dt', 'dny_dt'])
 df['time'] = time
 df['rel_m'] = df['dM_dt'].values / M
 df['rel_m'] = df['rel_m'].values.astype(float)
-df['rel_cx'] = df['dcx_dt'].values / c_x
-df['rel_cy'] = df['dcy_dt'].values / c_y
+df['rel_cx'] = df['dnx_dt'].values / n_x
+df['rel_cy'] = df['dny_dt'].values / n_y
 df['theta_cell'] = df['dtheta_dt'].values / df['dM_dt'].values
 
 base = alt.Chart(df).encode(x='time:Q')
@@ -1,7 +1,11 @@
+import logging
+import time
 import numpy as np
 from . import gaussianprocess as gp
 import matplotlib.pyplot as plt
 
+logger= logging.getLogger(__name__)
+
 #####
 def findsmoothvariance(y, filtsig= 0.1, nopts= False):
     '''
@@ -114,12 +118,19 @@ class fitderiv:
         q.ddf : fitted second time-derivative
         q.ddfvar : variance (error) in the fitted second time-derivative
 
+    Progress and warnings, the best-fit hyperparameters, and the statistics are reported with the logging module (logger 'diaux.fitderiv' and 'diaux.gaussianprocess'), so use, for example, logging.basicConfig(level= logging.INFO) to display them, and q.fitrecord summarizes the fit - the negative log marginal likelihood, the number of iterations of the optimizer, any hyperparameters at a bound, and the time taken. With quiet= True, the kernel, the best-fit hyperparameters, and the statistics are not reported.
+
     Statistics are stored in a dictionary, q.ds, with keys:
         'max df' : max time derivative
         'time of max df' : time at which the max time derivative occurs
         'inverse max df' : the timescale found from inverting the max time derivative
         'max f': the maximum value of the fitted curve
         'lag time' : lag time (when the tangent from the point of max time derivative crosses a line parallel to the x-axis and passing through the first data point)
+    and, for diauxic growth (diauxie= True),
+        'max df 1', 'max df 2' : the largest time derivative and the most prominent other local maximum, separated from it by a clear dip in the time derivative, in order of time
+        'time of max df 1', 'time of max df 2' : the times at which these maxima occur
+        'shift time' : the time of the minimum of the time derivative between the two maxima
+        'diauxic lag' : the lag between the growth phases (when the tangent from the second maximum crosses a line parallel to the x-axis and passing through the fit at the shift time, less the shift time)
     All statistics can be postfixed by ' var' to find the variance of the estimate.
 
     Please cite
@@ -129,12 +140,16 @@ class fitderiv:
     Nat Commun 7 (2016) 13766
 
     to acknowledge the software.
+
+    A fit can be saved, with q.save('fit.npz'), and reloaded without refitting, with q= fitderiv.load('fit.npz').
     '''
 
     def __init__(self, t, d, cvfn= 'sqexp', noruns= 5, exitearly= False, figs= False, bd= False,
                  esterrs= False, optmethod= 'l_bfgs_b', nosamples= 100, logs= True,
                  gui= False, figtitle= False, ylabel= 'y', stats= True, statnames= False,
-                 showstaterrors= True, warn= False, linalgmax= 3):
+                 showstaterrors= True, warn= False, linalgmax= 3, nojobs= 1, inducing= False, seed= None,
+                 hpcache= False, condition= None, instrument= None, batch= False, quiet= False,
+                 diauxie= False, pool= 'process'):
         '''
         Runs a Gaussian process to fit data and estimate the time-derivative
 
@@ -142,7 +157,7 @@ class fitderiv:
         --
         t: array of time points
         d: array of data with replicates in columns
-        cvfn: kernel function for the Gaussian process used in the fit - 'sqexp' (squared exponential: default), 'matern' (Matern with nu= 5/2), or 'nn' (neural network)
+        cvfn: kernel function for the Gaussian process used in the fit - 'sqexp' (squared exponential: default), 'matern' (Matern with nu= 5/2), 'maternss' (Matern with nu= 5/2 solved as a state-space model, whose cost grows linearly with the number of data points), or 'nn' (neural network)
         noruns: number of fitting attempts made (default is 5)
         exitearly: if True, stop at the first successful fit; if False, take the best fit from all successful fits
         figs: plot the results of the fit
@@ -151,7 +166,7 @@ class fitderiv:
         optmethod: the optimization method to maximize the likelihood - 'l_bfgs_b' or 'tnc'
         nosamples: number of samples taken to estimate errors in statistics
         logs: if True, the natural logarithm is taking of the data points before fitting
-        gui: if True, extra output is printed for the GUI
+        gui: if True, a shorter summary of the fit, suited to the GUI, is logged
         figtitle: title of the figure showing the fit
         ylabel: label of the y-axis of the figure showing the fit
         stats: if True, summary statistics of fit and inferred derivative are calculated
@@ -159,10 +174,23 @@ class fitderiv:
         showstaterrors: if True, display estimated errors for statistics
         warn: if False, warnings created by covariance matrices that are not positive semi-definite are stopped
         linalgmax: number of attempts (default is 3) if a linear algebra (numerical) error is generated
+        nojobs: number of fitting attempts run concurrently in a process pool (default is 1)
+        inducing: if specified, the number (or an array of the positions) of inducing points used for a sparse approximation of the Gaussian process, making long or pooled time series feasible
+        seed: if specified, seeds the initial values of the fitting attempts and the samples used to estimate errors in statistics
+        hpcache: if specified, a hyperparametercache; if it holds hyperparameters for this kernel, condition, and instrument, a single fitting attempt is started from them, and the best-fit hyperparameters are added to the cache
+        condition: the condition or strain used to look up hyperparameters in hpcache
+        instrument: the instrument used to look up hyperparameters in hpcache
+        batch: if True, replicates are fit as independent outputs of a Gaussian process with shared hyperparameters, needing one factorization of an N x N rather than an (noreps N) x (noreps N) kernel matrix, and the fit and its derivatives are the mean over replicates; replicates must have no missing data and neither inducing points nor the maternss covariance function can be used, otherwise the replicates are fit together. This is a different noise model rather than a faster equivalent of the default: each replicate is a separate sample of the latent function, whose variance is divided by the number of replicates, rather than noisy measurements of one shared function, and the inferred derivatives can differ (by up to 0.12 at a peak growth rate of 0.66 for three replicates of a typical curve)
+        quiet: if True, do not report the kernel, the best-fit hyperparameters, and the statistics
+        diauxie: if True, statistics of the two growth phases of a diauxic shift are also calculated
+        pool: if nojobs > 1, 'process' (default) or 'thread' to start a pool of nojobs workers for this fit, or an existing concurrent.futures executor to reuse when fitting many data sets, avoiding the cost of starting a process pool for each
         '''
+        starttime= time.perf_counter()
         self.version= '1.03'
+        self.cvfn= cvfn
         self.ylabel= ylabel
         self.logs= logs
+        self.quiet= quiet
         if not warn:
             # warning generated occasionally when sampling from the Gaussian process likely because of numerical errors
             import warnings
@@ -178,13 +206,14 @@ class fitderiv:
         bnn= {0 : (-1,5), 1: (-7,-2), 2: (-6,2)}
         bsqexp= {0: (-5,5), 1: (-6,2), 2: (-5,2)}
         bmatern= {0: (-5,5), 1: (-4,4), 2: (-5,2)}
+        bmaternss= bmatern
         # take log of data
         self.origd= d
         if logs:
-            print('Taking natural logarithm of the data.')
+            logger.info('Taking natural logarithm of the data.')
             if np.any(np.nonzero(d < 0)):
-                print('Negative data found, but all data must be positive if taking logs.')
-                print('Ignoring request to take logs.')
+                logger.warning('Negative data found, but all data must be positive if taking logs. '
+                               'Ignoring request to take logs.')
             else:
                 d= np.log(np.asarray(d))
         # run checks and define measurement errors
@@ -195,8 +224,8 @@ class fitderiv:
                 if noreps > 1:
                     lod= [len(np.nonzero(~np.isnan(d[:,i]))[0]) for i in range(noreps)]
                     if np.sum(np.diff(lod)) != 0:
-                        print('The replicates have different number of data points.')
-                        print('Equal numbers of data points are needed for empirically estimating errors.')
+                        logger.warning('The replicates have different number of data points. '
+                                       'Equal numbers of data points are needed for empirically estimating errors.')
                     else:
                         # estimate errors empirically
                         merrors= findsmoothvariance(d)
@@ -206,76 +235,110 @@ class fitderiv:
                             plt.plot(t, d, '.')
                             plt.show(block= False)
                 else:
-                    print('Not enough replicates to estimate errors.')
+                    logger.warning('Not enough replicates to estimate errors.')
             else:
                 # esterrs given as an array of errors
                 if len(esterrs) != len(t):
-                    print('Each time point requires an estimated error.')
+                    logger.warning('Each time point requires an estimated error.')
                 else:
                     merrors= esterrs
         if not np.any(merrors):
-            print('Fitting measurement errors.')
-        # display details of covariance functions
+            logger.info('Fitting measurement errors.')
         try:
             if bd:
                 bds= mergedicts(original= eval('b' + cvfn), update= bd)
             else:
                 bds= eval('b' + cvfn)
-            if not gui:
-                gt= getattr(gp, cvfn + 'GP')(bds, t, d)
-                print('Using a ' + gt.description + '.')
-                gt.info()
         except NameError:
-            print('Gaussian process not recognized.')
-            from sys import exit
-            exit()
+            raise gp.gaussianprocessException('Gaussian process ' + cvfn + ' not recognized.')
+        # display details of covariance functions
+        if not gui and not quiet:
+            gt= getattr(gp, cvfn + 'GP')(bds, t, d)
+            logger.info('Using a %s.', gt.description)
+            gt.info()
         self.bds= bds
-        # combine data into one array
-        tb= np.tile(t, noreps)
-        db= np.reshape(d, np.size(d), order= 'F')
-        if np.any(merrors):
-            mb= np.tile(merrors, noreps)
-        # remove any nans
-        da= db[~np.isnan(db)]
-        ta= tb[~np.isnan(db)]
-        if np.any(merrors):
-            ma= mb[~np.isnan(db)]
+        if batch:
+            # batch mode needs complete replicates and a Gaussian process that accepts 2-d data
+            if noreps == 1:
+                reason= 'there is only one replicate'
+            elif np.any(np.isnan(d)):
+                reason= 'the replicates have missing data'
+            elif np.any(inducing) or cvfn == 'maternss':
+                reason= 'the ' + ('sparse' if np.any(inducing) else 'state-space') + ' Gaussian process only fits 1-d data'
+            else:
+                reason= None
+            if reason:
+                logger.warning('Not using batch mode because %s: fitting replicates together.', reason)
+                batch= False
+        self.batch= batch
+        if batch:
+            # each replicate is an output of the same Gaussian process
+            ta, da, ma= t, d, merrors
         else:
-            ma= False
+            # combine data into one array
+            tb= np.tile(t, noreps)
+            db= np.reshape(d, np.size(d), order= 'F')
+            if np.any(merrors):
+                mb= np.tile(merrors, noreps)
+            # remove any nans
+            da= db[~np.isnan(db)]
+            ta= tb[~np.isnan(db)]
+            if np.any(merrors):
+                ma= mb[~np.isnan(db)]
+            else:
+                ma= False
         # run Gaussian process
-        g= getattr(gp, cvfn + 'GP')(bds, ta, da, merrors= ma)
-        g.findhyperparameters(noruns, exitearly= exitearly, optmethod= optmethod, linalgmax= linalgmax)
+        g= getattr(gp, cvfn + 'GP')(bds, ta, da, merrors= ma, inducing= inducing)
+        stvals= hpcache.get(cvfn, condition, instrument) if hpcache else None
+        warmstarted= False
+        if stvals is not None and len(stvals) == len(g.b):
+            # warm start from cached hyperparameters kept within the current bounds
+            b= np.array(g.b)*np.log(10)
+            try:
+                g.findhyperparameters(1, stvals= np.clip(stvals, b[:,0], b[:,1]), optmethod= optmethod,
+                                      linalgmax= linalgmax)
+                warmstarted= True
+            except gp.gaussianprocessException:
+                logger.warning('Warm start failed - fitting from random initial values.')
+        if not warmstarted:
+            g.findhyperparameters(noruns, exitearly= exitearly, optmethod= optmethod, linalgmax= linalgmax,
+                                  nojobs= nojobs, pool= pool, seed= seed)
+        if hpcache:
+            hpcache.update(cvfn, condition, instrument, g.lth_opt)
         # display results of fit
         if gui:
-            print('log(max likelihood)= %e' % (-g.nlml_opt))
+            logger.info('log(max likelihood)= %e', -g.nlml_opt)
             for el in g.hparamerr:
-                if el[1] == 'l':
-                    print('Warning: hyperparameter ' + str(el[0]) + ' is at a lower bound.')
-                else:
-                    print('Warning: hyperparameter ' + str(el[0]) + ' is at an upper bound.')
-                print('\tlog10(hyperparameter %d)= %4.2f' % (el[0], np.log10(np.exp(g.lth_opt[el[0]]))))
-        else:
+                logger.warning('hyperparameter %d is at %s bound: log10(hyperparameter %d)= %4.2f', el[0],
+                               'a lower' if el[1] == 'l' else 'an upper', el[0], np.log10(np.exp(g.lth_opt[el[0]])))
+        elif not quiet:
             g.results()
-        g.predict(t, derivs= 2, merrorsnew= merrors)
+        g.predict(t, derivs= 2, merrorsnew= merrors, full_cov= False)
         fmnp= g.mnp
-        fcovp= g.covp
+        # the mean over replicates fit as independent outputs has a variance reduced by noreps
+        self._varfac= 1/noreps if batch else 1
+        if batch:
+            fmnp= np.mean(fmnp, 1)
         # save results
         self.g= g
         self.logmaxlike= -g.nlml_opt
         self.hparamerr= g.hparamerr
         self.lth= g.lth_opt
         self.fmnp= fmnp
-        self.fcovp= fcovp
         self.t= t
         self.d= d
         self.f= fmnp[:len(t)]
         self.df= fmnp[len(t):2*len(t)]
         self.ddf= fmnp[2*len(t):]
-        self.fvar= np.diag(fcovp)[:len(t)]
-        self.dfvar= np.diag(fcovp)[len(t):2*len(t)]
-        self.ddfvar= np.diag(fcovp)[2*len(t):]
+        self.fvar= self._varfac*g.fvar
+        self.dfvar= self._varfac*g.dfvar
+        self.ddfvar= self._varfac*g.ddfvar
         self.merrors= merrors
-        if stats: self.calculatestats(nosamples, statnames, showstaterrors)
+        if stats: self.calculatestats(nosamples, statnames, showstaterrors, rng= seed, diauxie= diauxie)
+        self.fitrecord= dict(g.fitrecord, kernel= cvfn, noreps= noreps, warmstart= warmstarted,
+                             time= time.perf_counter() - starttime)
+        logger.info('Fitted %d replicate(s) with a %s Gaussian process: nlml= %e in %.3g s', noreps, cvfn,
+                    g.nlml_opt, self.fitrecord['time'], extra= {'fitrecord': self.fitrecord})
         if figs:
             plt.figure()
             self.plotfit()
@@ -292,7 +355,16 @@ class fitderiv:
 
 
 
-    def sample(self, nosamples, newt= False):
+    @property
+    def fcovp(self):
+        '''
+        The covariance matrix of the fit and its first two time-derivatives, calculated when first needed.
+        '''
+        return self._varfac*self.g.covp
+
+
+
+    def sample(self, nosamples, newt= False, rng= None):
         '''
         Generate sample values for the latent function and its first two derivatives (returned as a tuple).
 
@@ -300,24 +372,64 @@ class fitderiv:
         ---
         nosamples: number of samples
         newt: if False, the orginal time points are used; if an array, samples are made for those time points
+        rng: if specified, a numpy Generator or a seed for one used to draw the samples
         '''
         if np.any(newt):
             newt= np.asarray(newt)
-            import copy
-            # make prediction for new time points
-            gps= copy.deepcopy(g)
-            gps.predict(newt, derivs= 2)
+            gps= self._predictat(newt)
         else:
             newt= self.t
             gps= self.g
         noreps= self.noreps
-        fghs= gps.sample(nosamples)
+        fghs= gps.sample(nosamples, rng= rng)
+        if fghs.ndim > 2:
+            # mean over replicates fit as independent outputs
+            fghs= np.mean(fghs, 1)
         f= fghs[:len(newt),:]
         g= fghs[len(newt):2*len(newt),:]
         h= fghs[2*len(newt):,:]
         return f, g, h
 
 
+    def predict(self, newt, chunksize= 1000):
+        '''
+        Returns the fit and its first two time-derivatives and their variances at new time points as a dictionary with keys 't', 'f', 'fvar', 'df', 'dfvar', 'ddf', and 'ddfvar'.
+
+        Only the variances are found and the new time points are processed in chunks so that the memory used is bounded even for grids much denser than the data. Use sample with newt for joint samples.
+
+        Arguments
+        --
+        newt: an array of time points
+        chunksize: number of time points predicted at a time
+        '''
+        newt= np.asarray(newt, dtype= float)
+        gps= self._predictat(newt, chunksize)
+        n= len(newt)
+        mnp= np.mean(gps.mnp, 1) if self.batch else gps.mnp
+        return {'t': newt, 'f': mnp[:n], 'fvar': self._varfac*gps.fvar, 'df': mnp[n:2*n],
+                'dfvar': self._varfac*gps.dfvar, 'ddf': mnp[2*n:], 'ddfvar': self._varfac*gps.ddfvar}
+
+
+    def _predictat(self, newt, chunksize= None):
+        '''
+        Returns a copy of the Gaussian process with predictions for the fit and its first two time-derivatives at new time points, leaving the predictions at the original time points unchanged.
+
+        Arguments
+        --
+        newt: an array of time points
+        chunksize: if specified, the number of time points predicted at a time
+        '''
+        import copy
+        # a shallow copy shares the data and the factorization of the kernel matrix
+        gps= copy.copy(self.g)
+        if np.any(self.merrors):
+            merrorsnew= np.interp(newt, self.t, self.merrors)
+        else:
+            merrorsnew= False
+        gps.predict(newt, derivs= 2, merrorsnew= merrorsnew, full_cov= False, chunksize= chunksize)
+        return gps
+
+
     def plotfit(self, char= 'f', errorfac= 1, xlabel= 'time', ylabel= False, figtitle= False):
         '''
         Plots the results of the fit.
@@ -345,54 +457,65 @@ class fitderiv:
 
 
 
-    def calculatestats(self, nosamples= 100, statnames= False, showerrors= True):
+    def calculatestats(self, nosamples= 100, statnames= False, showerrors= True, rng= None, diauxie= False):
         '''
-        Calculates statistics from best-fit curve and its inferred time derivative - 'max df', 'time of max df', 'inverse max grad', 'max f', 'lag time'.
+        Calculates statistics from best-fit curve and its inferred time derivative - 'max df', 'time of max df', 'inverse max grad', 'max f', 'lag time', and, for diauxic growth, 'max df 1', 'time of max df 1', 'max df 2', 'time of max df 2', 'shift time', 'diauxic lag'.
+
+        Each statistic is calculated for all samples at once. For diauxic statistics, samples without two maxima of the time derivative are ignored.
 
         Arguments
         --
         nosamples: number of samples used to estimate errors in the statistics
         statnames: a list of alternative names for the statistics
         showerrors: display estimated errors for statistics
+        rng: if specified, a numpy Generator or a seed for one used to draw the samples
+        diauxie: if True, also calculate the statistics of the two growth phases of a diauxic shift
         '''
-        print('\nCalculating statistics with ' + str(nosamples) + ' samples')
-        if showerrors: print('\t(displaying mean +/- standard deviation [standard error])\n')
+        logger.info('Calculating statistics with %d samples', nosamples)
+        quiet= getattr(self, 'quiet', False)
+        if showerrors and not quiet: logger.info('(displaying mean +/- standard deviation [standard error])')
         if statnames:
             self.stats= statnames
         else:
             self.stats= ['max df', 'time of max df', 'inverse max df', 'max ' + self.ylabel, 'lag time']
-        t, noreps= self.t, self.noreps
-        fs, gs, hs= self.sample(nosamples)
+            if diauxie:
+                self.stats += ['max df 1', 'time of max df 1', 'max df 2', 'time of max df 2', 'shift time',
+                               'diauxic lag']
+        t, noreps= np.asarray(self.t), self.noreps
+        fs, gs, hs= self.sample(nosamples, rng= rng)
         # calculate stats
         im= np.argmax(gs, 0)
         mgr= gs[im, np.arange(nosamples)]
-        tmgr= np.array([t[i] for i in im])
+        tmgr= t[im]
         dt= np.log(2)/mgr
         if self.logs:
             md= np.exp(np.max(fs, axis= 0))
         else:
             md= np.max(fs, axis= 0)
         lagtime= tmgr + (fs[0, np.arange(nosamples)] - fs[im, np.arange(nosamples)])/mgr
+        sts= [mgr, tmgr, dt, md, lagtime]
+        if diauxie:
+            sts += _diauxicstats(t, fs, gs)
         # store stats
         ds= {}
-        for stname, st in zip(self.stats, [mgr, tmgr, dt, md, lagtime]):
-            ds[stname]= np.mean(st)
-            ds[stname + ' var']= np.var(st)
+        for stname, st in zip(self.stats, sts):
+            ds[stname]= np.nanmean(st)
+            ds[stname + ' var']= np.nanvar(st)
         self.ds= ds
         self.nosamples= nosamples
-        self.printstats(showerrors= showerrors)
+        self.printstats(showerrors= showerrors, performprint= not quiet)
 
 
 
     def printstats(self, errorfac= 1, showerrors= True, performprint= True):
         '''
-        Creates and prints a dictionary of the statistics of the data and its inferred time-derivative
+        Creates and logs, at the INFO level, a dictionary of the statistics of the data and its inferred time-derivative
 
         Arguments
         --
         errorfac: sets the size of the errorbars to be errorfac times the standard deviation
         showerrors: if True (default), display errors
-        performprint: if True, displays results
+        performprint: if True, logs results
         '''
         ds= self.ds
         statd= {}
@@ -404,10 +527,9 @@ class fitderiv:
             if performprint:
                 stname= s.rjust(lenstr + 1)
                 if showerrors:
-                    print('{:s}= {:6e} +/- {:6e} [{:6e}]'.format(stname, statd[s], statd[s +' std'],
-                                                                 statd[s + ' stderr']))
+                    logger.info('%s= %6e +/- %6e [%6e]', stname, statd[s], statd[s +' std'], statd[s + ' stderr'])
                 else:
-                    print('{:s}= {:6e}'.format(stname, statd[s]))
+                    logger.info('%s= %6e', stname, statd[s])
         return statd
 
 
@@ -431,7 +553,7 @@ class fitderiv:
             ax.set_xticklabels(stats)
             plt.show(block= False)
         except AttributeError:
-            print(" Statistics have not been calculated.")
+            logger.error('Statistics have not been calculated.')
 
 
     def plotfvsdf(self, ylabel= 'f', title= ''):
@@ -495,7 +617,344 @@ class fitderiv:
                 df.to_excel(fname, sheet_name= 'Sheet1', index= False)
             dfs.to_excel('.'.join(fname.split('.')[:-1]) + '_stats.xlsx', sheet_name= 'Sheet1', index= False)
         else:
-            print('!! File type is either not recognized or not specified. Cannot save as', fname)
+            logger.error('File type is either not recognized or not specified. Cannot save as %s', fname)
+
+
+
+    def save(self, fname, factor= False):
+        '''
+        Saves the complete fit - the data, the Gaussian process and its best-fit hyperparameters, the fit and its derivatives, and the statistics - as a NumPy .npz file that can be reloaded with load without refitting.
+
+        Arguments
+        --
+        fname: name of the file
+        factor: if True, also save the factorization of the kernel matrix so that samples and covariances can be found after reloading without refactorizing
+        '''
+        import json
+        g= self.g
+        data= {'version': self.version, 'cvfn': self.cvfn, 'ylabel': self.ylabel, 'logs': self.logs,
+               'quiet': self.quiet, 'noreps': self.noreps, 'batch': self.batch, 'varfac': self._varfac,
+               't': self.t, 'origd': self.origd, 'd': self.d, 'merrors': _tosave(self.merrors),
+               'bds': np.array([self.bds[k] for k in self.bds.keys()], dtype= float),
+               'bdskeys': np.array(list(self.bds.keys())),
+               'x': g.x, 'y': g.y, 'gmerrors': _tosave(g.merrors), 'xu': _tosave(g.xu), 'toeplitz': g.toeplitz,
+               'lth': g.lth_opt, 'nlml': g.nlml_opt, 'hparamerr': json.dumps(g.hparamerr),
+               'xnew': g.xnew, 'mnp': g.mnp, 'fvar': g.fvar, 'dfvar': g.dfvar, 'ddfvar': g.ddfvar,
+               'fitrecord': json.dumps(getattr(self, 'fitrecord', {}), default= _tojson)}
+        if hasattr(self, 'ds'):
+            data.update(stats= np.array(self.stats), dskeys= np.array(list(self.ds.keys())),
+                        dsvalues= np.array(list(self.ds.values()), dtype= float), nosamples= self.nosamples)
+        if factor and g._factor is not None and g._factor[0][1] == np.asarray(g.lth_opt, dtype= float).tobytes():
+            tag= g._factor[0][0]
+            if tag == 'dense':
+                # the kernel matrix is quickly recalculated
+                k, jk, L, al= g._factor[1:]
+                parts= [L[0], L[1], al]
+            else:
+                parts= g._factor[1:]
+            data['factortag'], data['nofactors']= tag, len(parts)
+            data.update({'factor' + str(i): part for i, part in enumerate(parts)})
+        np.savez(fname, **data)
+
+
+#####
+
+def load(fname):
+    '''
+    Loads a fit saved by fitderiv.save, without refitting.
+
+    A typical work flow is:
+
+    from diaux import fitderiv
+    q= fitderiv.load('fit.npz')
+    q.plotfit('df')
+
+    Arguments
+    --
+    fname: name of the file
+    '''
+    import json
+    with np.load(fname, allow_pickle= False) as data:
+        q= fitderiv.__new__(fitderiv)
+        q.version, q.cvfn, q.ylabel= str(data['version']), str(data['cvfn']), str(data['ylabel'])
+        q.logs, q.quiet, q.batch= bool(data['logs']), bool(data['quiet']), bool(data['batch'])
+        q.noreps, q._varfac= int(data['noreps']), float(data['varfac'])
+        q.t, q.origd, q.d, q.merrors= data['t'], data['origd'], data['d'], _fromsave(data['merrors'])
+        q.bds= {int(k): tuple(b) for k, b in zip(data['bdskeys'], data['bds'])}
+        # rebuild the Gaussian process and its prediction
+        g= getattr(gp, q.cvfn + 'GP')(q.bds, data['x'], data['y'], merrors= _fromsave(data['gmerrors']),
+                                      inducing= _fromsave(data['xu']), toeplitz= bool(data['toeplitz']))
+        g.lth_opt, g.nlml_opt= data['lth'], float(data['nlml'])
+        g.hparamerr= json.loads(str(data['hparamerr']))
+        g.fitrecord= json.loads(str(data['fitrecord']))
+        if 'factortag' in data:
+            tag= str(data['factortag'])
+            parts= [data['factor' + str(i)] for i in range(int(data['nofactors']))]
+            key= (tag, np.asarray(g.lth_opt, dtype= float).tobytes())
+            if tag == 'dense':
+                k= g.dcovmatrix('covfn', g.x, g.x, g.lth_opt)
+                g._factor= (key, k, None, (parts[0], bool(parts[1])), parts[2])
+            else:
+                g._factor= (key,) + tuple(parts)
+        xnew= data['xnew']
+        if isinstance(g, gp.maternssGP) or g.xu is not None:
+            # predictions for these Gaussian processes are fast
+            g.predict(xnew, derivs= 2, merrorsnew= q.merrors, full_cov= False)
+        else:
+            g.xnew, g.mnp= xnew, data['mnp']
+            g._covp, g._covpargs, g._samplefactor= None, (xnew, 2), None
+            g._storeprediction(g.mnp, np.concatenate((data['fvar'], data['dfvar'], data['ddfvar'])), q.merrors,
+                               True, False, 2)
+        q.g= g
+        q.lth, q.logmaxlike, q.hparamerr= g.lth_opt, -g.nlml_opt, g.hparamerr
+        q.fmnp= np.mean(g.mnp, 1) if q.batch else g.mnp
+        n= len(q.t)
+        q.f, q.df, q.ddf= q.fmnp[:n], q.fmnp[n:2*n], q.fmnp[2*n:]
+        q.fvar, q.dfvar, q.ddfvar= q._varfac*g.fvar, q._varfac*g.dfvar, q._varfac*g.ddfvar
+        q.fitrecord= g.fitrecord
+        if 'dskeys' in data:
+            q.stats= [str(st) for st in data['stats']]
+            q.ds= dict(zip([str(k) for k in data['dskeys']], data['dsvalues']))
+            q.nosamples= int(data['nosamples'])
+    return q
+
+
+
+def _tosave(a):
+    '''
+    Returns an array for saving that is empty if a is not specified.
+    '''
+    return np.empty(0) if a is None or a is False else np.asarray(a)
+
+
+def _fromsave(a):
+    '''
+    Reverses _tosave, returning False for an empty array.
+    '''
+    return False if a.size == 0 else a
+
+
+def _tojson(o):
+    '''
+    Converts NumPy types for saving as JSON.
+    '''
+    return o.tolist() if hasattr(o, 'tolist') else str(o)
+
+
+#####
+
+def fitplate(df, well= 'well', time= 'time', od= 'od', nojobs= 1, records= False, **kwargs):
+    '''
+    Fits every well of a plate with fitderiv and returns the fits and their statistics as one tidy dataframe.
+
+    The plate is pivoted once onto the time points shared by all wells so that each well is fit and predicted on the same time grid; missing measurements are ignored when fitting.
+
+    A typical work flow is:
+
+    from fitderiv import fitplate
+    fits= fitplate(plate, well= 'well', time= 'time_min', od= 'od_600nm', nojobs= 8)
+    fits[fits['well'] == 'A1'].plot('time_min', 'df')
+
+    Arguments
+    --
+    df: a tidy dataframe with one row per measurement
+    well: name of the column identifying each growth curve
+    time: name of the column of time points
+    od: name of the column of measurements
+    nojobs: number of wells fit concurrently in a process pool (default is 1)
+    records: if True, also return a dataframe of the fitrecord of each well, such as the negative log marginal likelihood, the number of iterations, and the time taken
+    kwargs: any other arguments are passed to fitderiv, including a hyperparametercache as hpcache to warm start the fit of each well
+    '''
+    import pandas as pd
+    kwargs= mergedicts(original= {'figs': False, 'quiet': True}, update= kwargs)
+    wide= df.pivot(index= time, columns= well, values= od).sort_index()
+    t= wide.index.to_numpy(dtype= float)
+    wells= wide.columns.to_list()
+    data= wide.to_numpy(dtype= float)
+    if nojobs == 1:
+        results= [_fitwell(t, data[:,i], kwargs) for i in range(len(wells))]
+    else:
+        from concurrent import futures
+        with futures.ProcessPoolExecutor(max_workers= nojobs) as executor:
+            runs= [executor.submit(_fitwell, t, data[:,i], kwargs) for i in range(len(wells))]
+            results= [run.result() for run in runs]
+        if kwargs.get('hpcache'):
+            # each process updated its own copy of the cache
+            for res in results:
+                kwargs['hpcache'].update(kwargs.get('cvfn', 'sqexp'), kwargs.get('condition'),
+                                         kwargs.get('instrument'), res[2])
+    # assemble the fits into a tidy dataframe
+    fits= pd.DataFrame({well: np.repeat(wells, len(t)), time: np.tile(t, len(wells))})
+    for name in ['f', 'fvar', 'df', 'dfvar', 'ddf', 'ddfvar']:
+        fits[name]= np.concatenate([res[0][name] for res in results])
+    stats= pd.DataFrame([res[1] for res in results])
+    if not stats.empty:
+        stats[well]= wells
+        fits= fits.merge(stats, on= well, how= 'left')
+    if records:
+        recs= pd.DataFrame([{k: v for k, v in res[3].items() if k not in ['lth', 'runs']} for res in results])
+        recs.insert(0, well, wells)
+        return fits, recs
+    return fits
+
+
+
+def _diauxicstats(t, fs, gs, minprominence= 0.3, minheight= 0.1, minsep= None):
+    '''
+    Returns, for each sample, the two maxima of the time derivative and their times (in order of time), the shift time where the time derivative is smallest between them, and the diauxic lag, with NaN for samples without a second maximum.
+
+    One maximum is the largest time derivative. The other is the most prominent local maximum at least minsep from it, where the prominence is the depth of the trough between the two maxima below the lower one. To ignore fluctuations within a single growth phase or after growth has stopped, the trough must be at least minprominence times the lower maximum, which itself must be at least minheight times the largest time derivative.
+
+    Arguments
+    --
+    t: array of time points
+    fs: samples of the fit (one column for each sample)
+    gs: the corresponding samples of the time derivative
+    minprominence: the smallest depth of the trough between the two maxima relative to the lower maximum
+    minheight: the smallest second maximum relative to the largest time derivative
+    minsep: the smallest time between the two maxima (if None, a tenth of the duration of the data)
+    '''
+    n, cols= len(t), np.arange(gs.shape[1])
+    rows= np.arange(n)[:,None]
+    if minsep is None: minsep= (t[-1] - t[0])/10
+    im= np.argmax(gs, 0)
+    # the smallest time derivative between each time point and the largest time derivative
+    after= np.minimum.accumulate(np.where(rows >= im, gs, np.inf), axis= 0)
+    before= np.minimum.accumulate(np.where(rows <= im, gs, np.inf)[::-1], axis= 0)[::-1]
+    trough= np.where(rows > im, after, before)
+    # prominent local maxima sufficiently far from the largest time derivative
+    prominence= gs - trough
+    ismax= np.zeros(gs.shape, dtype= bool)
+    ismax[1:-1]= (gs[1:-1] > gs[:-2]) & (gs[1:-1] >= gs[2:])
+    ismax &= (gs >= minheight*gs[im, cols]) & (prominence >= minprominence*gs) & (np.abs(t[:,None] - t[im]) >= minsep)
+    score= np.where(ismax, prominence, -np.inf)
+    isecond= np.argmax(score, 0)
+    valid= np.isfinite(score[isecond, cols])
+    i1, i2= np.minimum(im, isecond), np.maximum(im, isecond)
+    # the slowest growth between the two maxima
+    ishift= np.argmin(np.where((rows > i1) & (rows < i2), gs, np.inf), axis= 0)
+    g1, g2= gs[i1, cols], gs[i2, cols]
+    t1, t2, tshift= t[i1], t[i2], t[ishift]
+    diauxiclag= t2 + (fs[ishift, cols] - fs[i2, cols])/g2 - tshift
+    return [np.where(valid, st, np.nan) for st in [g1, t1, g2, t2, tshift, diauxiclag]]
+
+
+def _fitwell(t, d, kwargs):
+    '''
+    Fits a single well for fitplate, returning a dictionary of the fit, a dictionary of its statistics, the best-fit log hyperparameters, and the record of the fit.
+
+    Arguments
+    --
+    t: array of time points
+    d: array of data
+    kwargs: arguments passed to fitderiv
+    '''
+    q= fitderiv(t, d, **kwargs)
+    fit= {name: getattr(q, name) for name in ['f', 'fvar', 'df', 'dfvar', 'ddf', 'ddfvar']}
+    return fit, getattr(q, 'ds', {}), q.lth, q.fitrecord
+
+
+#####
+
+
+class hyperparametercache:
+    '''
+    Stores the best-fit (log) hyperparameters of previous fits, keyed by kernel, condition (or strain), and instrument, to seed subsequent fits.
+
+    For each key, the cache keeps the mean of the log hyperparameters of all fits added so far. Replicates and wells of the same experiment have similar hyperparameters, and starting from these values typically needs only a few iterations of the optimizer.
+
+    A typical work flow is:
+
+    from fitderiv import fitderiv, hyperparametercache
+    cache= hyperparametercache('hyperparameters.json')
+    for well in wells:
+        q= fitderiv(t, od[well], hpcache= cache, condition= 'glucose', instrument= 'plate reader 1')
+    cache.save()
+
+    Re-running the script then reloads the cache from the file.
+    '''
+
+    def __init__(self, fname= False):
+        '''
+        Creates a cache, loading any hyperparameters previously saved.
+
+        Arguments
+        --
+        fname: if specified, the JSON file that stores the cache on disk
+        '''
+        import os
+        self.fname= fname
+        self.entries= {}
+        if fname and os.path.isfile(fname):
+            self.load(fname)
+
+
+    def get(self, kernel, condition= None, instrument= None):
+        '''
+        Returns the cached log hyperparameters or None if there are none.
+
+        Arguments
+        --
+        kernel: the name of the covariance function, such as 'sqexp'
+        condition: the condition or strain
+        instrument: the instrument
+        '''
+        entry= self.entries.get((kernel, condition, instrument))
+        return None if entry is None else entry[0].copy()
+
+
+    def update(self, kernel, condition, instrument, lth):
+        '''
+        Adds the best-fit log hyperparameters of a fit to the cache.
+
+        Arguments
+        --
+        kernel: the name of the covariance function, such as 'sqexp'
+        condition: the condition or strain
+        instrument: the instrument
+        lth: the best-fit log hyperparameters
+        '''
+        key= (kernel, condition, instrument)
+        lth= np.asarray(lth, dtype= float)
+        if key in self.entries and len(self.entries[key][0]) == len(lth):
+            mlth, nofits= self.entries[key]
+            self.entries[key]= (mlth + (lth - mlth)/(nofits + 1), nofits + 1)
+        else:
+            self.entries[key]= (lth.copy(), 1)
+
+
+    def save(self, fname= False):
+        '''
+        Saves the cache as a JSON file.
+
+        Arguments
+        --
+        fname: name of the file (default is the file given when creating the cache)
+        '''
+        import json
+        fname= fname or self.fname
+        if not fname:
+            raise ValueError('No file name given for saving the hyperparameter cache.')
+        records= [{'kernel': k[0], 'condition': k[1], 'instrument': k[2], 'lth': list(v[0]), 'nofits': v[1]}
+                  for k, v in self.entries.items()]
+        with open(fname, 'w') as f:
+            json.dump(records, f, indent= 1)
+
+
+    def load(self, fname):
+        '''
+        Loads hyperparameters from a JSON file, adding them to the cache.
+
+        Arguments
+        --
+        fname: name of the file
+        '''
+        import json
+        with open(fname) as f:
+            records= json.load(f)
+        for r in records:
+            self.entries[(r['kernel'], r['condition'], r['instrument'])]= (np.array(r['lth'], dtype= float),
+                                                                           r['nofits'])
 
 
 #####
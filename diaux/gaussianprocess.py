@@ -7,6 +7,16 @@
 
     Covariance functions can either be linear, squared exponential, neural network-like, or squared exponential with a linear trend. Bounds for hyperparameters are specified in log10 space. Hyperparameters are given in log space.
 
+    For long time series, maternssGP solves the Matern covariance function as a state-space model with a Kalman filter so that the cost grows linearly with the number of data points.
+
+    Any covariance function can instead be used with a sparse approximation based on inducing points (Titsias, 2009), for example gp.sqexpGP(b, x, y, inducing= 100), whose cost grows with N*M^2 for N data points and M inducing points.
+
+    Several outputs sampled at the same abscissa values, such as replicates or wells of the same condition, can be fit together by giving y as a 2-d array with one column for each output. The outputs are independent but share hyperparameters so that the likelihood needs only one factorization of the N x N kernel matrix, applied to all columns at once.
+
+    For data that arrive over time, such as from a running plate reader, g.append(xnew, ynew) adds points by extending the Cholesky factor of the kernel matrix, with the hyperparameters optionally re-optimized every refitevery points.
+
+    When data are sampled on a uniform grid with equal measurement errors, the kernel matrix of a stationary covariance function (squared exponential or Matern) is Toeplitz and is solved using the Levinson-Durbin recursion, whose cost grows with N^2, rather than a Cholesky decomposition. The recursion is only used for at least 300 points, below which the Cholesky decomposition is faster, and the Cholesky decomposition is used instead whenever the measurement noise is too small relative to the prior variance for the recursion to be accurate.
+
     A typical workflow is:
 
     g= gp.maternGP({0: (-4, 4), 1: (-4, 4), 2: (-4, -2)}, x, y)
@@ -24,16 +34,29 @@
 
     will plot three samples of the prior latent functions with hyperparameters 1.0, 0.1, 3.1, and 1.3. There is no need to specify the hyperparameter for measurement error: it is not used to generate prior functions.
 
+    Progress and warnings, and the output of g.results() and g.info(), are reported with the logging module (logger 'diaux.gaussianprocess'), so use, for example, logging.basicConfig(level= logging.INFO) to display them. After fitting, g.fitrecord holds a summary of the optimization - the negative log marginal likelihood, the number of iterations and function evaluations, any hyperparameters at a bound, and the time taken - which is also attached to a logged record as record.fitrecord.
+
     N.B. small (close to zero) values of the estimated measurement error can lead to instabilities in finding the hyperparameters.
 """
 
+import logging
+import time
 import numpy as np
 from scipy import linalg
 import matplotlib.pyplot as plt
 
+logger= logging.getLogger(__name__)
+
 
 class gaussianprocess:
-    def __init__(self, lthbounds, x, y, merrors= False):
+    # True if the covariance function depends only on the distance between abscissa
+    stationary= False
+    # the minimum number of data points for which Toeplitz solvers are used, below which the Cholesky decomposition is faster
+    toeplitzmin= 300
+    # the smallest ratio of the measurement noise to the prior variance for which Toeplitz solvers are used, below which the Levinson-Durbin recursion loses accuracy
+    toeplitzrcond= 1e-6
+
+    def __init__(self, lthbounds, x, y, merrors= False, inducing= False, toeplitz= True):
         '''
         Creates a Gaussian process.
 
@@ -42,12 +65,25 @@ class gaussianprocess:
         lthbounds: a dictionary of pairs of the bounds on the hyperparameters in log10 space,
         such as {0: [0,6], 1: [-3,4], 2: [-6,-4]}
         x: a 1-d array of the abscissa data
-        y: a multi-dimensional array of the ordinate data
+        y: a 1-d array of the ordinate data or a 2-d array with one column for each of several outputs, which are independent but share hyperparameters
         merrors: if specified, a 1-d array of the measurement errors (as variances)
+        inducing: if specified, either the number of inducing points, placed evenly across x, or a 1-d array of their positions, and a sparse (variational) approximation of the Gaussian process is used whose cost grows with N*M^2 rather than N^3
+        toeplitz: if True (default), use fast Toeplitz solvers, whose cost grows with N^2 rather than N^3, when the covariance function is stationary, x is a uniform grid of at least toeplitzmin (300) points, and the kernel matrix is well conditioned; otherwise the Cholesky decomposition is used
         v'''
         self.b= [lthbounds[a] for a in lthbounds.keys()]
         self.x, self.y, self.xnew= x, y, x
         self.merrors= merrors
+        if np.size(inducing) > 1:
+            self.xu= np.asarray(inducing, dtype= float)
+        elif inducing:
+            self.xu= np.linspace(np.min(x), np.max(x), int(inducing))
+        else:
+            self.xu= None
+        self.toeplitz= toeplitz
+        if np.ndim(y) > 1 and self.xu is not None:
+            raise gaussianprocessException('Inducing points can only be used with 1-d data.')
+        # most recent factorization of the kernel matrix, shared by nlml and jacnlml
+        self._factor= None
 
 
     def covfn(self):
@@ -61,6 +97,51 @@ class gaussianprocess:
         raise NotImplementedError(' No second derivative of the covariance function specified in class %s' % self.__class__.__name__)
 
 
+    def covmatrix(self, x, xp, lth):
+        """
+        Returns the kernel matrix K(x, xp) and its Jacobian with respect to the log hyperparameters (an array of shape len(x) x len(xp) x noparams). All pairs of abscissa are evaluated at once by broadcasting the covariance function.
+
+        Arguments
+        --
+        x: a 1-d array of abscissa
+        xp: a 1-d array of alternative abscissa
+        lth: the log of the hyperparameters
+        """
+        x, xp= np.asarray(x, dtype= float), np.asarray(xp, dtype= float)
+        k, jk= self.covfn(x[:,np.newaxis], xp[np.newaxis,:], lth)
+        shape= (len(x), len(xp))
+        return _expand(k, shape), _expand(jk, shape + (self.noparams,))
+
+
+    def dcovmatrix(self, fn, x, xp, lth):
+        """
+        Returns the matrix of a derivative of the covariance function, such as 'd1covfn', for all pairs of x and xp.
+
+        Arguments
+        --
+        fn: name of the covariance function or one of its derivatives
+        x: a 1-d array of abscissa
+        xp: a 1-d array of alternative abscissa
+        lth: the log of the hyperparameters
+        """
+        x, xp= np.asarray(x, dtype= float), np.asarray(xp, dtype= float)
+        return _expand(getattr(self, fn)(x[:,np.newaxis], xp[np.newaxis,:], lth)[0], (len(x), len(xp)))
+
+
+    def dcovdiag(self, fn, x, lth):
+        """
+        Returns the diagonal of the matrix of the covariance function, or one of its derivatives, for x with itself.
+
+        Arguments
+        --
+        fn: name of the covariance function or one of its derivatives
+        x: a 1-d array of abscissa
+        lth: the log of the hyperparameters
+        """
+        x= np.asarray(x, dtype= float)
+        return _expand(getattr(self, fn)(x, x, lth)[0], (len(x),))
+
+
     def kernelmatrix(self, lth, x):
         """
         Returns kernel matrix K(X,X) supplemented with measurement noise and its Cholesky decomposition.
@@ -71,9 +152,7 @@ class gaussianprocess:
         x: abscissa values
         merrors: if specified, rescales the fitted measurement error
         """
-        k= np.empty((len(x), len(x)))
-        for i in range(len(x)):
-            k[i,:]= self.covfn(x[i], x, lth)[0]
+        k= self.covmatrix(x, x, lth)[0]
         if np.any(self.merrors):
             kn= k + np.exp(lth[-1])*np.diag(self.merrors)
         else:
@@ -82,6 +161,37 @@ class gaussianprocess:
         return k, L
 
 
+    def factorize(self, lth, jac= False):
+        """
+        Returns the kernel matrix, its Jacobian with respect to the log hyperparameters (None unless jac is True), the Cholesky decomposition of the kernel matrix supplemented with measurement noise, and K^-1 y.
+
+        The most recent factorization is cached so that evaluating nlml and jacnlml at the same hyperparameters factorizes the kernel matrix only once. The Jacobian, an N x N x noparams array, is only calculated and cached when needed for the gradient, and not, for example, for predictions.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        jac: if True, the Jacobian of the kernel matrix is also returned
+        """
+        key= ('dense', np.asarray(lth, dtype= float).tobytes())
+        if self._factor is None or self._factor[0] != key:
+            x, y= self.x, self.y
+            if jac:
+                k, jk= self.covmatrix(x, x, lth)
+            else:
+                k, jk= self.dcovmatrix('covfn', x, x, lth), None
+            if np.any(self.merrors):
+                kn= k + np.exp(lth[-1])*np.diag(self.merrors)
+            else:
+                kn= k + np.exp(lth[-1])*np.identity(len(x))
+            L= linalg.cho_factor(kn)
+            al= linalg.cho_solve(L, y)
+            self._factor= (key, k, jk, L, al)
+        elif jac and self._factor[2] is None:
+            key, k, jk, L, al= self._factor
+            self._factor= (key, k, self.covmatrix(self.x, self.x, lth)[1], L, al)
+        return self._factor[1:]
+
+
     def nlml(self, lth):
         """
         Returns negative of log marginal likelihood.
@@ -90,11 +200,15 @@ class gaussianprocess:
         --
         lth: log of the hyperparameters
         """
-        x, y= self.x, self.y
-        k, L= self.kernelmatrix(lth, x)
-        al= linalg.cho_solve(L, y)
+        if self.xu is not None:
+            return self.sparsefactorize(lth)[0]
+        elif self.usetoeplitz(lth):
+            return self.toeplitzfactorize(lth)[0]
+        y= self.y
+        k, jk, L, al= self.factorize(lth)
         halfdetK= np.sum(np.log(np.diagonal(L[0])))
-        return 0.5*np.dot(y, al) + halfdetK + 0.5*len(y)*np.log(2*np.pi)
+        # each output contributes a determinant
+        return 0.5*np.sum(y*al) + _nooutputs(y)*halfdetK + 0.5*np.size(y)*np.log(2*np.pi)
 
 
     def jacnlml(self, lth):
@@ -105,25 +219,186 @@ class gaussianprocess:
         --
         lth: log of the hyperparameters
         """
-        x, y= self.x, self.y
-        k, L= self.kernelmatrix(lth, x)
-        # find derivatives of kernel matrix wrt hyperparameters
-        kjac= np.empty((len(x), len(x), len(lth)))
-        for i in range(len(x)):
-            kjac[i, :, :-1]= self.covfn(x[i], x, lth)[1]
+        if self.xu is not None:
+            return self.sparsefactorize(lth)[1].copy()
+        elif self.usetoeplitz(lth):
+            return self.toeplitzfactorize(lth)[1].copy()
+        x= self.x
+        k, jk, L, al= self.factorize(lth, jac= True)
+        # trace(dot(W, dK)) for each hyperparameter is the sum of the elementwise product of W and dK,
+        # needing every element of K^-1, which is found from the Cholesky factor rather than by solving for the identity
+        al= np.reshape(al, (len(x), -1))
+        W= np.dot(al, al.T) - _nooutputs(self.y)*_choinverse(L)
+        jac= np.empty(len(lth))
+        jac[:-1]= -0.5*np.einsum('ij,ijk->k', W, jk)
+        # derivative of the kernel matrix wrt the measurement error is diagonal
         if np.any(self.merrors):
-            kjac[:, :, -1]= np.diag(self.merrors)*np.exp(lth[-1])
+            jac[-1]= -0.5*np.exp(lth[-1])*np.dot(np.diagonal(W), self.merrors)
         else:
-            kjac[:, :, -1]= np.identity(len(x))*np.exp(lth[-1])
-        # calculate jacobian
-        al= linalg.cho_solve(L, y)
-        alal= np.outer(al, al)
-        Kinv= linalg.cho_solve(L, np.identity(len(x)))
-        return np.asarray([-0.5*np.trace(np.dot(alal - Kinv, kjac[:,:,i])) for i in range(len(lth))])
+            jac[-1]= -0.5*np.exp(lth[-1])*np.trace(W)
+        return jac
+
+
+    def nlmljac(self, lth):
+        """
+        Returns the negative of the log marginal likelihood and its Jacobian with respect to the log hyperparameters, sharing one factorization of the kernel matrix.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        """
+        # the Jacobian first, so that the kernel matrix and its Jacobian are found together
+        jac= self.jacnlml(lth)
+        return self.nlml(lth), jac
+
+
+    def istoeplitz(self):
+        """
+        Returns True if the kernel matrix is a symmetric Toeplitz matrix for which fast Toeplitz solvers may be used: the covariance function is stationary, x is a single uniform grid of at least toeplitzmin points, and the measurement errors are the same at all points.
+        """
+        if not (self.stationary and self.toeplitz) or self.xu is not None:
+            return False
+        x= np.asarray(self.x, dtype= float)
+        if len(x) < max(3, self.toeplitzmin):
+            return False
+        dx= np.diff(x)
+        if dx[0] <= 0 or not np.allclose(dx, dx[0], rtol= 1e-8, atol= 0):
+            return False
+        if np.any(self.merrors) and not np.allclose(self.merrors, self.merrors[0]):
+            return False
+        return True
+
+
+    def usetoeplitz(self, lth):
+        """
+        Returns True if the Toeplitz solvers are used for the hyperparameters lth: the kernel matrix is Toeplitz and the Levinson-Durbin recursion succeeds. Otherwise the kernel matrix is factorized by a Cholesky decomposition.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        """
+        if not self.istoeplitz():
+            return False
+        try:
+            self.toeplitzfactorize(lth)
+            return True
+        except np.linalg.LinAlgError:
+            return False
+
+
+    def toeplitzfactorize(self, lth):
+        """
+        Returns the negative log marginal likelihood and its Jacobian with respect to the log hyperparameters for a Toeplitz kernel matrix, together with the first column of the inverse of the kernel matrix and K^-1 y.
+
+        The Levinson-Durbin recursion gives the determinant and the first column of the inverse, from which the Gohberg-Semencul formula gives products with the inverse and its diagonal sums using fast Fourier transforms. The most recent result is cached. A LinAlgError is raised if the measurement noise is smaller than toeplitzrcond times the prior variance or if the recursion finds the matrix not to be positive definite.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        """
+        key= ('toeplitz', np.asarray(lth, dtype= float).tobytes())
+        if self._factor is None or self._factor[0] != key:
+            x, y= np.asarray(self.x, dtype= float), self.y
+            n= len(x)
+            # first column of the kernel matrix and of its derivatives
+            t, dt= self.covfn(x[0], x, lth)
+            t, dt= _expand(t, (n,)), _expand(dt, (n, self.noparams))
+            noise= np.exp(lth[-1])*(self.merrors[0] if np.any(self.merrors) else 1)
+            if noise < self.toeplitzrcond*t[0]:
+                raise np.linalg.LinAlgError('Toeplitz matrix is too ill-conditioned for the Levinson-Durbin recursion')
+            t= t.copy()
+            t[0] += noise
+            logdet, ga= _durbin(t)
+            al= _toeplitzsolve(ga, y)
+            noout= _nooutputs(y)
+            nlml= 0.5*np.sum(y*al) + 0.5*noout*logdet + 0.5*np.size(y)*np.log(2*np.pi)
+            # the derivatives of the kernel matrix are Toeplitz: weight each diagonal by its multiplicity
+            wts= 2*np.ones(n)
+            wts[0]= 1
+            a= np.reshape(al, (n, -1))
+            alal= wts*np.sum(_correlate(a, a), 1)
+            u= np.concatenate(([0], ga[::-1][:-1]))
+            kinv= noout*wts*(_diagsums(ga) - _diagsums(u))/ga[0]
+            jac= np.empty(len(lth))
+            jac[:-1]= -0.5*np.dot(alal - kinv, dt)
+            jac[-1]= -0.5*noise*(alal[0] - kinv[0])
+            self._factor= (key, nlml, jac, ga, al)
+        return self._factor[1:]
+
+
+    def solvekernel(self, lth, b):
+        """
+        Returns K^-1 b, where K is the kernel matrix supplemented with measurement noise.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        b: a 1-d or 2-d array
+        """
+        if self.usetoeplitz(lth):
+            return _toeplitzsolve(self.toeplitzfactorize(lth)[2], b)
+        else:
+            return linalg.cho_solve(self.factorize(lth)[2], b)
+
+
+    def sparsefactorize(self, lth):
+        """
+        Returns the variational bound on the negative log marginal likelihood of the sparse Gaussian process (Titsias, 2009), its Jacobian with respect to the log hyperparameters, and the Cholesky decompositions needed for predictions.
+
+        Only the M x M kernel matrix of the inducing points and the M x N kernel matrix between the inducing points and the data are formed. The most recent result is cached.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        """
+        key= ('sparse', np.asarray(lth, dtype= float).tobytes())
+        if self._factor is None or self._factor[0] != key:
+            x, y, xu= self.x, self.y, self.xu
+            n, m= len(x), len(xu)
+            # variances of the measurement errors
+            if np.any(self.merrors):
+                d= np.exp(lth[-1])*np.asarray(self.merrors)
+            else:
+                d= np.exp(lth[-1])*np.ones(n)
+            Kuu, dKuu= self.covmatrix(xu, xu, lth)
+            Kuf, dKuf= self.covmatrix(xu, x, lth)
+            kd, dkd= self.covfn(np.asarray(x, dtype= float), np.asarray(x, dtype= float), lth)
+            kd, dkd= _expand(kd, (n,)), _expand(dkd, (n, self.noparams))
+            # add a small jitter, proportional to the prior variance, for numerical stability
+            jitter= 1e-8
+            Kuu= Kuu + jitter*np.mean(np.diag(Kuu))*np.identity(m)
+            dKuu= dKuu + jitter*np.mean(np.diagonal(dKuu), -1)*np.identity(m)[:,:,None]
+            Luu= linalg.cholesky(Kuu, lower= True)
+            A= linalg.solve_triangular(Luu, Kuf, lower= True)
+            Ad= A/d
+            B= np.identity(m) + np.dot(Ad, A.T)
+            LB= linalg.cholesky(B, lower= True)
+            c= linalg.solve_triangular(LB, np.dot(Ad, y), lower= True)
+            q= np.sum(A**2, 0)
+            nlml= 0.5*(n*np.log(2*np.pi) + np.sum(np.log(d)) + 2*np.sum(np.log(np.diag(LB)))
+                       + np.dot(y, y/d) - np.dot(c, c) + np.sum((kd - q)/d))
+            # gradients with respect to the kernel matrices and the measurement errors
+            LBiAd= linalg.solve_triangular(LB, Ad, lower= True)
+            BiAd= linalg.solve_triangular(LB.T, LBiAd, lower= False)
+            al= y/d - np.dot(Ad.T, linalg.solve_triangular(LB.T, c, lower= False))
+            a= np.dot(A, al)
+            Bi= linalg.cho_solve((LB, True), np.identity(m))
+            gKuf= linalg.solve_triangular(Luu.T, BiAd - np.outer(a, al) - Ad, lower= False)
+            gKuu= -0.5*(np.identity(m) - Bi - np.outer(a, a)) + 0.5*(B - np.identity(m))
+            gKuu= linalg.solve_triangular(Luu.T, linalg.solve_triangular(Luu.T, gKuu.T, lower= False).T,
+                                          lower= False)
+            gd= 0.5*(1/d - np.sum(LBiAd**2, 0) - al**2) - 0.5*(kd - q)/d**2
+            jac= np.empty(len(lth))
+            jac[:-1]= (np.einsum('ij,ijk->k', gKuf, dKuf) + np.einsum('ij,ijk->k', gKuu, dKuu)
+                       + np.dot(0.5/d, dkd))
+            jac[-1]= np.dot(gd, d)
+            self._factor= (key, nlml, jac, Luu, LB, c)
+        return self._factor[1:]
 
 
     def findhyperparameters(self, noruns= 1, exitearly= False, stvals= False, optmethod= 'l_bfgs_b',
-                            optmessages= False, quiet= True, linalgmax= 3):
+                            optmessages= False, quiet= True, linalgmax= 3, nojobs= 1, pool= 'process',
+                            seed= None):
         """
         Finds the best fit hyperparameters (.lth_opt) and the optimum value of negative log marginal likelihood (.nlml_opt).
 
@@ -134,49 +409,67 @@ class gaussianprocess:
         stvals: an (optional) initial guess for the log hyperparameters
         optmethod: the optimization routine to be used, either 'l_bfgs_b' (default) or 'tnc'
         optmessages: if True, display messages from the optimization routine
-        quiet: if True, print warning that if an optimum hyperparameter is at a bound
+        quiet: if False, log a warning if an optimum hyperparameter is at a bound
         linalgmax: number of attempts (default is 3) if a linear algebra (numerical) error is generated
+        nojobs: number of runs performed concurrently (default is 1); if greater than 1 and exitearly is True, the first run to succeed is kept and the runs that have not started are cancelled, but those already started finish in the background
+        pool: the pool used for concurrent runs - 'process' (default) or 'thread' to create a pool of nojobs workers for this call, or an existing concurrent.futures executor, which is used but not shut down; starting a process pool takes much longer than a typical run, so pass an executor when fitting repeatedly, such as for many wells
+        seed: if specified, each run draws its initial values from its own generator seeded deterministically from seed
         """
+        starttime= time.perf_counter()
         b= self.b
         self.hparamerr= []
-        lmlml= np.empty(noruns)
-        lthf= np.empty((noruns, len(b)))
-        success= np.empty(noruns)
+        runinfo= [None]*noruns
+        lmlml= np.full(noruns, np.nan)
+        lthf= np.full((noruns, len(b)), np.nan)
+        success= np.zeros(noruns)
         # convert b into exponential base
         b= np.array(b)*np.log(10)
+        # random number generators for the initial values of each run
+        if seed is None and nojobs == 1:
+            rngs= [np.random]*noruns
+        else:
+            rngs= [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(noruns)]
         # run optimization
-        for i in range(noruns):
-            linalgerror= 0
-            while linalgerror < linalgmax:
-                try:
-                    if np.any(stvals):
-                        # initial values given for hyperparameters
-                        lth= stvals
-                    else:
-                        # choose random initial values for hyperparameters
-                        lth= [np.random.uniform(b[j][0], b[j][1]) for j in range(len(b))]
-                    # run Gaussian process
-                    if optmethod == 'tnc':
-                        from scipy.optimize import fmin_tnc
-                        lthf[i,:], nf, success[i]= fmin_tnc(self.nlml, lth, fprime= self.jacnlml,
-                                                          bounds= b, maxfun= 1000, messages= optmessages)
-                        linalgerror= linalgmax
-                        lmlml[i]= self.nlml(lthf[i,:])
-                    elif optmethod == 'l_bfgs_b':
-                        from scipy.optimize import fmin_l_bfgs_b
-                        lthf[i,:], lmlml[i], dout= fmin_l_bfgs_b(self.nlml, lth, fprime= self.jacnlml,
-                                                                bounds= b, disp= optmessages)
-                        linalgerror= linalgmax
-                        success[i]= dout['warnflag'] + 1
-                    else:
-                        print(optmethod + ' unrecognized.')
-                except np.linalg.LinAlgError:
-                    print(' Warning: linear algebra error - trying a different initial condition')
-                    linalgerror += 1
-            if success[i] != 1 or np.any(np.isnan(lthf)):
-                print(' Warning: optimization failed at run ' + str(i+1))
+        if nojobs == 1:
+            for i in range(noruns):
+                lthf[i,:], lmlml[i], success[i], runinfo[i]= _optimizerun(self, b, stvals, optmethod,
+                                                                          optmessages, linalgmax, rngs[i])
+                if success[i] != 1 or np.any(np.isnan(lthf[i,:])):
+                    logger.warning('Optimization failed at run %d', i+1)
+                else:
+                    if exitearly: break
+        else:
+            import copy
+            from concurrent import futures
+            if isinstance(pool, futures.Executor):
+                executor= pool
+            elif pool == 'thread':
+                executor= futures.ThreadPoolExecutor(max_workers= nojobs)
             else:
-                if exitearly: break
+                executor= futures.ProcessPoolExecutor(max_workers= nojobs)
+            runs= {}
+            try:
+                # each run works on its own copy so that cached factorizations are not shared
+                gpcopy= copy.copy(self)
+                gpcopy._factor= None
+                runs= {executor.submit(_optimizerun, copy.copy(gpcopy), b, stvals, optmethod, optmessages,
+                                       linalgmax, rngs[i]): i for i in range(noruns)}
+                for run in futures.as_completed(runs):
+                    i= runs[run]
+                    lthf[i,:], lmlml[i], success[i], runinfo[i]= run.result()
+                    if success[i] != 1 or np.any(np.isnan(lthf[i,:])):
+                        logger.warning('Optimization failed at run %d', i+1)
+                    elif exitearly:
+                        break
+            finally:
+                if executor is pool:
+                    for run in runs:
+                        run.cancel()
+                else:
+                    executor.shutdown(wait= False, cancel_futures= True)
+        # summarize the runs that were made
+        runs= [dict(info, run= i+1, nlml= lmlml[i], success= bool(success[i] == 1))
+               for i, info in enumerate(runinfo) if info is not None]
         # only process runs that did not converge
         if np.any(success == 1):
             lmlml= lmlml[success == 1]
@@ -184,57 +477,131 @@ class gaussianprocess:
             # find best choice
             lthb= lthf[lmlml.argmin()]
             self.nlml_opt= lmlml.min()
-            # print warning
+            # warn of hyperparameters at a bound
             for i in range(len(b)):
                 if (lthb[i] == b[i][1] or lthb[i] == b[i][0]):
                     if not quiet:
-                        print( ' Warning: hparam[' + str(i) + '] is at a boundary')
-                        print('\thparam[' + str(i) + ']= {:e}'.format(np.exp(lthb[i]))
-                          + ' [{:e}'.format(np.exp(b[i][0])) + ', {:e}]'.format(np.exp(b[i][1])))
+                        logger.warning('hparam[%d]= %e is at a boundary [%e, %e]', i, np.exp(lthb[i]),
+                                       np.exp(b[i][0]), np.exp(b[i][1]))
                     if lthb[i] == b[i][1]:
                         self.hparamerr.append([i, 'u'])
                     else:
                         self.hparamerr.append([i, 'l'])
             self.lth_opt= lthb
+            self._noappended= 0
+            self.fitrecord= {'nlml': self.nlml_opt, 'lth': lthb, 'noruns': len(runs),
+                             'nosuccessful': int(np.sum(success == 1)),
+                             'iterations': int(np.nansum([r['iterations'] for r in runs])),
+                             'funcalls': int(np.sum([r['funcalls'] for r in runs])),
+                             'boundaries': [tuple(el) for el in self.hparamerr],
+                             'time': time.perf_counter() - starttime, 'runs': runs}
+            logger.info('Fitted hyperparameters of %s: nlml= %e after %d function evaluations in %.3g s',
+                        self.__class__.__name__, self.nlml_opt, self.fitrecord['funcalls'],
+                        self.fitrecord['time'], extra= {'fitrecord': self.fitrecord})
         else:
             raise gaussianprocessException('Optimization of hyperparameters failed')
 
 
+    def append(self, xnew, ynew, merrorsnew= False, refitevery= False, **kwargs):
+        """
+        Appends new data points, such as the latest measurements of a running experiment, without refactorizing the kernel matrix.
+
+        If the kernel matrix for the best-fit hyperparameters has been factorized, its Cholesky factor is extended by the new rows so that each new point costs O(N^2) rather than O(N^3), and the next prediction reuses the updated factor. Otherwise the cached factorization is discarded.
+
+        Arguments
+        --
+        xnew: a 1-d array of the new abscissa values
+        ynew: the new ordinate values, with one column for each output if y is 2-d
+        merrorsnew: the measurement errors of the new points (required if measurement errors were specified)
+        refitevery: if specified, the hyperparameters are re-optimized, starting from their current values, once this number of points have been appended since the last optimization
+        kwargs: passed to findhyperparameters when re-optimizing
+        """
+        xnew= np.atleast_1d(np.asarray(xnew, dtype= float))
+        ynew= np.reshape(np.asarray(ynew, dtype= float), (len(xnew),) + np.shape(self.y)[1:])
+        if np.any(self.merrors):
+            if not np.any(merrorsnew):
+                raise gaussianprocessException('Measurement errors are required for the new data points.')
+            merrorsnew= np.atleast_1d(np.asarray(merrorsnew, dtype= float))
+        xold= self.x
+        lth= getattr(self, 'lth_opt', None)
+        update= (lth is not None and self._factor is not None and self.xu is None
+                 and self._factor[0] == ('dense', np.asarray(lth, dtype= float).tobytes()))
+        self.x= np.concatenate((xold, xnew))
+        self.y= np.concatenate((self.y, ynew))
+        if np.any(self.merrors):
+            self.merrors= np.concatenate((self.merrors, merrorsnew))
+        if update and not self.istoeplitz():
+            # extend the kernel matrix, its Jacobian, and its Cholesky factor by the new rows
+            key, k, jk, L, al= self._factor
+            k12, jk12= self.covmatrix(xold, xnew, lth)
+            k22, jk22= self.covmatrix(xnew, xnew, lth)
+            n= len(self.x)
+            k= np.block([[k, k12], [k12.T, k22]])
+            if jk is None:
+                jkn= None
+            else:
+                jkn= np.empty((n, n, jk.shape[2]))
+                jkn[:len(xold), :len(xold)], jkn[:len(xold), len(xold):]= jk, jk12
+                jkn[len(xold):, :len(xold)], jkn[len(xold):, len(xold):]= np.transpose(jk12, (1, 0, 2)), jk22
+            noise= np.exp(lth[-1])*(merrorsnew if np.any(self.merrors) else np.ones(len(xnew)))
+            L= _choappend(L, k12, k22 + np.diag(noise))
+            self._factor= (key, k, jkn, L, linalg.cho_solve(L, self.y))
+        else:
+            self._factor= None
+        self.xnew= self.x
+        self._covp, self._covpargs, self._samplefactor= None, None, None
+        self._noappended= getattr(self, '_noappended', 0) + len(xnew)
+        if refitevery and lth is not None and self._noappended >= refitevery:
+            kwargs= dict({'noruns': 1, 'stvals': lth}, **kwargs)
+            self.findhyperparameters(**kwargs)
+
+
 
 
     def results(self, warning= True):
         '''
-        Displays results from optimizing hyperparameters.
+        Logs results from optimizing hyperparameters at the INFO level.
 
         Arguments
         --
-        warning: if True, warn when a hyperparameter hits a boundary
+        warning: if True, log a warning when a hyperparameter hits a boundary
         '''
-        print('log(max likelihood)= %e' % (-self.nlml_opt))
+        logger.info('log(max likelihood)= %e', -self.nlml_opt)
         for j, pv in enumerate(np.exp(self.lth_opt)):
-            print('hparam[' + str(j) + ']= {:e}'.format(pv) + ' [{:e}'.format(10**(self.b[j][0]))
-                + ', {:e}]'.format(10**(self.b[j][1])))
+            logger.info('hparam[%d]= %e [%e, %e]', j, pv, 10**(self.b[j][0]), 10**(self.b[j][1]))
         if warning:
             for el in self.hparamerr:
                 if el[1] == 'l':
-                    print('Warning: hyperparameter ' + str(el[0]) + ' is at a lower bound')
+                    logger.warning('hyperparameter %d is at a lower bound', el[0])
                 else:
-                    print('Warning: hyperparameter ' + str(el[0]) + ' is at an upper bound')
+                    logger.warning('hyperparameter %d is at an upper bound', el[0])
 
 
 
-    def sample(self, size= 1):
+    def sample(self, size= 1, rng= None):
         '''
-        Generate samples from the Gaussian process as an array.
+        Generate samples from the Gaussian process as an array, with samples in columns, or, for several outputs, as a 3-d array indexed by the abscissa, the output, and the sample.
+
+        The covariance matrix of the prediction is factorized once, by a Cholesky decomposition with increasing jitter if necessary or otherwise by an eigendecomposition, and the factor is kept until the next prediction so that repeated sampling only needs a matrix multiplication. For a sparse Gaussian process, samples are drawn from the joint posterior of the variational approximation, so that the samples of the function and its derivatives are consistent.
 
         Arguments
         --
         size: number of samples
+        rng: if specified, a numpy Generator or a seed for one used to draw the samples
         '''
+        rng= _getrng(rng)
         try:
-            return np.transpose(np.random.multivariate_normal(self.mnp, self.covp, size))
+            if getattr(self, '_samplefactor', None) is None:
+                self._samplefactor= _covfactor(self.covp)
+            W= self._samplefactor
+            if np.ndim(self.mnp) > 1:
+                # independent samples for each output
+                noout= self.mnp.shape[1]
+                z= np.dot(W, rng.standard_normal((W.shape[1], noout*size)))
+                return self.mnp[:,:,None] + np.reshape(z, (len(self.mnp), noout, size))
+            return self.mnp[:,None] + np.dot(W, rng.standard_normal((W.shape[1], size)))
         except AttributeError:
-            print( ' Run gp.predict() first before sampling.')
+            logger.error('Run gp.predict() first before sampling.')
 
 
 
@@ -262,7 +629,7 @@ class gaussianprocess:
 
 
 
-    def predict(self, xnew, merrorsnew= False, derivs= 0, addnoise= False):
+    def predict(self, xnew, merrorsnew= False, derivs= 0, addnoise= False, full_cov= True, chunksize= None):
         """
         Determines the predicted mean latent function (.f) and its variance (.fvar) and potentially the predicted mean first derivative (.df) and its variance (.dfvar) and the predicted mean second derivative (.ddf) and its variance (.ddfvar) . Also .mnp is the predicted combined array of the mean latent function and its mean derivatives and .covp is the corresponding covariance matrix.
 
@@ -272,88 +639,174 @@ class gaussianprocess:
         merrorsnew: if specified, the expected measurements errors at xnew (need not be specified if xnew= x)
         derivs: if 0, only the latent function is inferred; if 1, the latent function and the first derivative are inferred; if 2, the latent function and the first and second derivatives are inferred
         addnoise: if True, add measuremnet noise to the predicted variance
+        full_cov: if False, only the variances are found, using memory that grows linearly with the length of xnew, and .covp is calculated only when first needed, such as by sample()
+        chunksize: if specified with full_cov= False, predictions are made for this number of abscissa values at a time so that the memory used grows with chunksize rather than the length of xnew
         """
         if len(self.x) == len(xnew) and (self.x == xnew).all():
             xold= True
         else:
             xold= False
         if np.any(self.merrors) and not np.any(merrorsnew) and not xold:
-            print('Length of xnew is different from x.')
-            raise gaussianprocessException('Measurement errors were used to find the hyperparameters and measurement errors are therefore required for any predictions.')
+            raise gaussianprocessException('Length of xnew is different from x: measurement errors were used to find the hyperparameters and measurement errors are therefore required for any predictions.')
         elif not hasattr(self, 'lth_opt'):
             raise gaussianprocessException(' Run gp.findhyperparameters() first before making predictions.')
         else:
             # set up
             self.xnew= xnew
             lth, x, y= self.lth_opt, self.x, self.y
+            self._covp, self._covpargs, self._samplefactor= None, None, None
+            if self.xu is not None:
+                self.mnp, varp= self.sparsepredict(xnew, derivs)
+                self._covpargs= (xnew, derivs)
+                self._storeprediction(self.mnp, varp, merrorsnew, xold, addnoise, derivs)
+                return
             # work with an array of length 3*N: the first N values being the function,
             # the second N values being the first derivative, and the last N values being the second derivative
-            Knewold= np.empty((len(xnew), len(x)))
-            Knewnew= np.empty((len(xnew), len(xnew)))
-            if derivs > 0:
-                d1Knewold= np.empty((len(xnew), len(x)))
-                d1Knewnew= np.empty((len(xnew), len(xnew)))
-                d1d2Knewnew= np.empty((len(xnew), len(xnew)))
-            if derivs > 1:
-                d12Knewold= np.empty((len(xnew), len(x)))
-                d12Knewnew= np.empty((len(xnew), len(xnew)))
-                d12d2Knewnew= np.empty((len(xnew), len(xnew)))
-                d12d22Knewnew= np.empty((len(xnew), len(xnew)))
-            for i in range(len(xnew)):
-                Knewold[i,:]= self.covfn(xnew[i], x, lth)[0]
-                Knewnew[i,:]= self.covfn(xnew[i], xnew, lth)[0]
-                if derivs > 0:
-                    d1Knewold[i,:]= self.d1covfn(xnew[i], x, lth)[0]
-                    d1Knewnew[i,:]= self.d1covfn(xnew[i], xnew, lth)[0]
-                    d1d2Knewnew[i,:]= self.d1d2covfn(xnew[i], xnew, lth)[0]
-                if derivs > 1:
-                    d12Knewold[i,:]= self.d12covfn(xnew[i], x, lth)[0]
-                    d12Knewnew[i,:]= self.d12covfn(xnew[i], xnew, lth)[0]
-                    d12d2Knewnew[i,:]= self.d12d2covfn(xnew[i], xnew, lth)[0]
-                    d12d22Knewnew[i,:]= self.d12d22covfn(xnew[i], xnew, lth)[0]
-            if derivs == 0:
-                kv= Knewold
-                km= Knewnew
-            elif derivs == 1:
-                kv= np.bmat([[Knewold], [d1Knewold]])
-                km= np.bmat([[Knewnew, np.transpose(d1Knewnew)],
-                             [d1Knewnew, d1d2Knewnew]])
-            elif derivs == 2:
-                kv= np.bmat([[Knewold], [d1Knewold], [d12Knewold]])
-                km= np.bmat([[Knewnew, np.transpose(d1Knewnew), np.transpose(d12Knewnew)],
-                              [d1Knewnew, d1d2Knewnew, np.transpose(d12d2Knewnew)],
-                              [d12Knewnew, d12d2Knewnew, d12d22Knewnew]])
-            # find mean prediction
-            k, L= self.kernelmatrix(lth, x)
-            m= np.dot(kv, linalg.cho_solve(L, y))
-            mnp= np.reshape(np.array(m), np.size(m))
-            self.mnp= mnp
-            # find variance of prediction
-            covp= km - np.dot(kv, linalg.cho_solve(L, np.transpose(kv)))
-            self.covp= covp
-            varp= np.diag(covp)
-            # for user
-            self.f= mnp[:len(xnew)]
-            self.fvar= varp[:len(xnew)]
-            fvar= varp[:len(xnew)]
-            if addnoise:
-                # add measurement error to the variance of the latent function
-                if np.any(self.merrors):
-                    if xold:
-                        self.fvar= fvar + np.exp(lth[-1])*np.diag(self.merrors)
+            fns= [('covfn', 'covfn'), ('d1covfn', 'd1d2covfn'), ('d12covfn', 'd12d22covfn')][:derivs+1]
+            toeplitz= self.usetoeplitz(lth)
+            if toeplitz:
+                al= self.toeplitzfactorize(lth)[3]
+            else:
+                k, jk, L, al= self.factorize(lth)
+            self._covpargs= (xnew, derivs)
+            if full_cov:
+                # find mean prediction
+                kv= np.concatenate([self.dcovmatrix(fn, xnew, x, lth) for fn, dfn in fns])
+                mnp= np.dot(kv, al)
+                self.mnp= mnp
+                # find variance of prediction
+                varp= np.diag(self.covp)
+            else:
+                chunksize= chunksize or len(xnew)
+                mnps, varps= [], []
+                for i in range(0, len(xnew), chunksize):
+                    xc= xnew[i:i+chunksize]
+                    kv= np.concatenate([self.dcovmatrix(fn, xc, x, lth) for fn, dfn in fns])
+                    kd= np.concatenate([self.dcovdiag(dfn, xc, lth) for fn, dfn in fns])
+                    if toeplitz:
+                        varc= kd - np.sum(kv*np.transpose(self.solvekernel(lth, np.transpose(kv))), 1)
                     else:
-                        self.fvar= fvar + merrorsnew
+                        V= linalg.solve_triangular(L[0], np.transpose(kv), lower= L[1], trans= 'N' if L[1] else 'T')
+                        varc= kd - np.sum(V**2, 0)
+                    # order by derivative and then abscissa
+                    mnps.append(np.reshape(np.dot(kv, al), (derivs+1, len(xc)) + np.shape(al)[1:]))
+                    varps.append(np.reshape(varc, (derivs+1, len(xc))))
+                mnp= np.reshape(np.concatenate(mnps, axis= 1), ((derivs+1)*len(xnew),) + np.shape(al)[1:])
+                varp= np.concatenate(varps, axis= 1).ravel()
+                self.mnp= mnp
+            self._storeprediction(mnp, varp, merrorsnew, xold, addnoise, derivs)
+
+
+    @property
+    def covp(self):
+        """
+        The covariance matrix of the latest prediction, which is calculated when first needed if predict was run with full_cov= False.
+        """
+        if getattr(self, '_covp', None) is None:
+            if getattr(self, '_covpargs', None) is None:
+                raise AttributeError('covp')
+            self._covp= self.predictcov(*self._covpargs)
+        return self._covp
+
+
+    def predictcov(self, xnew, derivs= 0):
+        """
+        Returns the covariance matrix of the predicted latent function and its derivatives.
+
+        Arguments
+        --
+        xnew: abscissa values for which predicted ordinate values are desired
+        derivs: the number of derivatives to infer
+        """
+        lth, x= self.lth_opt, self.x
+        if self.xu is not None:
+            # the prior covariance less that explained by the inducing points plus their posterior covariance
+            x= self.xu
+            nlml, jac, Luu, LB, c= self.sparsefactorize(lth)
+        fns= ['covfn', 'd1covfn', 'd12covfn'][:derivs+1]
+        kv= np.concatenate([self.dcovmatrix(fn, xnew, x, lth) for fn in fns])
+        Knewnew= self.dcovmatrix('covfn', xnew, xnew, lth)
+        if derivs > 0:
+            d1Knewnew= self.dcovmatrix('d1covfn', xnew, xnew, lth)
+            d1d2Knewnew= self.dcovmatrix('d1d2covfn', xnew, xnew, lth)
+        if derivs > 1:
+            d12Knewnew= self.dcovmatrix('d12covfn', xnew, xnew, lth)
+            d12d2Knewnew= self.dcovmatrix('d12d2covfn', xnew, xnew, lth)
+            d12d22Knewnew= self.dcovmatrix('d12d22covfn', xnew, xnew, lth)
+        if derivs == 0:
+            km= Knewnew
+        elif derivs == 1:
+            km= np.block([[Knewnew, np.transpose(d1Knewnew)],
+                          [d1Knewnew, d1d2Knewnew]])
+        elif derivs == 2:
+            km= np.block([[Knewnew, np.transpose(d1Knewnew), np.transpose(d12Knewnew)],
+                          [d1Knewnew, d1d2Knewnew, np.transpose(d12d2Knewnew)],
+                          [d12Knewnew, d12d2Knewnew, d12d22Knewnew]])
+        if self.xu is not None:
+            As= linalg.solve_triangular(Luu, np.transpose(kv), lower= True)
+            LBAs= linalg.solve_triangular(LB, As, lower= True)
+            return km - np.dot(As.T, As) + np.dot(LBAs.T, LBAs)
+        return km - np.dot(kv, self.solvekernel(lth, np.transpose(kv)))
+
+
+    def sparsepredict(self, xnew, derivs= 0):
+        """
+        Returns the predicted mean latent function and its derivatives and their variances for the sparse Gaussian process without forming their full covariance matrix.
+
+        Arguments
+        --
+        xnew: abscissa values for which predicted ordinate values are desired
+        derivs: the number of derivatives to infer
+        """
+        lth, xu= self.lth_opt, self.xu
+        nlml, jac, Luu, LB, c= self.sparsefactorize(lth)
+        fns= [('covfn', 'covfn'), ('d1covfn', 'd1d2covfn'), ('d12covfn', 'd12d22covfn')][:derivs+1]
+        # covariances with the inducing points and prior variances of the function and its derivatives
+        kv= np.concatenate([self.dcovmatrix(fn, xnew, xu, lth) for fn, dfn in fns])
+        kd= np.concatenate([self.dcovdiag(dfn, xnew, lth) for fn, dfn in fns])
+        As= linalg.solve_triangular(Luu, kv.T, lower= True)
+        LBAs= linalg.solve_triangular(LB, As, lower= True)
+        mnp= np.dot(LBAs.T, c)
+        # the residual variance not captured by the inducing points
+        resvar= np.clip(kd - np.sum(As**2, 0), 0, None)
+        varp= resvar + np.sum(LBAs**2, 0)
+        return mnp, varp
+
+
+    def _storeprediction(self, mnp, varp, merrorsnew, xold, addnoise, derivs):
+        """
+        Stores the predicted mean latent function and its derivatives, and their variances, for the user.
+
+        Arguments
+        --
+        mnp: the predicted combined array of the mean latent function and its mean derivatives
+        varp: the variances of mnp
+        merrorsnew: the expected measurements errors at xnew
+        xold: True if xnew is the same as x
+        addnoise: if True, add measuremnet noise to the predicted variance
+        derivs: the number of derivatives that were inferred
+        """
+        lth, nonew= self.lth_opt, len(self.xnew)
+        self.f= mnp[:nonew]
+        fvar= varp[:nonew]
+        if addnoise:
+            # add measurement error to the variance of the latent function
+            if np.any(self.merrors):
+                if xold:
+                    self.fvar= fvar + np.exp(lth[-1])*self.merrors
                 else:
-                    self.fvar= fvar + np.exp(lth[-1])*np.identity(len(xnew))
+                    self.fvar= fvar + merrorsnew
             else:
-                # just take the variance of the latent function
-                self.fvar= fvar
-            if derivs > 0:
-                self.df= mnp[len(xnew):2*len(xnew)]
-                self.dfvar= varp[len(xnew):2*len(xnew)]
-            if derivs > 1:
-                self.ddf= mnp[2*len(xnew):]
-                self.ddfvar= varp[2*len(xnew):]
+                self.fvar= fvar + np.exp(lth[-1])
+        else:
+            # just take the variance of the latent function
+            self.fvar= fvar
+        if derivs > 0:
+            self.df= mnp[nonew:2*nonew]
+            self.dfvar= varp[nonew:2*nonew]
+        if derivs > 1:
+            self.ddf= mnp[2*nonew:]
+            self.ddfvar= varp[2*nonew:]
 
 
 
@@ -369,11 +822,11 @@ class gaussianprocess:
         nostds: number of standard deviations to use as errorbars
         """
         x, y, xnew= self.x, self.y, self.xnew
-        f= self.f
         sd= np.sqrt(self.fvar)
         if datasymbol: plt.plot(x, y, 'r'+datasymbol)
-        plt.plot(xnew, f, color= GPcolor)
-        plt.fill_between(xnew, f-nostds*sd, f+nostds*sd, facecolor= GPcolor, alpha=0.2)
+        for f in np.reshape(self.f, (len(xnew), -1)).T:
+            plt.plot(xnew, f, color= GPcolor)
+            plt.fill_between(xnew, f-nostds*sd, f+nostds*sd, facecolor= GPcolor, alpha=0.2)
 
 
 
@@ -399,9 +852,7 @@ class lnGP(gaussianprocess):
         '''
         th= np.exp(lth)
         k= th[0] + th[1]*x*xp
-        jk= np.empty((len(xp), self.noparams))
-        jk[:,0]= th[0]*np.ones(len(xp))
-        jk[:,1]= th[1]*x*xp
+        jk= np.stack(np.broadcast_arrays(th[0]*np.ones_like(x*xp), th[1]*x*xp), axis= -1)
         return k, jk
 
     def gradcovfn(self, x, xp, lth):
@@ -441,9 +892,9 @@ class nnGP(gaussianprocess):
     description= 'neural network Gaussian process'
 
     def info(self):
-        print('hparam[0] determines the initial value')
-        print('hparam[1] determines the flexibility')
-        print('hparam[2] determines the variance of the measurement error')
+        logger.info('hparam[0] determines the initial value')
+        logger.info('hparam[1] determines the flexibility')
+        logger.info('hparam[2] determines the variance of the measurement error')
 
     def covfn(self, x, xp, lth):
         """
@@ -459,14 +910,14 @@ class nnGP(gaussianprocess):
         th= np.exp(lth)
         k= (np.arcsin(2*(th[0] + x*xp*th[1])/np.sqrt(1+2*(th[0]+x**2*th[1]))
                       /np.sqrt(1+2*(th[0]+xp**2*th[1]))))*2/np.pi
-        jk= np.empty((len(xp), self.noparams))
         den= np.pi*(1+2*th[0]+2*th[1]*x**2)*(1+2*th[0]+2*th[1]*xp**2) \
           *np.sqrt(1+4*th[0]*(1+th[1]*(x-xp)**2)+2*th[1]*(x**2+xp**2))
-        jk[:,0]= (4*(1+2*th[0]*(1+th[1]*(x-xp)**2) - 2*th[1]**2*x*(x-xp)**2*xp \
+        jk0= (4*(1+2*th[0]*(1+th[1]*(x-xp)**2) - 2*th[1]**2*x*(x-xp)**2*xp \
                      + 2*th[1]*(x**2-x*xp+xp**2)))/den*th[0]
-        jk[:,1]= -(4*(2*th[0]**2*(x-xp)**2 - x*xp*(1+th[1]*(x**2+xp**2)) \
+        jk1= -(4*(2*th[0]**2*(x-xp)**2 - x*xp*(1+th[1]*(x**2+xp**2)) \
                       + th[0]*(-2*th[1]*x**3*xp+xp**2-2*x*xp*(2+th[1]*xp**2) \
                                +x**2*(1+4*th[1]*xp**2))))/den*th[1]
+        jk= np.stack(np.broadcast_arrays(jk0, jk1), axis= -1)
         return k, jk
 
     def d1covfn(self, x, xp, lth):
@@ -547,11 +998,12 @@ class sqexpGP(gaussianprocess):
     '''
     noparams= 2
     description= 'squared exponential Gaussian process'
+    stationary= True
 
     def info(self):
-        print('hparam[0] determines the amplitude of variation')
-        print('hparam[1] determines the flexibility')
-        print('hparam[2] determines the variance of the measurement error')
+        logger.info('hparam[0] determines the amplitude of variation')
+        logger.info('hparam[1] determines the flexibility')
+        logger.info('hparam[2] determines the variance of the measurement error')
 
     def covfn(self, x, xp, lth):
         '''
@@ -568,9 +1020,7 @@ class sqexpGP(gaussianprocess):
         xp= np.array(xp)
         e= np.exp(-th[1]/2.0*(x-xp)**2)
         k= th[0]*e
-        jk= np.empty((len(xp), self.noparams))
-        jk[:,0]= e*th[0]
-        jk[:,1]= -th[0]*th[1]*e/2.0*(x-xp)**2
+        jk= np.stack(np.broadcast_arrays(e*th[0], -th[0]*th[1]*e/2.0*(x-xp)**2), axis= -1)
         return k, jk
 
     def d1covfn(self, x, xp, lth):
@@ -661,10 +1111,10 @@ class sqexplinGP(gaussianprocess):
     description= 'squared exponential Gaussian process with a linear trend'
 
     def info(self):
-        print('hparam[0] determines the amplitude of variation')
-        print('hparam[1] determines the flexibility')
-        print('hparam[2] determines the linear trend with increasing input')
-        print('hparam[3] determines the variance of the measurement error')
+        logger.info('hparam[0] determines the amplitude of variation')
+        logger.info('hparam[1] determines the flexibility')
+        logger.info('hparam[2] determines the linear trend with increasing input')
+        logger.info('hparam[3] determines the variance of the measurement error')
 
     def covfn(self, x, xp, lth):
         '''
@@ -681,10 +1131,7 @@ class sqexplinGP(gaussianprocess):
         xp= np.array(xp)
         e= np.exp(-th[1]/2.0*(x-xp)**2)
         k= th[0]*e + th[2]*x*xp
-        jk= np.empty((len(xp), self.noparams))
-        jk[:,0]= e*th[0]
-        jk[:,1]= -th[0]*th[1]*e/2.0*(x-xp)**2
-        jk[:,2]= x*xp*th[2]
+        jk= np.stack(np.broadcast_arrays(e*th[0], -th[0]*th[1]*e/2.0*(x-xp)**2, x*xp*th[2]), axis= -1)
         return k, jk
 
 
@@ -775,11 +1222,12 @@ class maternGP(gaussianprocess):
     '''
     noparams= 2
     description= '(twice differentiable) Matern covariance function'
+    stationary= True
 
     def info(self):
-        print('hparam[0] determines the amplitude of variation')
-        print('hparam[1] determines the stiffness')
-        print('hparam[2] determines the variance of the measurement error')
+        logger.info('hparam[0] determines the amplitude of variation')
+        logger.info('hparam[1] determines the stiffness')
+        logger.info('hparam[2] determines the variance of the measurement error')
 
     def covfn(self, x, xp, lth):
         '''
@@ -799,9 +1247,7 @@ class maternGP(gaussianprocess):
         e= np.exp(-s5*r/th[1])
         poly= 1 + 5*r**2/3/th[1]**2 + s5*r/th[1]
         k= th[0]*e*poly
-        jk= np.empty((len(xp), self.noparams))
-        jk[:,0]= e*poly
-        jk[:,1]= 5*e*th[0]*r**2*(th[1] + s5*r)/3/th[1]**4
+        jk= np.stack(np.broadcast_arrays(th[0]*e*poly, 5*e*th[0]*r**2*(th[1] + s5*r)/3/th[1]**3), axis= -1)
         return k, jk
 
     def d1covfn(self, x, xp, lth):
@@ -819,8 +1265,7 @@ class maternGP(gaussianprocess):
         s5= np.sqrt(5)
         e= np.exp(-s5*r/th[1])
         df= 5*e*th[0]*r*(th[1] + s5*r)/3/th[1]**3
-        sns= np.ones(np.size(xp))
-        sns[x > xp]= -1
+        sns= np.where(x > xp, -1, 1)
         return sns*df, False
 
     def d1d2covfn(self, x, xp, lth):
@@ -870,8 +1315,7 @@ class maternGP(gaussianprocess):
         s5= np.sqrt(5)
         e= np.exp(-s5*r/th[1])
         df= 25*e*th[0]*r*(3*th[1] - s5*r)/3/th[1]**5
-        sns= np.ones(np.size(xp))
-        sns[x > xp]= -1
+        sns= np.where(x > xp, -1, 1)
         return sns*df, False
 
     def d12d22covfn(self, x, xp, lth):
@@ -892,6 +1336,462 @@ class maternGP(gaussianprocess):
 
 
 
+####
+
+
+class maternssGP(maternGP):
+    '''
+    Gaussian process with the twice differentiable Matern covariance function (nu= 5/2) written as a linear state-space model.
+
+    The state at each time is the latent function and its first two derivatives. The negative log marginal likelihood, its Jacobian, the predictions, and samples are all found with a Kalman filter and Rauch-Tung-Striebel smoother, so the cost grows linearly rather than cubically with the number of data points. The full covariance matrix of the predictions (.covp) is not calculated.
+    '''
+    description= '(twice differentiable) Matern covariance function solved as a state-space model'
+
+    def ssmodel(self, lth):
+        '''
+        Returns the feedback matrix and stationary covariance of the state-space model and their derivatives with respect to the log hyperparameters.
+
+        Arguments
+        --
+        lth: the log of the hyperparameters
+        '''
+        th= np.exp(lth)
+        la= np.sqrt(5)/th[1]
+        F= np.array([[0, 1, 0], [0, 0, 1], [-la**3, -3*la**2, -3*la]])
+        Pinf= th[0]*np.array([[1, 0, -la**2/3], [0, la**2/3, 0], [-la**2/3, 0, la**4]])
+        # derivatives with respect to the log hyperparameters, including the measurement error
+        dF= np.zeros((len(lth), 3, 3))
+        dF[1]= la*np.array([[0, 0, 0], [0, 0, 0], [3*la**2, 6*la, 3]])
+        dPinf= np.zeros((len(lth), 3, 3))
+        dPinf[0]= Pinf
+        dPinf[1]= -th[0]*la*np.array([[0, 0, -2*la/3], [0, 2*la/3, 0], [-2*la/3, 0, 4*la**3]])
+        return F, Pinf, dF, dPinf
+
+
+    def discretize(self, lth, dt):
+        '''
+        Returns the transition matrices, the covariance matrices of the process noise, and their derivatives with respect to the log hyperparameters for each time step.
+
+        Arguments
+        --
+        lth: the log of the hyperparameters
+        dt: a 1-d array of time steps
+        '''
+        from scipy.linalg import expm
+        F, Pinf, dF, dPinf= self.ssmodel(lth)
+        nop= len(lth)
+        # evaluate each distinct time step only once
+        scale= np.max(np.abs(dt)) if len(dt) else 1
+        dtu, inv= np.unique(np.round(dt/scale, 12)*scale, return_inverse= True)
+        # the exponential of a block triangular matrix gives the transition matrix and its derivatives together
+        blk= np.zeros((len(dtu), nop, 6, 6))
+        blk[:, :, :3, :3]= F*dtu[:,None,None,None]
+        blk[:, :, 3:, 3:]= F*dtu[:,None,None,None]
+        blk[:, :, :3, 3:]= dF*dtu[:,None,None,None]
+        eblk= expm(blk)
+        A= eblk[:, 0, :3, :3]
+        dA= eblk[:, :, :3, 3:]
+        Q= Pinf - A @ Pinf @ np.swapaxes(A, -1, -2)
+        APdAt= A[:,None] @ Pinf @ np.swapaxes(dA, -1, -2)
+        dQ= dPinf - A[:,None] @ dPinf @ np.swapaxes(A, -1, -2)[:,None] - APdAt - np.swapaxes(APdAt, -1, -2)
+        return A[inv], Q[inv], dA[inv], dQ[inv]
+
+
+    def kalman(self, lth, x, y, r, grad= False, store= False):
+        '''
+        Runs a Kalman filter through the data, which must be ordered in x, returning the negative log marginal likelihood and, if requested, its Jacobian and the filtered and predicted states.
+
+        Arguments
+        --
+        lth: the log of the hyperparameters
+        x: a 1-d array of ordered abscissa
+        y: a 1-d array of ordinate values (a NaN marks a time without data)
+        r: a 1-d array of the variances of the measurement error
+        grad: if True, find the Jacobian of the negative log marginal likelihood
+        store: if True, return the filtered and predicted means and covariances and the transition matrices
+        '''
+        F, Pinf, dF, dPinf= self.ssmodel(lth)
+        A, Q, dA, dQ= self.discretize(lth, np.diff(x))
+        nop, n= len(lth), len(x)
+        m, P= np.zeros(3), Pinf
+        dm, dP= np.zeros((nop, 3)), dPinf
+        # the derivative of the measurement error
+        dr= np.zeros(nop)
+        nlml, jac= 0, np.zeros(nop)
+        if store:
+            mf, Pf= np.empty((n, 3)), np.empty((n, 3, 3))
+            mpred, Ppred= np.empty((n, 3)), np.empty((n, 3, 3))
+        for i in range(n):
+            if i > 0:
+                # predict
+                Ai= A[i-1]
+                if grad:
+                    dm= dm @ Ai.T + dA[i-1] @ m
+                    dP= (dA[i-1] @ P @ Ai.T + Ai @ dP @ Ai.T + Ai @ P @ dA[i-1].transpose(0, 2, 1)
+                         + dQ[i-1])
+                m= Ai @ m
+                P= Ai @ P @ Ai.T + Q[i-1]
+            if store:
+                mpred[i], Ppred[i]= m, P
+            if not np.isnan(y[i]):
+                # update with the data
+                v= y[i] - m[0]
+                S= P[0,0] + r[i]
+                K= P[:,0]/S
+                nlml += 0.5*(np.log(2*np.pi*S) + v**2/S)
+                if grad:
+                    dr[-1]= r[i]
+                    dv= -dm[:,0]
+                    dS= dP[:,0,0] + dr
+                    dK= (dP[:,:,0] - dS[:,None]*K)/S
+                    jac += 0.5*(dS/S + 2*v*dv/S - v**2*dS/S**2)
+                    dm= dm + dK*v + dv[:,None]*K
+                    dKK= dK[:,:,None]*K[None,None,:]
+                    dP= dP - dS[:,None,None]*np.outer(K, K) - S*(dKK + dKK.transpose(0, 2, 1))
+                m= m + K*v
+                P= P - S*np.outer(K, K)
+            if store:
+                mf[i], Pf[i]= m, P
+        if store:
+            return nlml, jac, (mf, Pf, mpred, Ppred, A)
+        else:
+            return nlml, jac
+
+
+    def _sorted(self):
+        '''
+        Returns the data ordered in x and the scaled variances of the measurement errors.
+        '''
+        if np.ndim(self.y) > 1:
+            raise gaussianprocessException('maternssGP can only be used with 1-d data.')
+        order= np.argsort(self.x, kind= 'stable')
+        if np.any(self.merrors):
+            r= np.asarray(self.merrors)[order]
+        else:
+            r= np.ones(len(self.x))
+        return np.asarray(self.x)[order], np.asarray(self.y)[order], r
+
+
+    def nlmljac(self, lth):
+        '''
+        Returns the negative of the log marginal likelihood and its Jacobian with respect to the log hyperparameters from one pass of the Kalman filter.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        '''
+        key= ('statespace', np.asarray(lth, dtype= float).tobytes())
+        if self._factor is None or self._factor[0] != key:
+            x, y, r= self._sorted()
+            nlml, jac= self.kalman(lth, x, y, np.exp(lth[-1])*r, grad= True)
+            self._factor= (key, nlml, jac)
+        return self._factor[1], self._factor[2].copy()
+
+
+    def nlml(self, lth):
+        '''
+        Returns negative of log marginal likelihood.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        '''
+        return self.nlmljac(lth)[0]
+
+
+    def jacnlml(self, lth):
+        '''
+        Returns the Jacobian of negative log marginal likelihood with respect to the hyperparameters with deriviatives being taken assuming the hyperparmaters are in log space.
+
+        Arguments
+        --
+        lth: log of the hyperparameters
+        '''
+        return self.nlmljac(lth)[1]
+
+
+    def smooth(self, xnew):
+        '''
+        Runs the Kalman filter and smoother through the data and the times xnew, returning the filtered, predicted, and smoothed states and the positions of xnew in the combined ordered times.
+
+        Arguments
+        --
+        xnew: abscissa values for which predictions are desired
+        '''
+        lth= self.lth_opt
+        x, y, r= self._sorted()
+        xnew= np.asarray(xnew, dtype= float)
+        # add the new times as points without data
+        xa= np.concatenate((x, xnew))
+        ya= np.concatenate((y, np.nan*np.ones(len(xnew))))
+        ra= np.concatenate((np.exp(lth[-1])*r, np.ones(len(xnew))))
+        order= np.argsort(xa, kind= 'stable')
+        inew= np.argsort(order)[len(x):]
+        nlml, jac, (mf, Pf, mpred, Ppred, A)= self.kalman(lth, xa[order], ya[order], ra[order], store= True)
+        # Rauch-Tung-Striebel smoother
+        ms, Ps= mf.copy(), Pf.copy()
+        G= np.zeros(Pf.shape)
+        for i in range(len(xa)-2, -1, -1):
+            G[i]= np.linalg.solve(Ppred[i+1], A[i] @ Pf[i]).T
+            ms[i]= mf[i] + G[i] @ (ms[i+1] - mpred[i+1])
+            Ps[i]= Pf[i] + G[i] @ (Ps[i+1] - Ppred[i+1]) @ G[i].T
+        return (mf, Pf, mpred, Ppred, G), ms, Ps, inew
+
+
+    def predict(self, xnew, merrorsnew= False, derivs= 0, addnoise= False, full_cov= True, chunksize= None):
+        '''
+        Determines the predicted mean latent function (.f) and its variance (.fvar) and potentially the predicted mean first derivative (.df) and its variance (.dfvar) and the predicted mean second derivative (.ddf) and its variance (.ddfvar). Also .mnp is the predicted combined array of the mean latent function and its mean derivatives and .varp its variance.
+
+        Arguments
+        --
+        xnew: abscissa values for which predicted ordinate values are desired
+        merrorsnew: if specified, the expected measurements errors at xnew (need not be specified if xnew= x)
+        derivs: if 0, only the latent function is inferred; if 1, the latent function and the first derivative are inferred; if 2, the latent function and the first and second derivatives are inferred
+        addnoise: if True, add measuremnet noise to the predicted variance
+        full_cov: not used because the full covariance matrix is never formed
+        chunksize: not used because the memory used grows linearly with the length of xnew
+        '''
+        if len(self.x) == len(xnew) and (self.x == xnew).all():
+            xold= True
+        else:
+            xold= False
+        if np.any(self.merrors) and not np.any(merrorsnew) and not xold:
+            raise gaussianprocessException('Length of xnew is different from x: measurement errors were used to find the hyperparameters and measurement errors are therefore required for any predictions.')
+        elif not hasattr(self, 'lth_opt'):
+            raise gaussianprocessException(' Run gp.findhyperparameters() first before making predictions.')
+        self.xnew= xnew
+        self._covp, self._covpargs= None, None
+        filtered, ms, Ps, inew= self.smooth(xnew)
+        self._ssprediction= (filtered, inew, derivs)
+        mnp= np.concatenate([ms[inew, j] for j in range(derivs+1)])
+        varp= np.concatenate([Ps[inew, j, j] for j in range(derivs+1)])
+        self.mnp, self.varp= mnp, varp
+        self._storeprediction(mnp, varp, merrorsnew, xold, addnoise, derivs)
+
+
+    def sample(self, size= 1, rng= None):
+        '''
+        Generate samples from the Gaussian process as an array using forward filtering and backward sampling.
+
+        Arguments
+        --
+        size: number of samples
+        rng: if specified, a numpy Generator or a seed for one used to draw the samples
+        '''
+        rng= _getrng(rng)
+        try:
+            (mf, Pf, mpred, Ppred, G), inew, derivs= self._ssprediction
+        except AttributeError:
+            logger.error('Run gp.predict() first before sampling.')
+            return
+        n= len(mf)
+        s= np.empty((n, size, 3))
+        s[-1]= mf[-1] + rng.standard_normal((size, 3)) @ _sqrtm(Pf[-1]).T
+        for i in range(n-2, -1, -1):
+            mean= mf[i] + (s[i+1] - mpred[i+1]) @ G[i].T
+            cov= Pf[i] - G[i] @ Ppred[i+1] @ G[i].T
+            s[i]= mean + rng.standard_normal((size, 3)) @ _sqrtm(cov).T
+        return np.concatenate([s[inew, :, j] for j in range(derivs+1)])
+
+
+####
+
+def _optimizerun(g, b, stvals, optmethod, optmessages, linalgmax, rng):
+    '''
+    Performs one attempt at optimizing the hyperparameters of a Gaussian process, returning the optimum log hyperparameters, the negative log marginal likelihood at the optimum, and a flag that is 1 if the optimization succeeded.
+
+    Arguments
+    --
+    g: the Gaussian process
+    b: bounds on the hyperparameters in log space
+    stvals: an (optional) initial guess for the log hyperparameters
+    optmethod: the optimization routine to be used, either 'l_bfgs_b' or 'tnc'
+    optmessages: if True, display messages from the optimization routine
+    linalgmax: number of attempts if a linear algebra (numerical) error is generated
+    rng: the random number generator used to choose initial values for the hyperparameters
+
+    Returns the optimum log hyperparameters, the negative log marginal likelihood, a flag that is 1 if the optimization succeeded, and a dictionary of the number of iterations and function evaluations, linear algebra errors, and the time taken.
+    '''
+    starttime= time.perf_counter()
+    lthf, lmlml, success= np.full(len(b), np.nan), np.nan, 0
+    info= {'iterations': 0, 'funcalls': 0, 'linalgerrors': 0}
+    linalgerror= 0
+    while linalgerror < linalgmax:
+        try:
+            if np.any(stvals):
+                # initial values given for hyperparameters
+                lth= stvals
+            else:
+                # choose random initial values for hyperparameters
+                lth= [rng.uniform(b[j][0], b[j][1]) for j in range(len(b))]
+            # run Gaussian process
+            if optmethod == 'tnc':
+                from scipy.optimize import fmin_tnc
+                lthf, nf, success= fmin_tnc(g.nlmljac, lth, bounds= b, maxfun= 1000, messages= optmessages)
+                linalgerror= linalgmax
+                lmlml= g.nlml(lthf)
+                # tnc does not report its iterations
+                info.update(iterations= np.nan, funcalls= nf)
+            elif optmethod == 'l_bfgs_b':
+                from scipy.optimize import fmin_l_bfgs_b
+                lthf, lmlml, dout= fmin_l_bfgs_b(g.nlmljac, lth, bounds= b, disp= optmessages)
+                linalgerror= linalgmax
+                success= dout['warnflag'] + 1
+                info.update(iterations= dout['nit'], funcalls= dout['funcalls'])
+            else:
+                raise gaussianprocessException(optmethod + ' unrecognized.')
+        except np.linalg.LinAlgError:
+            logger.warning('Linear algebra error - trying a different initial condition')
+            linalgerror += 1
+            info['linalgerrors'] += 1
+    info['time']= time.perf_counter() - starttime
+    return lthf, lmlml, success, info
+
+
+def _durbin(t):
+    '''
+    Solves the Yule-Walker equations for a symmetric positive-definite Toeplitz matrix with first column t by the Levinson-Durbin recursion, returning the log of the determinant of the matrix and the first column of its inverse.
+    '''
+    n= len(t)
+    r= t/t[0]
+    y= np.array([-r[1]])
+    beta, alpha= 1.0, -r[1]
+    logdet= n*np.log(t[0])
+    for k in range(1, n-1):
+        if abs(alpha) >= 1:
+            raise np.linalg.LinAlgError('Toeplitz matrix is not positive definite')
+        beta *= 1 - alpha**2
+        logdet += np.log(beta)
+        alpha= -(r[k+1] + np.dot(r[k:0:-1], y))/beta
+        y= np.concatenate((y + alpha*y[::-1], [alpha]))
+    beta *= 1 - alpha**2
+    logdet += np.log(beta)
+    if not np.isfinite(logdet) or beta <= 0:
+        raise np.linalg.LinAlgError('Toeplitz matrix is not positive definite')
+    return logdet, np.concatenate(([1], y))/(t[0]*beta)
+
+
+def _lowertoeplitzdot(v, b, transpose= False):
+    '''
+    Returns the product of the lower triangular Toeplitz matrix with first column v, or its transpose, and the 1-d or 2-d array b using fast Fourier transforms.
+    '''
+    from scipy import fft
+    n= len(v)
+    if transpose:
+        b= b[::-1]
+    shape= (-1,) + (1,)*(np.ndim(b) - 1)
+    p= fft.irfft(fft.rfft(v, 2*n).reshape(shape)*fft.rfft(b, 2*n, axis= 0), 2*n, axis= 0)[:n]
+    return p[::-1] if transpose else p
+
+
+def _toeplitzsolve(ga, b):
+    '''
+    Returns K^-1 b for a symmetric Toeplitz matrix K using the Gohberg-Semencul formula for its inverse.
+
+    Arguments
+    --
+    ga: the first column of the inverse of K
+    b: a 1-d or 2-d array
+    '''
+    u= np.concatenate(([0], ga[::-1][:-1]))
+    return (_lowertoeplitzdot(ga, _lowertoeplitzdot(ga, b, True))
+            - _lowertoeplitzdot(u, _lowertoeplitzdot(u, b, True)))/ga[0]
+
+
+def _correlate(p, q):
+    '''
+    Returns sum_m p[m]*q[m+k] for each lag k >= 0 using fast Fourier transforms, for each column if p and q are 2-d.
+    '''
+    from scipy import fft
+    n= len(p)
+    return fft.irfft(np.conj(fft.rfft(p, 2*n, axis= 0))*fft.rfft(q, 2*n, axis= 0), 2*n, axis= 0)[:n]
+
+
+def _diagsums(a):
+    '''
+    Returns the sums along each upper diagonal k of L L^T, where L is the lower triangular Toeplitz matrix with first column a.
+    '''
+    n= len(a)
+    return (n - np.arange(n))*_correlate(a, a) - _correlate(np.arange(n)*a, a)
+
+
+def _choappend(L, k12, k22):
+    '''
+    Returns the Cholesky factorization, in the form given by linalg.cho_factor, of the matrix K extended by new columns k12 and a new diagonal block k22 given the factorization L of K.
+    '''
+    c, lower= L
+    n, m= k12.shape
+    # work with the upper triangular factor U, where K= U^T U
+    U= np.triu(c.T if lower else c)
+    U12= linalg.solve_triangular(U, k12, trans= 'T')
+    U22= linalg.cholesky(k22 - np.dot(U12.T, U12))
+    Un= np.zeros((n + m, n + m))
+    Un[:n, :n], Un[:n, n:], Un[n:, n:]= U, U12, U22
+    return (Un.T, True) if lower else (Un, False)
+
+
+def _choinverse(L):
+    '''
+    Returns the inverse of a matrix given its Cholesky factorization, in the form given by linalg.cho_factor.
+    '''
+    c, lower= L
+    inv, info= linalg.lapack.dpotri(c, lower= lower)
+    if info != 0:
+        raise np.linalg.LinAlgError('Inverting the Cholesky factor failed.')
+    # only one triangle is returned
+    inv= np.tril(inv) if lower else np.triu(inv)
+    return inv + inv.T - np.diag(np.diagonal(inv))
+
+
+def _nooutputs(y):
+    '''
+    Returns the number of outputs, the columns of y.
+    '''
+    return 1 if np.ndim(y) == 1 else np.shape(y)[1]
+
+
+def _getrng(rng):
+    '''
+    Returns a numpy Generator for a seed or Generator, or the global numpy random state if rng is None.
+    '''
+    if rng is None:
+        return np.random
+    return np.random.default_rng(rng)
+
+
+def _covfactor(cov):
+    '''
+    Returns a matrix W with W W^T equal to a covariance matrix, using a Cholesky decomposition with increasing jitter or, if that fails, an eigendecomposition keeping only the positive eigenvalues.
+    '''
+    cov= np.asarray(cov)
+    scale= np.mean(np.abs(np.diag(cov)))
+    for jitter in [0, 1e-12, 1e-10, 1e-8]:
+        try:
+            return linalg.cholesky(cov + jitter*scale*np.identity(len(cov)), lower= True)
+        except np.linalg.LinAlgError:
+            pass
+    w, v= linalg.eigh(cov)
+    keep= w > 1e-12*np.max(w)
+    return v[:,keep]*np.sqrt(w[keep])
+
+
+def _sqrtm(a):
+    '''
+    Returns a square root of a symmetric positive semi-definite matrix that is robust to it being singular.
+    '''
+    w, v= np.linalg.eigh(a)
+    return v*np.sqrt(np.clip(w, 0, None))
+
+
+def _expand(a, shape):
+    '''
+    Broadcasts the output of a covariance function to the full shape of a kernel matrix.
+    '''
+    if np.shape(a) == shape:
+        return a
+    return np.broadcast_to(a, shape).copy()
+
+
 ####
 
 class gaussianprocessException(Exception):
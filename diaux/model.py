@@ -1,7 +1,18 @@
+import os
+import glob
 import numpy as np 
 import pandas as pd 
 import scipy.integrate
 import tqdm
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Use the compiled kernels for the ODEs and their Jacobians if Numba is 
+# installed. Set to False to use the NumPy implementations, which give 
+# identical results.
+USE_NUMBA = numba is not None
 
 def single_nutrient(params, time, gamma_max, nu_max, precursor_mass_ref, Km, 
                     omega, phi_R, phi_P, num_muts=1, volume=1E-3):
@@ -51,8 +62,9 @@ def single_nutrient(params, time, gamma_max, nu_max, precursor_mass_ref, Km,
 
     Returns
     -------
-    out: list, [dM_dt, dMr_dt, dMp_dt, dprecursors_dt, dnutrients_dt]
-        A list of the evaluated ODEs at the specified time step.
+    out: list or 1d-array, [dM_dt, dMr_dt, dMp_dt, dprecursors_dt, dnutrients_dt]
+        A list of the evaluated ODEs at the specified time step, or an 
+        array if `params` is an array and the compiled kernel is used.
 
         dM_dt : The dynamics of the total protein biomass.
         dMr_dt : The dynamics of the ribosomal protein biomass.
@@ -64,9 +76,15 @@ def single_nutrient(params, time, gamma_max, nu_max, precursor_mass_ref, Km,
     AVO = 6.022E23
     OD_CONV = 6E17
     #TODO: Put in data validation
+    if USE_NUMBA and isinstance(params, np.ndarray) and params.ndim == 1:
+        return _single_nutrient_kernel(params, gamma_max, nu_max, 
+                        precursor_mass_ref, Km, omega, 
+                        _per_mutant(phi_R, num_muts), 
+                        _per_mutant(phi_P, num_muts), num_muts, volume)
         
     # Unpack the parameters
-    if num_muts > 1:
+    stacked = _is_stacked(params, num_muts, phi_R, phi_P)
+    if stacked:
         nutrients = params[-1]
         M, Mr, Mp, precursors = np.reshape(params[:-1], (4, num_muts))
     else: 
@@ -88,24 +106,655 @@ def single_nutrient(params, time, gamma_max, nu_max, precursor_mass_ref, Km,
     dprecursors_dt = nu * Mp - dM_dt
     dnutrients_dt = -nu * Mp/ omega
 
-    _out = [dM_dt, dMr_dt, dMp_dt, dprecursors_dt]
-    if num_muts > 1:
-        dnutrients_dt = np.sum(dnutrients_dt)
-        out = [value for deriv in _out for value in deriv]
+    out = [dM_dt, dMr_dt, dMp_dt, dprecursors_dt]
+    if stacked:
+        dnutrients_dt = _sequential_sum(dnutrients_dt)
+        out = list(np.concatenate(out))
     out.append(dnutrients_dt)
     return out
 
 
+def single_nutrient_jacobian(params, time, gamma_max, nu_max, precursor_mass_ref,
+                             Km, omega, phi_R, phi_P, num_muts=1, volume=1E-3):
+    """
+    Computes the analytic Jacobian of `single_nutrient` with respect to the
+    parameters whose dynamics are described by the ODEs. The arguments are 
+    those of `single_nutrient` so that this function can be passed directly 
+    to `scipy.integrate.odeint` as `Dfun`.
+
+    Parameters
+    ----------
+    params: list
+        The parameters whose dynamics are described by the ODEs, laid out as 
+        for `single_nutrient`.
+    time : float
+        Evaluated time step of the system.
+    gamma_max, nu_max, precursor_mass_ref, Km, omega, phi_R, phi_P, num_muts, volume
+        The arguments of `single_nutrient`.
+
+    Returns
+    -------
+    jac : 2d-array, shape (4 * num_muts + 1, 4 * num_muts + 1)
+        The Jacobian where jac[i, j] is the derivative of the ith ODE with 
+        respect to the jth parameter. Each mutant only interacts with the 
+        others through the shared nutrients, so the matrix is zero except 
+        for the diagonals of its 4 x 4 blocks of mutant terms and the 
+        last row and column of nutrient terms. If `params` is a 2d-array 
+        of independent models, as used by `integrate_sweep`, the models 
+        are stacked along a trailing axis.
+    """
+    # Define constants
+    AVO = 6.022E23
+    if USE_NUMBA and np.ndim(params) == 1:
+        return _single_nutrient_jacobian_kernel(np.asarray(params, dtype=float), 
+                        gamma_max, nu_max, precursor_mass_ref, Km, omega, 
+                        _per_mutant(phi_R, num_muts), 
+                        _per_mutant(phi_P, num_muts), num_muts, volume)
+
+    # Unpack the parameters
+    params = np.asarray(params, dtype=float)
+    nutrients = params[-1]
+    extra = params.shape[1:]
+    M, Mr, Mp, precursors = np.reshape(params[:-1], (4, num_muts) + extra)
+
+    # Compute the capacities and their derivatives
+    precursor_mass_frac = precursors / M
+    nutrient_conc = nutrients / (AVO * volume)
+    gamma = gamma_max * precursor_mass_frac / (precursor_mass_frac + precursor_mass_ref)
+    dgamma_dfrac = gamma_max * precursor_mass_ref / (precursor_mass_frac + precursor_mass_ref)**2
+    nu = nu_max * nutrient_conc / (nutrient_conc + Km)
+    dnu_dnutrients = nu_max * Km / (nutrient_conc + Km)**2 / (AVO * volume)
+
+    # Derivatives of the growth rate dM_dt = gamma * Mr
+    dgrowth = np.zeros((4, num_muts) + extra)
+    dgrowth[0] = -Mr * dgamma_dfrac * precursors / M**2
+    dgrowth[1] = gamma
+    dgrowth[3] = Mr * dgamma_dfrac / M
+
+    # Fill the diagonals of the blocks of mutant terms
+    jac = np.zeros((4 * num_muts + 1, 4 * num_muts + 1) + extra)
+    idx = np.arange(num_muts)
+    _fill_blocks(jac, [1.0, phi_R, phi_P, -1.0], dgrowth, num_muts)
+    jac[3 * num_muts + idx, 2 * num_muts + idx] += nu
+
+    # The nutrients are consumed by, and limit, every mutant
+    jac[3 * num_muts + idx, -1] = Mp * dnu_dnutrients
+    jac[-1, 2 * num_muts + idx] = -nu / omega
+    jac[-1, -1] = -_sequential_sum(Mp) * dnu_dnutrients / omega
+    return jac
+
+
+def diauxic_nutrient(params, time, gamma_max, nu_x_max, nu_y_max, 
+                     precursor_mass_ref, Km_x, Km_y, omega_x, omega_y, phi_R, 
+                     phi_x_max, phi_y_max, num_muts=1, volume=1E-3):
+    """
+    Defines the system of ordinary differential equations (ODEs) which describe 
+    accumulation of biomass on two nutrient sources, where the metabolic 
+    proteins for the second nutrient are only expressed as the first, 
+    preferred, nutrient is depleted. 
+
+    Parameters
+    ----------
+    params: list, [M, Mr, Mx, My, precursors, nutrients_x, nutrients_y]
+        A list of the parameters whose dynamics are described by the ODEs.
+        If `num_muts > 1`, or the per-mutant arguments are arrays, each of 
+        the first five parameters is given for every mutant before the 
+        next, followed by the two nutrients.
+        M : positive float
+            Total protein biomass of the system
+        Mr : positive float, must be < M 
+            Ribosomal protein biomass of the system
+        Mx : positive float, must be < M
+            Metabolic protein biomass for the first nutrient
+        My : positive float, must be < M
+            Metabolic protein biomass for the second nutrient
+        precursors : positive float
+            Mass of precursors in the cell. This is normalized to 
+            total protein biomass when calculating the translational 
+            capacity.
+        nutrients_x, nutrients_y : positive float
+            Mass of the first and second nutrients in the system.
+    time : float
+        Evaluated time step of the system.
+    gamma_max: positive float 
+        The maximum translational capacity in units of inverse time.
+    nu_x_max, nu_y_max : positive float
+        The maximum nutritional capacities on the first and second nutrient 
+        in units of inverse time. 
+    precursor_mass_ref : positive float 
+        The dissociation constant of charged tRNA to the elongating ribosome.   
+    Km_x, Km_y : positive float
+        The Monod constants for growth on the first and second nutrient in 
+        units of molar.
+    omega_x, omega_y : positive float
+        The yield coefficients of the nutrient sources in mass of amino acid 
+        produced per mass of nutrient.
+    phi_R : float, [0, 1]
+        The fraction of the proteome occupied by ribosomal protein mass
+    phi_x_max, phi_y_max : float, [0, 1] 
+        The maximum fractions of the proteome occupied by metabolic protein 
+        mass for the first and second nutrient. These are scaled by the 
+        saturation, and the lack of saturation, of the first nutrient 
+        respectively.
+    num_muts: int
+        The number of mutants whose dynamics need to be tracked.
+    volume: float, default 1 mL
+        The volume of the system for calculation of concentrations.
+
+    Returns
+    -------
+    out: list, [dM_dt, dMr_dt, dMx_dt, dMy_dt, dprecursors_dt, dnutrients_x_dt, dnutrients_y_dt]
+        A list of the evaluated ODEs at the specified time step, laid out 
+        as `params`, or an array if `params` is an array and the compiled 
+        kernel is used.
+    """
+    # Define constants 
+    AVO = 6.022E23
+    if USE_NUMBA and isinstance(params, np.ndarray) and params.ndim == 1:
+        return _diauxic_nutrient_kernel(params, gamma_max, nu_x_max, nu_y_max, 
+                        precursor_mass_ref, Km_x, Km_y, omega_x, omega_y, 
+                        _per_mutant(phi_R, num_muts), 
+                        _per_mutant(phi_x_max, num_muts), 
+                        _per_mutant(phi_y_max, num_muts), num_muts, volume)
+
+    # Unpack the parameters
+    stacked = _is_stacked(params, num_muts, phi_R, phi_x_max, phi_y_max)
+    if stacked:
+        nutrients_x, nutrients_y = params[-2:]
+        M, Mr, Mx, My, precursors = np.reshape(params[:-2], (5, num_muts))
+    else: 
+        M, Mr, Mx, My, precursors, nutrients_x, nutrients_y = params
+
+    # Compute the precursor mass fraction and nutrient concentrations
+    precursor_mass_frac = precursors / M
+    nutrient_x_conc = nutrients_x / (AVO * volume)
+    nutrient_y_conc = nutrients_y / (AVO * volume)
+    saturation_x = nutrient_x_conc / (nutrient_x_conc + Km_x)
+
+    # Compute the capacities and the allocation
+    gamma = gamma_max * precursor_mass_frac / (precursor_mass_frac + precursor_mass_ref)
+    nu_x = nu_x_max * saturation_x
+    nu_y = nu_y_max * nutrient_y_conc / (nutrient_y_conc + Km_y)
+    phi_X = phi_x_max * saturation_x
+    phi_Y = phi_y_max * (1 - saturation_x)
+
+    # ODEs for biomass accumulation
+    dM_dt = gamma * Mr
+    dMr_dt = phi_R * dM_dt
+    dMx_dt = phi_X * dM_dt
+    dMy_dt = phi_Y * dM_dt
+
+    # ODE for precursors and nutrients
+    dprecursors_dt = nu_x * Mx + nu_y * My - dM_dt
+    dnutrients_x_dt = -nu_x * Mx / omega_x
+    dnutrients_y_dt = -nu_y * My / omega_y
+
+    out = [dM_dt, dMr_dt, dMx_dt, dMy_dt, dprecursors_dt]
+    if stacked:
+        out = list(np.concatenate(out))
+        dnutrients_x_dt = _sequential_sum(dnutrients_x_dt)
+        dnutrients_y_dt = _sequential_sum(dnutrients_y_dt)
+    out.extend([dnutrients_x_dt, dnutrients_y_dt])
+    return out
+
+
+def diauxic_nutrient_jacobian(params, time, gamma_max, nu_x_max, nu_y_max, 
+                              precursor_mass_ref, Km_x, Km_y, omega_x, omega_y, 
+                              phi_R, phi_x_max, phi_y_max, num_muts=1, 
+                              volume=1E-3):
+    """
+    Computes the analytic Jacobian of `diauxic_nutrient` with respect to the
+    parameters whose dynamics are described by the ODEs. The arguments are 
+    those of `diauxic_nutrient` so that this function can be passed directly 
+    to `scipy.integrate.odeint` as `Dfun`.
+
+    Parameters
+    ----------
+    params: list
+        The parameters whose dynamics are described by the ODEs, laid out as 
+        for `diauxic_nutrient`.
+    time : float
+        Evaluated time step of the system.
+    gamma_max, nu_x_max, nu_y_max, precursor_mass_ref, Km_x, Km_y, omega_x, omega_y, phi_R, phi_x_max, phi_y_max, num_muts, volume
+        The arguments of `diauxic_nutrient`.
+
+    Returns
+    -------
+    jac : 2d-array, shape (5 * num_muts + 2, 5 * num_muts + 2)
+        The Jacobian where jac[i, j] is the derivative of the ith ODE with 
+        respect to the jth parameter. As for `single_nutrient_jacobian`, 
+        the matrix is zero except for the diagonals of its 5 x 5 blocks of 
+        mutant terms and the last two rows and columns of nutrient terms, 
+        and stacked independent models are placed along a trailing axis.
+    """
+    # Define constants
+    AVO = 6.022E23
+    if USE_NUMBA and np.ndim(params) == 1:
+        return _diauxic_nutrient_jacobian_kernel(np.asarray(params, dtype=float), 
+                        gamma_max, nu_x_max, nu_y_max, precursor_mass_ref, 
+                        Km_x, Km_y, omega_x, omega_y, 
+                        _per_mutant(phi_R, num_muts), 
+                        _per_mutant(phi_x_max, num_muts), 
+                        _per_mutant(phi_y_max, num_muts), num_muts, volume)
+
+    # Unpack the parameters
+    params = np.asarray(params, dtype=float)
+    nutrients_x, nutrients_y = params[-2:]
+    extra = params.shape[1:]
+    M, Mr, Mx, My, precursors = np.reshape(params[:-2], (5, num_muts) + extra)
+
+    # Compute the capacities, the allocation, and their derivatives
+    precursor_mass_frac = precursors / M
+    nutrient_x_conc = nutrients_x / (AVO * volume)
+    nutrient_y_conc = nutrients_y / (AVO * volume)
+    saturation_x = nutrient_x_conc / (nutrient_x_conc + Km_x)
+    dsaturation_x = Km_x / (nutrient_x_conc + Km_x)**2 / (AVO * volume)
+    gamma = gamma_max * precursor_mass_frac / (precursor_mass_frac + precursor_mass_ref)
+    dgamma_dfrac = gamma_max * precursor_mass_ref / (precursor_mass_frac + precursor_mass_ref)**2
+    nu_x = nu_x_max * saturation_x
+    nu_y = nu_y_max * nutrient_y_conc / (nutrient_y_conc + Km_y)
+    dnu_y = nu_y_max * Km_y / (nutrient_y_conc + Km_y)**2 / (AVO * volume)
+    phi_X = phi_x_max * saturation_x
+    phi_Y = phi_y_max * (1 - saturation_x)
+    dM_dt = gamma * Mr
+
+    # Derivatives of the growth rate dM_dt = gamma * Mr
+    dgrowth = np.zeros((5, num_muts) + extra)
+    dgrowth[0] = -Mr * dgamma_dfrac * precursors / M**2
+    dgrowth[1] = gamma
+    dgrowth[4] = Mr * dgamma_dfrac / M
+
+    # Fill the diagonals of the blocks of mutant terms
+    jac = np.zeros((5 * num_muts + 2, 5 * num_muts + 2) + extra)
+    idx = np.arange(num_muts)
+    _fill_blocks(jac, [1.0, phi_R, phi_X, phi_Y, -1.0], dgrowth, num_muts)
+    jac[4 * num_muts + idx, 2 * num_muts + idx] += nu_x
+    jac[4 * num_muts + idx, 3 * num_muts + idx] += nu_y
+
+    # The first nutrient sets the allocation of every mutant
+    jac[2 * num_muts + idx, -2] = phi_x_max * dsaturation_x * dM_dt
+    jac[3 * num_muts + idx, -2] = -phi_y_max * dsaturation_x * dM_dt
+
+    # The nutrients are consumed by, and limit, every mutant
+    jac[4 * num_muts + idx, -2] = Mx * nu_x_max * dsaturation_x
+    jac[4 * num_muts + idx, -1] = My * dnu_y
+    jac[-2, 2 * num_muts + idx] = -nu_x / omega_x
+    jac[-1, 3 * num_muts + idx] = -nu_y / omega_y
+    jac[-2, -2] = -_sequential_sum(Mx) * nu_x_max * dsaturation_x / omega_x
+    jac[-1, -1] = -_sequential_sum(My) * dnu_y / omega_y
+    return jac
+
+
+def _is_stacked(params, num_muts, *per_mutant):
+    """
+    Returns True if the parameters of a single model are laid out for 
+    mutants, i.e. each per-mutant quantity for every mutant before the 
+    next, which is so if there are several mutants or if any of the 
+    per-mutant arguments is an array, even of a single mutant.
+    """
+    return np.ndim(params) == 1 and (num_muts > 1 or 
+                                     any(np.ndim(a) > 0 for a in per_mutant))
+
+
+def _sequential_sum(x):
+    """
+    Sums over the mutants, the first axis, in order, as the compiled 
+    kernels do, rather than by the pairwise summation of `np.sum`.
+    """
+    return np.cumsum(x, axis=0)[-1]
+
+
+def _per_mutant(x, num_muts):
+    """
+    Broadcasts a scalar or per-mutant argument to a float array of length 
+    `num_muts` for the compiled kernels.
+    """
+    return np.array(np.broadcast_to(x, (num_muts,)), dtype=float)
+
+
+def _fill_blocks(jac, coefs, dgrowth, num_muts):
+    """
+    Fills the diagonals of the blocks of mutant terms of a Jacobian, where 
+    the derivative of the rth per-mutant ODE of each mutant with respect to 
+    its jth parameter is coefs[r] * dgrowth[j].
+    """
+    idx = np.arange(num_muts)
+    cols = np.arange(len(dgrowth))[:, np.newaxis] * num_muts + idx
+    for r, coef in enumerate(coefs):
+        jac[r * num_muts + idx, cols] = coef * dgrowth
+
+
+def _single_nutrient_loops(params, gamma_max, nu_max, precursor_mass_ref, Km, 
+                           omega, phi_R, phi_P, num_muts, volume):
+    """
+    `single_nutrient` for an array of parameters, written as loops over the 
+    mutants to be compiled by Numba.
+    """
+    AVO = 6.022E23
+    out = np.empty(4 * num_muts + 1)
+    nutrient_conc = params[-1] / (AVO * volume)
+    nu = nu_max * nutrient_conc / (nutrient_conc + Km)
+    dnutrients_dt = 0.0
+    for i in range(num_muts):
+        Mr = params[num_muts + i]
+        Mp = params[2 * num_muts + i]
+        precursor_mass_frac = params[3 * num_muts + i] / params[i]
+        gamma = gamma_max * precursor_mass_frac / (precursor_mass_frac + precursor_mass_ref)
+        dM_dt = gamma * Mr
+        out[i] = dM_dt
+        out[num_muts + i] = phi_R[i] * dM_dt
+        out[2 * num_muts + i] = phi_P[i] * dM_dt
+        out[3 * num_muts + i] = nu * Mp - dM_dt
+        dnutrients_dt += -nu * Mp / omega
+    out[-1] = dnutrients_dt
+    return out
+
+
+def _single_nutrient_jacobian_loops(params, gamma_max, nu_max, 
+                                    precursor_mass_ref, Km, omega, phi_R, 
+                                    phi_P, num_muts, volume):
+    """
+    `single_nutrient_jacobian` for an array of parameters, written as loops 
+    over the mutants to be compiled by Numba.
+    """
+    AVO = 6.022E23
+    jac = np.zeros((4 * num_muts + 1, 4 * num_muts + 1))
+    nutrient_conc = params[-1] / (AVO * volume)
+    nu = nu_max * nutrient_conc / (nutrient_conc + Km)
+    dnu_dnutrients = nu_max * Km / (nutrient_conc + Km)**2 / (AVO * volume)
+    dgrowth = np.zeros(4)
+    total_Mp = 0.0
+    for i in range(num_muts):
+        M = params[i]
+        Mr = params[num_muts + i]
+        Mp = params[2 * num_muts + i]
+        precursors = params[3 * num_muts + i]
+        precursor_mass_frac = precursors / M
+        gamma = gamma_max * precursor_mass_frac / (precursor_mass_frac + precursor_mass_ref)
+        dgamma_dfrac = gamma_max * precursor_mass_ref / (precursor_mass_frac + precursor_mass_ref)**2
+        dgrowth[0] = -Mr * dgamma_dfrac * precursors / M**2
+        dgrowth[1] = gamma
+        dgrowth[3] = Mr * dgamma_dfrac / M
+        for j in range(4):
+            jac[i, j * num_muts + i] = 1.0 * dgrowth[j]
+            jac[num_muts + i, j * num_muts + i] = phi_R[i] * dgrowth[j]
+            jac[2 * num_muts + i, j * num_muts + i] = phi_P[i] * dgrowth[j]
+            jac[3 * num_muts + i, j * num_muts + i] = -1.0 * dgrowth[j]
+        jac[3 * num_muts + i, 2 * num_muts + i] += nu
+        jac[3 * num_muts + i, -1] = Mp * dnu_dnutrients
+        jac[-1, 2 * num_muts + i] = -nu / omega
+        total_Mp += Mp
+    jac[-1, -1] = -total_Mp * dnu_dnutrients / omega
+    return jac
+
+
+def _diauxic_nutrient_loops(params, gamma_max, nu_x_max, nu_y_max, 
+                            precursor_mass_ref, Km_x, Km_y, omega_x, omega_y, 
+                            phi_R, phi_x_max, phi_y_max, num_muts, volume):
+    """
+    `diauxic_nutrient` for an array of parameters, written as loops over the 
+    mutants to be compiled by Numba.
+    """
+    AVO = 6.022E23
+    out = np.empty(5 * num_muts + 2)
+    nutrient_x_conc = params[-2] / (AVO * volume)
+    nutrient_y_conc = params[-1] / (AVO * volume)
+    saturation_x = nutrient_x_conc / (nutrient_x_conc + Km_x)
+    nu_x = nu_x_max * saturation_x
+    nu_y = nu_y_max * nutrient_y_conc / (nutrient_y_conc + Km_y)
+    dnutrients_x_dt = 0.0
+    dnutrients_y_dt = 0.0
+    for i in range(num_muts):
+        Mr = params[num_muts + i]
+        Mx = params[2 * num_muts + i]
+        My = params[3 * num_muts + i]
+        precursor_mass_frac = params[4 * num_muts + i] / params[i]
+        gamma = gamma_max * precursor_mass_frac / (precursor_mass_frac + precursor_mass_ref)
+        dM_dt = gamma * Mr
+        out[i] = dM_dt
+        out[num_muts + i] = phi_R[i] * dM_dt
+        out[2 * num_muts + i] = phi_x_max[i] * saturation_x * dM_dt
+        out[3 * num_muts + i] = phi_y_max[i] * (1 - saturation_x) * dM_dt
+        out[4 * num_muts + i] = nu_x * Mx + nu_y * My - dM_dt
+        dnutrients_x_dt += -nu_x * Mx / omega_x
+        dnutrients_y_dt += -nu_y * My / omega_y
+    out[-2] = dnutrients_x_dt
+    out[-1] = dnutrients_y_dt
+    return out
+
+
+def _diauxic_nutrient_jacobian_loops(params, gamma_max, nu_x_max, nu_y_max, 
+                                     precursor_mass_ref, Km_x, Km_y, omega_x, 
+                                     omega_y, phi_R, phi_x_max, phi_y_max, 
+                                     num_muts, volume):
+    """
+    `diauxic_nutrient_jacobian` for an array of parameters, written as loops 
+    over the mutants to be compiled by Numba.
+    """
+    AVO = 6.022E23
+    jac = np.zeros((5 * num_muts + 2, 5 * num_muts + 2))
+    nutrient_x_conc = params[-2] / (AVO * volume)
+    nutrient_y_conc = params[-1] / (AVO * volume)
+    saturation_x = nutrient_x_conc / (nutrient_x_conc + Km_x)
+    dsaturation_x = Km_x / (nutrient_x_conc + Km_x)**2 / (AVO * volume)
+    nu_x = nu_x_max * saturation_x
+    nu_y = nu_y_max * nutrient_y_conc / (nutrient_y_conc + Km_y)
+    dnu_y = nu_y_max * Km_y / (nutrient_y_conc + Km_y)**2 / (AVO * volume)
+    coefs = np.zeros(5)
+    dgrowth = np.zeros(5)
+    total_Mx = 0.0
+    total_My = 0.0
+    for i in range(num_muts):
+        M = params[i]
+        Mr = params[num_muts + i]
+        Mx = params[2 * num_muts + i]
+        My = params[3 * num_muts + i]
+        precursors = params[4 * num_muts + i]
+        precursor_mass_frac = precursors / M
+        gamma = gamma_max * precursor_mass_frac / (precursor_mass_frac + precursor_mass_ref)
+        dgamma_dfrac = gamma_max * precursor_mass_ref / (precursor_mass_frac + precursor_mass_ref)**2
+        dM_dt = gamma * Mr
+        dgrowth[0] = -Mr * dgamma_dfrac * precursors / M**2
+        dgrowth[1] = gamma
+        dgrowth[4] = Mr * dgamma_dfrac / M
+        coefs[0] = 1.0
+        coefs[1] = phi_R[i]
+        coefs[2] = phi_x_max[i] * saturation_x
+        coefs[3] = phi_y_max[i] * (1 - saturation_x)
+        coefs[4] = -1.0
+        for r in range(5):
+            for j in range(5):
+                jac[r * num_muts + i, j * num_muts + i] = coefs[r] * dgrowth[j]
+        jac[4 * num_muts + i, 2 * num_muts + i] += nu_x
+        jac[4 * num_muts + i, 3 * num_muts + i] += nu_y
+        jac[2 * num_muts + i, -2] = phi_x_max[i] * dsaturation_x * dM_dt
+        jac[3 * num_muts + i, -2] = -phi_y_max[i] * dsaturation_x * dM_dt
+        jac[4 * num_muts + i, -2] = Mx * nu_x_max * dsaturation_x
+        jac[4 * num_muts + i, -1] = My * dnu_y
+        jac[-2, 2 * num_muts + i] = -nu_x / omega_x
+        jac[-1, 3 * num_muts + i] = -nu_y / omega_y
+        total_Mx += Mx
+        total_My += My
+    jac[-2, -2] = -total_Mx * nu_x_max * dsaturation_x / omega_x
+    jac[-1, -1] = -total_My * dnu_y / omega_y
+    return jac
+
+
+if numba is not None:
+    _single_nutrient_kernel = numba.njit(cache=True)(_single_nutrient_loops)
+    _single_nutrient_jacobian_kernel = numba.njit(cache=True)(
+                                            _single_nutrient_jacobian_loops)
+    _diauxic_nutrient_kernel = numba.njit(cache=True)(_diauxic_nutrient_loops)
+    _diauxic_nutrient_jacobian_kernel = numba.njit(cache=True)(
+                                            _diauxic_nutrient_jacobian_loops)
+
+
+def nutrient_exhaustion(threshold, index=-1):
+    """
+    Defines an event for `dilution_cycle` which ends a growth cycle once 
+    the nutrients fall below a threshold.
+
+    Parameters
+    ----------
+    threshold : float
+        The nutrient level, in the units of the parameters, at which the 
+        cycle is ended.
+    index : int
+        The index of the nutrients in the parameters. Default is the last.
+
+    Returns
+    -------
+    event : function
+        The event, taking the same arguments as the integrated function.
+    """
+    def event(params, time, *args):
+        return params[index] - threshold
+    event.terminal = True
+    event.direction = -1
+    return event
+
+
+def mass_threshold(threshold, num_muts=1):
+    """
+    Defines an event for `dilution_cycle` which ends a growth cycle once 
+    the total protein mass of all mutants, the first `num_muts` parameters, 
+    exceeds a threshold, such as a target optical density. 
+
+    Parameters
+    ----------
+    threshold : float
+        The total protein mass at which the cycle is ended.
+    num_muts : int or None
+        The number of mutants. If `None`, it is taken from the last 
+        argument of the integrated function, as is needed by 
+        `compete_lineages` whose number of lineages changes between cycles.
+
+    Returns
+    -------
+    event : function
+        The event, taking the same arguments as the integrated function.
+    """
+    def event(params, time, *args):
+        n = args[-1] if num_muts is None else num_muts
+        return np.sum(params[:n]) - threshold
+    event.terminal = True
+    event.direction = 1
+    event.num_muts = num_muts
+    return event
+
+
+def _integrate_cycle(fun, fun_params, time, fun_args, jac, events, 
+                     int_kwargs):
+    """
+    Integrates a single growth cycle, returning the trajectory on `time`, 
+    the state at which the cycle ended, and the length of the cycle. Points 
+    of `time` after a terminal event are NaN.
+    """
+    if events is None:
+        if jac is not None:
+            int_kwargs = dict(int_kwargs, Dfun=jac)
+        out = scipy.integrate.odeint(fun, fun_params, time, args=fun_args,
+                                     **int_kwargs)
+        return out, out[-1], time[-1]
+
+    # solve_ivp expects the time first
+    def _wrap(f):
+        def _f(t, y, *args):
+            return f(y, t, *args)
+        _f.terminal = getattr(f, 'terminal', True)
+        _f.direction = getattr(f, 'direction', 0)
+        return _f
+    int_kwargs = dict({'method': 'LSODA', 'rtol': 1.49012E-8, 
+                       'atol': 1.49012E-8}, **int_kwargs)
+    if jac is not None:
+        int_kwargs['jac'] = _wrap(jac)
+    sol = scipy.integrate.solve_ivp(_wrap(fun), (time[0], time[-1]), 
+                                    fun_params, t_eval=time, args=fun_args,
+                                    events=[_wrap(e) for e in events], 
+                                    **int_kwargs)
+    if not sol.success:
+        raise RuntimeError(f'Integration failed: {sol.message}')
+    out = np.full((len(time), len(fun_params)), np.nan)
+    out[:len(sol.t)] = sol.y.T
+    if sol.status == 1:
+        # Stopped by a terminal event
+        for t_ev, y_ev in zip(sol.t_events, sol.y_events):
+            if len(t_ev):
+                return out, y_ev[0], t_ev[0]
+    return out, sol.y[:, -1], sol.t[-1]
+
+
+def iterate_dilutions(time, fun, fun_params, fun_args, nutrient_dict, 
+                      target_mass=1, num_dilutions=10, num_muts=1, jac=None, 
+                      events=None, ss_rtol=None, ss_atol=0, first_cycle=0, 
+                      start_time=0, previous_params=None, **int_kwargs):
+    """
+    Integrates a desired function with periodic dilutions, yielding each 
+    growth cycle as it is completed so that the cycles need not be held in 
+    memory. The arguments are those of `dilution_cycle`.
+
+    Parameters
+    ----------
+    first_cycle : int
+        The index of the first cycle to integrate, starting from 
+        `fun_params` without diluting them. Used with `start_time` and 
+        `previous_params` to resume a simulation from the `next_params` of 
+        a yielded cycle.
+    start_time : float
+        The total elapsed time at the start of the first cycle.
+    previous_params : 1d-array, optional
+        The parameters at the start of the cycle before the first, for the 
+        steady state check.
+
+    Yields
+    ------
+    cycle : dict
+        The `cycle` index; the integrated parameters `traj` and total 
+        elapsed `times` at each point of `time`, NaN after a terminal event; 
+        the `params` at the start of the cycle; and the diluted 
+        `next_params` and `next_time` at which the following cycle starts. 
+        The generator stops after `num_dilutions` dilutions, or once a 
+        periodic steady state is reached if `ss_rtol` is provided.
+    """
+    fun_params = np.array(fun_params, dtype=float)
+    stop_time = start_time
+    for n in range(first_cycle, num_dilutions + 1):
+        # Integrate the cycle
+        traj, end, cycle_time = _integrate_cycle(fun, fun_params, time, 
+                                                 fun_args, jac, events, 
+                                                 int_kwargs)
+        times = stop_time + time
+        times[np.isnan(traj[:, 0])] = np.nan
+        stop_time += cycle_time
+
+        # Compute the dilution factor and reset the parameters
+        dilution_factor = end[:num_muts].sum() / target_mass
+        next_params = end / dilution_factor
+        for k, v in nutrient_dict.items():
+            next_params[k] = np.squeeze(v)
+        yield {'cycle': n, 'traj': traj, 'times': times, 
+               'params': fun_params, 'next_params': next_params, 
+               'next_time': stop_time}
+
+        # Stop once successive cycles agree
+        if (ss_rtol is not None and previous_params is not None and 
+            np.all(np.abs(fun_params - previous_params) 
+                   <= ss_atol + ss_rtol * np.abs(previous_params))):
+            return
+        previous_params = fun_params
+        fun_params = next_params
+
+
 def dilution_cycle(time, fun, fun_params, fun_args, nutrient_dict, 
                    target_mass=1, num_dilutions=10,  
-                   colnames=None, num_muts=1, **int_kwargs):
+                   colnames=None, num_muts=1, jac=None, return_array=False,
+                   events=None, ss_rtol=None, ss_atol=0, **int_kwargs):
     """
     Integrates a desired function with periodic dilutions and returns a
     dataframe of the complete integration. 
 
     Parameters 
     -----------
-    ty
     time: numpy-array
         The time interval to integrate for a single growth cycle. This 
         time interval will be repeated for each dilution. 
@@ -130,65 +779,570 @@ def dilution_cycle(time, fun, fun_params, fun_args, nutrient_dict,
     colnames : list of str, optional
         The desired column names of the output. If `None`, columns will be 
         left arbitrarily named.
+    jac : function, optional
+        The Jacobian of `fun`, taking the same arguments, such as 
+        `single_nutrient_jacobian`. If provided, it is passed to the ODE 
+        solver as `Dfun` so that the stiff dynamics near nutrient 
+        exhaustion need fewer evaluations of `fun`.
+    return_array : bool
+        If True, the trajectories are returned as arrays rather than as a 
+        dataframe. See `tidy_dilution` for converting them to a long 
+        dataframe with one row per mutant and time point.
+    events : list of functions, optional
+        Terminal events, such as those from `nutrient_exhaustion` and 
+        `mass_threshold`, which end a growth cycle early. Each takes the 
+        same arguments as `fun` and the cycle ends, and the culture is 
+        diluted, when one crosses zero. If provided, the cycles are 
+        integrated with `scipy.integrate.solve_ivp` (LSODA by default) and 
+        the points of `time` after the end of a cycle are NaN.
+    ss_rtol, ss_atol : float, optional
+        If `ss_rtol` is provided, the integration stops early once the 
+        diluted state at the start of successive cycles agrees to within 
+        `ss_atol + ss_rtol * abs(state)`, i.e. once the dilutions have 
+        reached a periodic steady state.
     **int_kwargs: dict
         kwargs to be fed to the ODE solver.
+
+    Returns
+    -------
+    dil_df : pandas DataFrame
+        The integrated parameters, one row per time point, with the 
+        columns `dilution_cycle` and `time`. The index restarts from zero 
+        for each cycle. Returned if `return_array` is False.
+    traj : 3d-array, shape (num_cycles, len(time), len(fun_params))
+        The integrated parameters of each dilution cycle, where 
+        `num_cycles` is `num_dilutions + 1` unless a steady state was 
+        reached sooner. Returned if `return_array` is True.
+    times : 2d-array, shape (num_cycles, len(time))
+        The total elapsed time of each point in `traj`. Returned if 
+        `return_array` is True.
     """
 
     # TODO: Put in type checks.
 
-    # Perform the initial integration
-    out = scipy.integrate.odeint(fun, fun_params, time, args=fun_args,
-                                         **int_kwargs)
-    # Instantiate the dataframes
-    if colnames != None:
-        initial_df  = pd.DataFrame(out, columns=colnames)
+    # Preallocate the output for all cycles
+    time = np.asarray(time)
+    traj = np.empty((num_dilutions + 1, len(time), len(fun_params)))
+    times = np.empty((num_dilutions + 1, len(time)))
+
+    # Iterate through each dilution cycle.
+    cycles = iterate_dilutions(time, fun, fun_params, fun_args, nutrient_dict, 
+                               target_mass=target_mass, 
+                               num_dilutions=num_dilutions, num_muts=num_muts, 
+                               jac=jac, events=events, ss_rtol=ss_rtol, 
+                               ss_atol=ss_atol, **int_kwargs)
+    for cycle in tqdm.tqdm(cycles, total=num_dilutions + 1):
+        n = cycle['cycle']
+        traj[n] = cycle['traj']
+        times[n] = cycle['times']
+    num_cycles = n + 1
+    traj = traj[:num_cycles]
+    times = times[:num_cycles]
+
+    if return_array:
+        return traj, times
+
+    # Assemble the dataframe in a single pass, indexed by the position 
+    # within each cycle as when the cycles were concatenated
+    dil_df = pd.DataFrame(traj.reshape(-1, traj.shape[-1]), columns=colnames,
+                          index=np.tile(np.arange(len(time)), num_cycles))
+    dil_df['dilution_cycle'] = np.repeat(np.arange(num_cycles), len(time))
+    dil_df['time'] = times.ravel()
+    return dil_df
+
+
+def tidy_dilution(traj, times, colnames, shared_colnames=None, num_muts=1):
+    """
+    Converts the trajectories of `dilution_cycle` into a long dataframe 
+    with one row per dilution cycle, time point, and mutant. 
+
+    Parameters
+    ----------
+    traj : 3d-array, shape (num_cycles, num_timepoints, num_params)
+        The integrated parameters returned by `dilution_cycle` with 
+        `return_array=True`. The parameters are assumed to be laid out as 
+        for `single_nutrient`, i.e. each per-mutant quantity is stored for 
+        all mutants before the next, followed by the shared quantities.
+    times : 2d-array, shape (num_cycles, num_timepoints)
+        The total elapsed time of each point in `traj`.
+    colnames : list of str
+        The names of the per-mutant quantities, in order. 
+    shared_colnames : list of str, optional
+        The names of the quantities shared by all mutants, such as the 
+        nutrients, which follow the per-mutant quantities. These are 
+        repeated for each mutant. If `None`, they are dropped.
+    num_muts : int
+        The number of mutants.
+
+    Returns
+    -------
+    tidy_df : pandas DataFrame
+        The trajectories with the columns `dilution_cycle`, `time`, `idx` 
+        (the mutant index), and one column per name in `colnames` and 
+        `shared_colnames`. 
+    """
+    num_cycles, num_timepoints, num_params = np.shape(traj)
+    num_quantities = len(colnames)
+    num_rows = num_cycles * num_timepoints * num_muts
+
+    # Move the mutant axis ahead of the quantity axis
+    unique = np.reshape(traj[..., :num_quantities * num_muts], 
+                        (num_cycles, num_timepoints, num_quantities, num_muts))
+    unique = np.swapaxes(unique, 2, 3).reshape(num_rows, num_quantities)
+    tidy_df = pd.DataFrame(unique, columns=colnames)
+
+    # Repeat the shared quantities for each mutant
+    if shared_colnames is not None:
+        shared = traj[..., num_quantities * num_muts:]
+        shared = np.repeat(shared.reshape(-1, shared.shape[-1]), num_muts, 
+                           axis=0)
+        for i, name in enumerate(shared_colnames):
+            tidy_df[name] = shared[:, i]
+
+    tidy_df.insert(0, 'idx', np.tile(np.arange(num_muts), 
+                                     num_cycles * num_timepoints))
+    tidy_df.insert(0, 'time', np.repeat(np.ravel(times), num_muts))
+    tidy_df.insert(0, 'dilution_cycle', 
+                   np.repeat(np.arange(num_cycles), num_timepoints * num_muts))
+    return tidy_df
+
+
+def stream_dilutions(directory, time, fun, fun_params, fun_args, nutrient_dict, 
+                     thin=1, resume=True, **kwargs):
+    """
+    Integrates a desired function with periodic dilutions, writing each 
+    growth cycle to disk as it is completed together with a checkpoint from 
+    which an interrupted simulation can be resumed. Memory use does not 
+    grow with the number of cycles.
+
+    Parameters
+    ----------
+    directory : str
+        The directory in which to write the cycles, as `cycle_000000.npz`, 
+        etc., and the checkpoint, `checkpoint.npz`. It is created if it 
+        does not exist.
+    time, fun, fun_params, fun_args, nutrient_dict
+        The arguments of `dilution_cycle`.
+    thin : int
+        Only every `thin`th point of `time` is written for each cycle.
+    resume : bool
+        If True and `directory` holds a checkpoint, the simulation continues 
+        from the last completed cycle, ignoring `fun_params`. Otherwise it 
+        starts from `fun_params`, removing any earlier cycles and checkpoint.
+    **kwargs : dict
+        Further arguments of `dilution_cycle`, such as `num_dilutions`, 
+        `target_mass`, `num_muts`, `jac`, `events`, and `ss_rtol`, and 
+        kwargs to be fed to the ODE solver.
+
+    Returns
+    -------
+    num_cycles : int
+        The total number of cycles written to `directory`, including those 
+        of earlier runs that were resumed. Load them with `load_dilutions`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    checkpoint = os.path.join(directory, 'checkpoint.npz')
+    start = {}
+    if resume and os.path.exists(checkpoint):
+        with np.load(checkpoint) as data:
+            if data['converged']:
+                return int(data['first_cycle'])
+            start = {'fun_params': data['fun_params'], 
+                     'first_cycle': int(data['first_cycle']),
+                     'start_time': float(data['start_time']),
+                     'previous_params': data['previous_params']}
     else:
-        initial_df = pd.DataFrame(out)
+        # Remove the earlier run, including its checkpoint so that it is 
+        # not resumed if this run is interrupted before its first cycle
+        for fname in glob.glob(os.path.join(directory, 'cycle_*.npz')):
+            os.remove(fname)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    kwargs = dict(kwargs, **start)
+    kwargs.setdefault('fun_params', fun_params)
+    kwargs.setdefault('num_dilutions', 10)
 
-    # Specify that this is the inaugural integration
-    initial_df['dilution_cycle'] = 0
+    n = kwargs.get('first_cycle', 0) - 1
+    for cycle in tqdm.tqdm(iterate_dilutions(time, fun, fun_args=fun_args, 
+                                             nutrient_dict=nutrient_dict, 
+                                             **kwargs),
+                           total=kwargs['num_dilutions'] + 1, 
+                           initial=n + 1):
+        n = cycle['cycle']
+        np.savez(os.path.join(directory, f'cycle_{n:06d}.npz'), 
+                 traj=cycle['traj'][::thin], times=cycle['times'][::thin])
 
-    # Keep track of the time 
-    initial_df['time'] = time
+        # Write the checkpoint atomically so it is never left incomplete
+        _checkpoint = os.path.join(directory, 'checkpoint_tmp.npz')
+        np.savez(_checkpoint, fun_params=cycle['next_params'], 
+                 first_cycle=n + 1, start_time=cycle['next_time'], 
+                 previous_params=cycle['params'], converged=False)
+        os.replace(_checkpoint, checkpoint)
 
-    stop_time = time[-1]
-    
-    # Add to the storage list
-    dfs = [initial_df]
+    # Record whether the run stopped at a steady state
+    if n < kwargs['num_dilutions']:
+        with np.load(checkpoint) as data:
+            data = dict(data)
+        data['converged'] = True
+        np.savez(os.path.join(directory, 'checkpoint_tmp.npz'), **data)
+        os.replace(os.path.join(directory, 'checkpoint_tmp.npz'), checkpoint)
+    return n + 1
 
 
+def load_dilutions(directory, cycles=None):
+    """
+    Loads the growth cycles written by `stream_dilutions`.
 
-    # Iterate through each dilution cycle.
-    for n in tqdm.tqdm(range(num_dilutions)):
-        # Compute the dilution factor if not specified 
-        dilution_factor = out[-1, :num_muts].sum() / target_mass
+    Parameters
+    ----------
+    directory : str
+        The directory to which the cycles were written.
+    cycles : list of int, optional
+        The indices of the cycles to load. If `None`, all cycles are 
+        loaded.
+
+    Returns
+    -------
+    traj : 3d-array, shape (num_cycles, num_timepoints, num_params)
+        The integrated parameters of each cycle, as returned by 
+        `dilution_cycle` with `return_array=True`.
+    times : 2d-array, shape (num_cycles, num_timepoints)
+        The total elapsed time of each point in `traj`.
+    """
+    if cycles is None:
+        fnames = sorted(glob.glob(os.path.join(directory, 'cycle_*.npz')))
+    else:
+        fnames = [os.path.join(directory, f'cycle_{n:06d}.npz') for n in cycles]
+    trajs, times = [], []
+    for fname in fnames:
+        with np.load(fname) as data:
+            trajs.append(data['traj'])
+            times.append(data['times'])
+    return np.stack(trajs), np.stack(times)
+
+
+def compete_lineages(time, fun, fun_params, fun_args, nutrient_dict, 
+                     lineage_args, sample_mutant, mutation_rate=1, 
+                     founder_fraction=1E-3, extinction_mass=0, 
+                     num_dilutions=100, target_mass=1, num_muts=1, 
+                     num_shared=1, jac=None, events=None, colnames=None, 
+                     seed=None, **int_kwargs):
+    """
+    Simulates competing lineages over periodic dilutions, introducing new 
+    mutants at each dilution and removing lineages which go extinct. 
+
+    Parameters
+    ----------
+    time: numpy-array
+        The time interval to integrate for a single growth cycle. 
+    fun: function
+        The function you wish to integrate, such as `single_nutrient` or 
+        `diauxic_nutrient`. It is called as `fun(params, time, *fun_args, 
+        num_lineages)` with the parameters laid out as for the mutants of 
+        these functions, i.e. each per-lineage quantity for every lineage 
+        before the next, followed by `num_shared` shared quantities.
+    fun_params : list
+        The initial parameters of the `num_muts` founding lineages. 
+    fun_args : tuple
+        Arguments to feed the integration function, excluding the number 
+        of lineages.
+    nutrient_dict : dict
+        As for `dilution_cycle`, but the keys must be negative indices of 
+        the shared quantities.
+    lineage_args : dict
+        The names and indices in `fun_args` of the arguments which differ 
+        between lineages, such as `{'phi_R': 5, 'phi_P': 6}` for 
+        `single_nutrient`. Their values in `fun_args` are those of the 
+        founding lineages.
+    sample_mutant : function
+        Samples the arguments of new mutants as `sample_mutant(rng, values)`,
+        where `rng` is a `numpy.random.Generator` and `values` is a 2d-array 
+        with a row for each of `lineage_args` and a column for the parent 
+        of each new mutant. It must return an array of the same shape.
+    mutation_rate : float
+        The expected number of new mutants introduced at each dilution. 
+        Parents are drawn in proportion to their protein mass.
+    founder_fraction : float
+        The fraction of the parent's parameters given to a new mutant.
+    extinction_mass : float
+        Lineages whose protein mass falls below this after a dilution, such 
+        as the mass of a single cell, are removed.
+    num_dilutions : int 
+        The number of dilution cycles that should be performed
+    target_mass : float
+        The total protein mass after each dilution. 
+    num_muts : int
+        The number of founding lineages.
+    num_shared : int
+        The number of shared quantities, e.g. 1 for `single_nutrient` and 
+        2 for `diauxic_nutrient`.
+    jac : function, optional
+        As for `dilution_cycle`.
+    events : list of functions, optional
+        As for `dilution_cycle`, but called with the current number of 
+        lineages as their last argument, like `fun`. Events which fix the 
+        number of mutants when built are rejected: use 
+        `mass_threshold(threshold, num_muts=None)`.
+    colnames : list of str, optional
+        The names of the per-lineage quantities. If `None`, they are named 
+        by their position.
+    seed : int, optional
+        The seed of the random number generator.
+    **int_kwargs: dict
+        kwargs to be fed to the ODE solver.
+
+    Returns
+    -------
+    abundance_df : pandas DataFrame
+        The per-lineage quantities at the end of each growth cycle, before 
+        dilution, with the columns `dilution_cycle`, `time`, and `lineage`.
+    lineage_df : pandas DataFrame
+        The `lineage`, its `parent` (-1 for founders), the `birth_cycle` 
+        and `extinction_cycle` (-1 for surviving lineages), and the values 
+        of `lineage_args` for every lineage.
+
+    Notes
+    -----
+    The active lineages are held as arrays of shape (num_quantities, 
+    num_lineages), which are compacted on extinction and extended on 
+    introduction, so the cost of each dilution does not depend on the 
+    number of lineages which have come and gone.
+    """
+    if any(getattr(e, 'num_muts', None) is not None for e in events or []):
+        raise ValueError('The events of compete_lineages must take the number '
+                         'of lineages from their arguments, e.g. '
+                         'mass_threshold(threshold, num_muts=None).')
+    rng = np.random.default_rng(seed)
+    time = np.asarray(time)
+    fun_params = np.array(fun_params, dtype=float)
+    num_quantities = (len(fun_params) - num_shared) // num_muts
+    if colnames is None:
+        colnames = [str(q) for q in range(num_quantities)]
 
-        # Reset the parameters
-        fun_params = list(out[-1, :] / dilution_factor)
+    # Set up the compact arrays of the active lineages
+    state = np.reshape(fun_params[:-num_shared], (num_quantities, num_muts))
+    shared = fun_params[-num_shared:]
+    values = np.array([np.broadcast_to(np.asarray(fun_args[i], dtype=float), 
+                                       (num_muts,)) 
+                       for i in lineage_args.values()]).reshape(-1, num_muts)
+    ids = np.arange(num_muts)
 
+    # Set up the records of every lineage
+    parents = [np.full(num_muts, -1)]
+    births = [np.zeros(num_muts, dtype=int)]
+    all_values = [values]
+    extinctions = {}
+    records = []
+    stop_time = 0
+    args = list(fun_args)
+
+    for n in tqdm.tqdm(range(num_dilutions + 1)):
+        # Integrate the cycle for the active lineages
+        num_lineages = len(ids)
+        for j, i in enumerate(lineage_args.values()):
+            args[i] = values[j]
+        params = np.concatenate([state.ravel(), shared])
+        _, end, cycle_time = _integrate_cycle(fun, params, time, 
+                                              tuple(args) + (num_lineages,), 
+                                              jac, events, int_kwargs)
+        stop_time += cycle_time
+        state = np.reshape(end[:-num_shared], (num_quantities, num_lineages))
+        records.append((n, stop_time, ids, state))
+        if n == num_dilutions:
+            break
+
+        # Dilute and reset the nutrients
+        dilution_factor = state[0].sum() / target_mass
+        state = state / dilution_factor
+        shared = end[-num_shared:] / dilution_factor
         for k, v in nutrient_dict.items():
-            fun_params[k] = v
-        
-        # Rerun the integration
-        out = scipy.integrate.odeint(fun, fun_params, time, args=fun_args,
-                                         **int_kwargs)
+            shared[k] = np.squeeze(v)
 
-        # Set up the dataframe 
-        if colnames != None:
-            _df = pd.DataFrame(out, columns=colnames)
-        else:
-            _df = pd.DataFrame(out)
+        # Remove the extinct lineages
+        alive = state[0] >= extinction_mass
+        extinctions.update(dict.fromkeys(ids[~alive], n + 1))
+        state, values, ids = state[:, alive], values[:, alive], ids[alive]
+        if len(ids) == 0:
+            break
 
-        # Update time and keep track of the dilution cycle
-        _df['time'] = stop_time + time
-        _df['dilution_cycle'] = n + 1
+        # Introduce new mutants, splitting them from their parents
+        num_new = rng.poisson(mutation_rate)
+        if num_new > 0:
+            mass = state[0]
+            _parents = rng.choice(len(ids), num_new, p=mass / mass.sum())
+            founders = founder_fraction * state[:, _parents]
+            state = state * (1 - founder_fraction * 
+                             np.bincount(_parents, minlength=len(ids)))
+            new_values = np.reshape(sample_mutant(rng, values[:, _parents]), 
+                                    (len(values), num_new))
+            new_ids = len(np.concatenate(births)) + np.arange(num_new)
+            parents.append(ids[_parents])
+            births.append(np.full(num_new, n + 1))
+            all_values.append(new_values)
+            state = np.concatenate([state, founders], axis=1)
+            values = np.concatenate([values, new_values], axis=1)
+            ids = np.concatenate([ids, new_ids])
 
-        # Add the dataframe to the storage list
-        dfs.append(_df)
-        
-        # Update the stoptime
-        stop_time += time[-1]
+    # Assemble the records
+    cycles, stop_times, lineages, states = zip(*records)
+    sizes = [len(l) for l in lineages]
+    abundance_df = pd.DataFrame(np.concatenate(states, axis=1).T, 
+                                columns=colnames)
+    abundance_df.insert(0, 'lineage', np.concatenate(lineages))
+    abundance_df.insert(0, 'time', np.repeat(stop_times, sizes))
+    abundance_df.insert(0, 'dilution_cycle', np.repeat(cycles, sizes))
 
-    # Concatenate the dataframes and return
-    dil_df = pd.concat(dfs)
-    return  dil_df
+    lineage_df = pd.DataFrame(np.concatenate(all_values, axis=1).T, 
+                              columns=list(lineage_args))
+    lineage_df.insert(0, 'extinction_cycle', -1)
+    lineage_df.insert(0, 'birth_cycle', np.concatenate(births))
+    lineage_df.insert(0, 'parent', np.concatenate(parents))
+    lineage_df.insert(0, 'lineage', np.arange(len(lineage_df)))
+    lineage_df.loc[list(extinctions), 'extinction_cycle'] = list(extinctions.values())
+    return abundance_df, lineage_df
+
+
+def _vectorize(fun, num_models, num_params, args):
+    """
+    Wraps a function of the parameters of independent models, stacked as 
+    rows, for the flattened state used by odeint.
+    """
+    def _fun(y, time, *_args):
+        out = fun(np.reshape(y, (num_models, num_params)).T, time, *args)
+        return np.stack(np.broadcast_arrays(*out), axis=-1).ravel()
+    return _fun
+
+
+def _vectorize_jacobian(jac, num_models, num_params, args):
+    """
+    Wraps the Jacobian of independent models, stacked along a trailing 
+    axis, as the banded Jacobian of the flattened state expected by odeint 
+    with `ml = mu = num_params - 1`.
+    """
+    i, j = np.meshgrid(np.arange(num_params), np.arange(num_params), 
+                       indexing='ij')
+    rows = (i - j + num_params - 1)[..., np.newaxis]
+    cols = np.arange(num_models) * num_params + j[..., np.newaxis]
+    def _jac(y, time, *_args):
+        _j = jac(np.reshape(y, (num_models, num_params)).T, time, *args)
+        banded = np.zeros((2 * num_params - 1, num_models * num_params))
+        banded[rows, cols] = np.broadcast_to(_j, (num_params, num_params, 
+                                                  num_models))
+        return banded
+    return _jac
+
+
+def _integrate_models(fun, params, time, args, jac, int_kwargs):
+    """
+    Integrates stacked independent models together, with a block diagonal 
+    Jacobian.
+    """
+    num_models, num_params = params.shape
+    _fun = _vectorize(fun, num_models, num_params, args)
+
+    # The stacked models share steps, so allow more steps per output time
+    int_kwargs = dict({'mxstep': 500 * num_models}, **int_kwargs)
+    if jac is not None:
+        int_kwargs = dict(int_kwargs, 
+                    Dfun=_vectorize_jacobian(jac, num_models, num_params, args))
+    out = scipy.integrate.odeint(_fun, params.ravel(), time, 
+                                 ml=num_params - 1, mu=num_params - 1,
+                                 **int_kwargs)
+    return np.reshape(out, (len(time), num_models, num_params)).swapaxes(0, 1)
+
+
+def integrate_sweep(fun, params, time, args=(), jac=None, chunksize=100, 
+                    processes=None, varied=None, **int_kwargs):
+    """
+    Integrates many independent copies of a model with different parameters 
+    together, such as for a sweep over a grid of growth parameters.
+
+    Parameters
+    ----------
+    fun : function
+        The ODEs of a single model, such as `single_nutrient`, with the 
+        signature `fun(params, time, *args)`. It must accept `params` as 
+        a 2d-array of shape (num_params, K) and the arguments as arrays of 
+        length K, i.e. be written with element-wise operations, and return 
+        a list of the num_params derivatives. 
+    params : 2d-array, shape (K, num_params), or 1d-array
+        The initial values of the parameters for each of the K models. A 
+        1d-array is used for all models.
+    time : numpy-array
+        The time points at which to evaluate the integration. 
+    args : tuple
+        The arguments of `fun`. Unless `varied` is given, every 1d-array 
+        is varied across the models and must have length K; all other 
+        arguments are shared by every model.
+    jac : function, optional
+        The Jacobian of `fun`, such as `single_nutrient_jacobian`, which 
+        must return a 3d-array of shape (num_params, num_params, K) for 
+        stacked parameters. If `None`, odeint approximates the Jacobian 
+        from 2 * num_params - 1 evaluations of the stacked ODEs.
+    chunksize : int, optional
+        The number of models to integrate together. Larger chunks spend 
+        less time in Python, but every model in a chunk takes the steps 
+        required by the stiffest one. If `None`, all models are integrated 
+        together.
+    processes : int, optional
+        If provided, the chunks are integrated in parallel with a pool of 
+        this many processes. `fun` and `jac` must then be importable, i.e. 
+        defined at the top level of a module.
+    varied : list of int, optional
+        The indices of the arguments in `args` that are varied across the 
+        models, each an array of length K. All other arguments, including 
+        arrays, are shared by every model.
+    **int_kwargs : dict
+        kwargs to be fed to `scipy.integrate.odeint`.
+
+    Returns
+    -------
+    traj : 3d-array, shape (K, len(time), num_params)
+        The integrated parameters of each model.
+
+    Raises
+    ------
+    ValueError
+        If the varied arguments and `params` do not all have the same 
+        number of models K.
+
+    Notes
+    -----
+    The models are stacked so that the parameters of each are contiguous 
+    in the state passed to the solver. The Jacobian of the stacked system 
+    is then block diagonal and is passed to odeint as a banded matrix, 
+    which keeps the cost of each implicit step linear in K.
+    """
+    # Determine the number of models from the varied arguments
+    if varied is None:
+        varied = [i for i, a in enumerate(args) if np.ndim(a) == 1]
+    varied = [i in varied for i in range(len(args))]
+    lengths = {f'args[{i}]': len(a) 
+               for i, (a, v) in enumerate(zip(args, varied)) if v}
+    if np.ndim(params) == 2:
+        lengths['params'] = len(params)
+    if len(set(lengths.values())) > 1:
+        raise ValueError('The varied arguments and params must all describe '
+                         'the same number of models, but have lengths '
+                         f'{lengths}.')
+    num_models = max(list(lengths.values()) + [1])
+    params = np.array(np.broadcast_to(params, 
+                                      (num_models, np.shape(params)[-1])),
+                      dtype=float)
+
+    # Split the models into chunks
+    if chunksize is None:
+        chunksize = num_models
+    chunks = [(fun, params[b:b + chunksize], time, 
+               tuple(np.asarray(a)[b:b + chunksize] if v else a 
+                     for a, v in zip(args, varied)), jac, int_kwargs) 
+              for b in range(0, num_models, chunksize)]
+
+    if processes is None:
+        trajs = [_integrate_models(*chunk) for chunk in 
+                 tqdm.tqdm(chunks, disable=len(chunks) == 1)]
+    else:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            trajs = list(pool.map(_integrate_models, *zip(*chunks)))
+    return np.concatenate(trajs)
@@ -15,6 +15,7 @@ setup(
     ],
     author="Griffin Chure",
     author_email="griffinchure@gmail.com",
+    packages=find_packages(include=["diaux", "diaux.*"]),
     include_package_data=True,
     package_data={"ecoli_gene_dict":["package_data/coli_gene_dict.pkl"]},
     zip_safe=False,
@@ -0,0 +1,220 @@
+import numpy as np
+import pytest
+from diaux import fitderiv as fd
+
+
+def twophase(n= 80, tmax= 16, noise= 0.05, seed= 0):
+    '''
+    Returns a noisy diauxic curve: growth at rate 0.6 until t= 6, no growth until t= 9, and growth at rate 0.3 until t= 14.
+    '''
+    rng= np.random.default_rng(seed)
+    t= np.linspace(0, tmax, n)
+    tt= np.linspace(0, tmax, 4001)
+    s= lambda x: 1/(1 + np.exp(-x/0.3))
+    rate= 0.6*(1 - s(tt - 6)) + 0.3*s(tt - 9)*(1 - s(tt - 14))
+    lf= np.log(0.01) + np.concatenate([[0], np.cumsum((rate[1:] + rate[:-1])/2*np.diff(tt))])
+    return t, np.exp(np.interp(t, tt, lf) + noise*rng.standard_normal(n))
+
+
+@pytest.mark.parametrize('noise, seed', [(0.05, 0), (0.1, 4)])
+def test_diauxicstats_finds_second_phase(noise, seed):
+    t, y= twophase(noise= noise, seed= seed)
+    q= fd.fitderiv(t, y, quiet= True, stats= False, seed= 0)
+    fs, gs, hs= q.sample(200, rng= 1)
+    g1, t1, g2, t2, tshift, lag= fd._diauxicstats(np.asarray(q.t), fs, gs)
+    assert np.mean(np.isfinite(t2)) > 0.9
+    assert np.all((np.nanpercentile(t2, [10, 50, 90]) > 9) & (np.nanpercentile(t2, [10, 50, 90]) < 14))
+    assert np.all(t1[np.isfinite(t1)] < 6)
+    assert 5 < np.nanmedian(tshift) < 10
+    assert np.nanmedian(g2) == pytest.approx(0.3, abs= 0.1)
+
+
+def test_diauxicstats_single_phase():
+    t= np.linspace(0, 24, 100)
+    rng= np.random.default_rng(0)
+    od= 0.01*np.exp(0.6*t)/(1 + 0.01*(np.exp(0.6*t) - 1))
+    q= fd.fitderiv(t, od*np.exp(0.05*rng.standard_normal(len(t))), quiet= True, stats= False, seed= 0)
+    fs, gs, hs= q.sample(200, rng= 1)
+    t2= fd._diauxicstats(np.asarray(q.t), fs, gs)[3]
+    assert np.mean(np.isfinite(t2)) < 0.1
+
+
+def test_results_are_logged(caplog, capsys):
+    t= np.linspace(0, 24, 60)
+    od= 0.01*np.exp(0.6*t)/(1 + 0.01*(np.exp(0.6*t) - 1))
+    with caplog.at_level('INFO', logger= 'diaux'):
+        fd.fitderiv(t, od, seed= 0, nosamples= 50)
+    assert capsys.readouterr().out == ''
+    messages= [r.getMessage() for r in caplog.records]
+    assert any(m.startswith('log(max likelihood)=') for m in messages)
+    assert any(m.strip().startswith('max df=') for m in messages)
+
+
+@pytest.mark.parametrize('factor', [False, True])
+def test_save_load_round_trip(tmp_path, factor):
+    t, y= twophase(n= 40)
+    q= fd.fitderiv(t, y, quiet= True, seed= 0, nosamples= 50)
+    fname= str(tmp_path/'fit.npz')
+    q.save(fname, factor= factor)
+    ql= fd.load(fname)
+    for attr in ['t', 'd', 'f', 'fvar', 'df', 'dfvar', 'ddf', 'ddfvar', 'lth']:
+        assert np.allclose(getattr(ql, attr), getattr(q, attr), rtol= 1e-12, atol= 0), attr
+    assert ql.logmaxlike == q.logmaxlike and ql.cvfn == q.cvfn
+    assert ql.ds == pytest.approx(q.ds)
+    assert ql.fitrecord.keys() == q.fitrecord.keys()
+    # samples drawn after reloading match those of the original fit
+    for s, sl in zip(q.sample(5, rng= 2), ql.sample(5, rng= 2)):
+        assert np.allclose(sl, s, rtol= 1e-8, atol= 1e-10)
+
+
+def makeplate(rates= (0.4, 0.5, 0.6), seed= 0):
+    '''
+    Returns a tidy dataframe of noisy logistic growth curves, one well for each rate, with points missing from the last well.
+    '''
+    import pandas as pd
+    rng= np.random.default_rng(seed)
+    t= np.linspace(0, 20, 40)
+    dfs= []
+    for i, r in enumerate(rates):
+        od= 0.01*np.exp(r*t)/(1 + 0.01*(np.exp(r*t) - 1))*np.exp(0.03*rng.standard_normal(len(t)))
+        dfs.append(pd.DataFrame({'well': 'A' + str(i + 1), 'time': t, 'od': od}))
+    dfs[-1]= dfs[-1].drop(index= [5, 17, 18, 30])
+    return pd.concat(dfs, ignore_index= True), t
+
+
+def test_fitplate():
+    plate, t= makeplate()
+    fits, recs= fd.fitplate(plate, records= True, seed= 0, nosamples= 50)
+    assert list(fits.groupby('well').size()) == [len(t)]*3
+    # the well with missing points is predicted on the shared grid
+    last= fits[fits['well'] == 'A3']
+    assert np.array_equal(last['time'].values, t) and np.all(np.isfinite(last['f']))
+    # the statistics of each well are merged onto its fits
+    assert np.all(fits.groupby('well')['max df'].nunique() == 1)
+    assert np.all(np.diff(fits.groupby('well')['max df'].first().values) > 0)
+    assert list(recs['well']) == ['A1', 'A2', 'A3'] and 'nlml' in recs.columns
+    # fitting wells concurrently gives the same result
+    pfits= fd.fitplate(plate, nojobs= 2, seed= 0, nosamples= 50)
+    assert np.allclose(pfits.drop(columns= 'well').values, fits.drop(columns= 'well').values, rtol= 1e-10,
+                       atol= 0, equal_nan= True)
+
+
+def test_hyperparametercache_round_trip(tmp_path):
+    fname= str(tmp_path/'hp.json')
+    cache= fd.hyperparametercache(fname)
+    assert cache.get('sqexp', 'glucose') is None
+    cache.update('sqexp', 'glucose', None, [1.0, 2.0, -3.0])
+    cache.update('sqexp', 'glucose', None, [3.0, 0.0, -5.0])
+    cache.update('matern', None, 'reader', [0.5, 0.5, -4.0])
+    assert np.allclose(cache.get('sqexp', 'glucose'), [2.0, 1.0, -4.0])
+    # a fit with a different number of hyperparameters replaces the entry
+    cache.update('matern', None, 'reader', [0.5, 0.5, 0.5, -4.0])
+    assert len(cache.get('matern', instrument= 'reader')) == 4
+    cache.save()
+    reloaded= fd.hyperparametercache(fname)
+    assert reloaded.entries.keys() == cache.entries.keys()
+    for key in cache.entries:
+        assert np.array_equal(reloaded.entries[key][0], cache.entries[key][0])
+        assert reloaded.entries[key][1] == cache.entries[key][1]
+    with pytest.raises(ValueError):
+        fd.hyperparametercache().save()
+
+
+def test_warm_start_clips_to_bounds(monkeypatch):
+    t, y= twophase(n= 40)
+    # cached values outside the default bounds of the first two hyperparameters
+    cached= np.log(10.0)*np.array([10.0, -10.0, -1.0])
+    cache= fd.hyperparametercache()
+    cache.update('sqexp', None, None, cached)
+    stvals= []
+    findhyperparameters= fd.gp.gaussianprocess.findhyperparameters
+    def spy(self, *args, **kwargs):
+        stvals.append(kwargs.get('stvals'))
+        return findhyperparameters(self, *args, **kwargs)
+    monkeypatch.setattr(fd.gp.gaussianprocess, 'findhyperparameters', spy)
+    q= fd.fitderiv(t, y, hpcache= cache, quiet= True, stats= False, seed= 0)
+    b= np.array(q.g.b)*np.log(10)
+    assert q.fitrecord['warmstart'] and len(stvals) == 1
+    assert np.allclose(stvals[0], np.clip(cached, b[:,0], b[:,1]))
+    assert not np.allclose(stvals[0], cached)
+    assert np.all((q.lth >= b[:,0]) & (q.lth <= b[:,1]))
+
+
+def test_warm_start_falls_back_to_random_restarts(monkeypatch, caplog):
+    t, y= twophase(n= 40)
+    cache= fd.hyperparametercache()
+    cache.update('sqexp', None, None, [1.0, 0.0, -3.0])
+    findhyperparameters= fd.gp.gaussianprocess.findhyperparameters
+    def failwarm(self, *args, **kwargs):
+        if np.any(kwargs.get('stvals', False)):
+            raise fd.gp.gaussianprocessException('failed')
+        return findhyperparameters(self, *args, **kwargs)
+    monkeypatch.setattr(fd.gp.gaussianprocess, 'findhyperparameters', failwarm)
+    q= fd.fitderiv(t, y, hpcache= cache, quiet= True, stats= False, seed= 0)
+    assert not q.fitrecord['warmstart']
+    assert 'Warm start failed' in caplog.text
+    cold= fd.fitderiv(t, y, quiet= True, stats= False, seed= 0)
+    assert np.array_equal(q.lth, cold.lth)
+    # the cache is updated with the result of the random restarts
+    assert cache.entries[('sqexp', None, None)][1] == 2
+
+
+def test_fitplate_merges_worker_caches():
+    plate, t= makeplate()
+    cache= fd.hyperparametercache()
+    fd.fitplate(plate, nojobs= 2, hpcache= cache, seed= 0, stats= False)
+    # each worker fit from an empty copy of the cache, as a fit without one
+    wide= plate.pivot(index= 'time', columns= 'well', values= 'od')
+    lths= [fd.fitderiv(t, wide[w].values, quiet= True, stats= False, seed= 0).lth for w in wide.columns]
+    mlth, nofits= cache.entries[('sqexp', None, None)]
+    assert nofits == 3
+    assert np.allclose(mlth, np.mean(lths, 0), rtol= 1e-10)
+
+
+def test_batch_fit():
+    rng= np.random.default_rng(0)
+    t= np.linspace(0, 20, 40)
+    od= 0.01*np.exp(0.5*t)/(1 + 0.01*(np.exp(0.5*t) - 1))
+    d= od[:,None]*np.exp(0.03*rng.standard_normal((len(t), 3)))
+    q= fd.fitderiv(t, d, batch= True, quiet= True, seed= 0, nosamples= 50)
+    pooled= fd.fitderiv(t, d, quiet= True, seed= 0, nosamples= 50)
+    assert q.batch and np.ndim(q.g.y) == 2
+    for attr in ['f', 'fvar', 'df', 'dfvar']:
+        assert np.shape(getattr(q, attr)) == (len(t),) and np.all(np.isfinite(getattr(q, attr))), attr
+    assert np.max(np.abs(q.df - pooled.df)) < 0.2*np.max(pooled.df)
+    assert q.ds['max df'] == pytest.approx(0.5, abs= 0.1)
+
+
+@pytest.mark.parametrize('kwargs, missing, reason', [({'inducing': 10}, False, 'sparse'),
+                                                     ({'cvfn': 'maternss'}, False, 'state-space'),
+                                                     ({}, True, 'missing data')])
+def test_batch_fallback(caplog, kwargs, missing, reason):
+    rng= np.random.default_rng(0)
+    t= np.linspace(0, 20, 40)
+    od= 0.01*np.exp(0.5*t)/(1 + 0.01*(np.exp(0.5*t) - 1))
+    d= od[:,None]*np.exp(0.03*rng.standard_normal((len(t), 3)))
+    if missing:
+        d[5, 1]= np.nan
+    q= fd.fitderiv(t, d, batch= True, quiet= True, stats= False, seed= 0, **kwargs)
+    assert not q.batch
+    assert 'Not using batch mode' in caplog.text and reason in caplog.text
+
+
+def test_predict_and_sample_at_new_times():
+    t, y= twophase(n= 40)
+    q= fd.fitderiv(t, y, quiet= True, stats= False, seed= 0)
+    stored= {attr: np.copy(getattr(q.g, attr)) for attr in ['xnew', 'mnp', 'fvar', 'dfvar', 'ddfvar']}
+    newt= np.linspace(0, 16, 101)
+    chunked= q.predict(newt, chunksize= 7)
+    whole= q.predict(newt, chunksize= None)
+    for key in whole:
+        assert np.allclose(chunked[key], whole[key], rtol= 1e-8, atol= 1e-12), key
+    fs, gs, hs= q.sample(2000, newt= newt, rng= 1)
+    assert fs.shape == gs.shape == hs.shape == (len(newt), 2000)
+    # the samples follow the prediction at the new times
+    assert np.all(np.abs(np.mean(gs, 1) - whole['df']) < 5*np.sqrt(whole['dfvar']/2000))
+    assert np.allclose(np.var(gs, 1), whole['dfvar'], rtol= 0.2)
+    # and the prediction at the measured times is unchanged
+    for attr, value in stored.items():
+        assert np.array_equal(getattr(q.g, attr), value), attr
+    assert q.sample(5, rng= 2)[1].shape == (len(t), 5)
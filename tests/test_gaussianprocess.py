@@ -0,0 +1,231 @@
+import numpy as np
+import pytest
+from diaux import gaussianprocess as gp
+
+
+def makedata(n= 40, seed= 0, uniform= False):
+    '''
+    Returns noisy samples of a smooth curve on [0, 10].
+    '''
+    rng= np.random.default_rng(seed)
+    x= np.linspace(0, 10, n) if uniform else np.sort(rng.uniform(0, 10, n))
+    return x, np.sin(x) + 0.1*x + 0.05*rng.standard_normal(n)
+
+
+def makegp(kernel, x, y, **kwargs):
+    '''
+    Returns a Gaussian process with wide bounds on its hyperparameters.
+    '''
+    cls= getattr(gp, kernel + 'GP')
+    return cls({i: (-6, 6) for i in range(cls.noparams + 1)}, x, y, **kwargs)
+
+
+def fdjac(g, lth, eps= 1e-6):
+    '''
+    Returns the Jacobian of the negative log marginal likelihood by central differences.
+    '''
+    jac= np.empty(len(lth))
+    for i in range(len(lth)):
+        dl= np.zeros(len(lth))
+        dl[i]= eps
+        jac[i]= (g.nlml(lth + dl) - g.nlml(lth - dl))/(2*eps)
+    return jac
+
+
+lths= {'sqexp': [0.5, 0.3, -5], 'matern': [0.5, 0.5, -5], 'nn': [0.5, -1, -5], 'sqexplin': [0.5, 0.3, -1, -5]}
+
+
+@pytest.mark.parametrize('kernel', ['sqexp', 'matern', 'nn', 'sqexplin'])
+def test_dense_jacobian(kernel):
+    x, y= makedata()
+    g= makegp(kernel, x, y)
+    lth= np.array(lths[kernel])
+    assert np.allclose(g.jacnlml(lth), fdjac(g, lth), rtol= 1e-5, atol= 1e-5)
+
+
+def test_statespace_matches_dense():
+    x, y= makedata()
+    g, gs= makegp('matern', x, y), makegp('maternss', x, y)
+    lth= np.array(lths['matern'])
+    assert gs.nlml(lth) == pytest.approx(g.nlml(lth), rel= 1e-8)
+    assert np.allclose(gs.jacnlml(lth), g.jacnlml(lth), rtol= 1e-6, atol= 1e-8)
+    g.lth_opt, gs.lth_opt= lth, lth
+    xnew= np.linspace(0, 10, 25)
+    g.predict(xnew, derivs= 2)
+    gs.predict(xnew, derivs= 2)
+    for attr in ['f', 'fvar', 'df', 'dfvar', 'ddf', 'ddfvar']:
+        assert np.allclose(getattr(gs, attr), getattr(g, attr), rtol= 1e-6, atol= 1e-8), attr
+
+
+@pytest.mark.parametrize('kernel', ['sqexp', 'matern'])
+def test_sparse_jacobian(kernel):
+    x, y= makedata(60)
+    g= makegp(kernel, x, y, inducing= 15)
+    lth= np.array(lths[kernel])
+    assert np.allclose(g.jacnlml(lth), fdjac(g, lth), rtol= 1e-5, atol= 1e-5)
+
+
+def test_sparse_matches_dense():
+    # with inducing points at the data, the variational bound is the exact likelihood
+    x, y= makedata()
+    g, gs= makegp('sqexp', x, y), makegp('sqexp', x, y, inducing= x)
+    lth= np.array(lths['sqexp'])
+    assert gs.nlml(lth) == pytest.approx(g.nlml(lth), rel= 1e-5)
+    g.lth_opt, gs.lth_opt= lth, lth
+    xnew= np.linspace(0, 10, 25)
+    g.predict(xnew, derivs= 1)
+    gs.predict(xnew, derivs= 1)
+    for attr in ['f', 'fvar', 'df', 'dfvar']:
+        assert np.allclose(getattr(gs, attr), getattr(g, attr), rtol= 1e-4, atol= 1e-6), attr
+
+
+@pytest.mark.parametrize('kernel', ['sqexp', 'matern'])
+def test_toeplitz_matches_dense(kernel):
+    x, y= makedata(400, uniform= True)
+    g, gd= makegp(kernel, x, y), makegp(kernel, x, y, toeplitz= False)
+    lth= np.array(lths[kernel])
+    assert g.usetoeplitz(lth) and not gd.usetoeplitz(lth)
+    assert g.nlml(lth) == pytest.approx(gd.nlml(lth), rel= 1e-8)
+    assert np.allclose(g.jacnlml(lth), gd.jacnlml(lth), rtol= 1e-6, atol= 1e-6)
+    g.lth_opt, gd.lth_opt= lth, lth
+    xnew= np.linspace(0, 10, 25)
+    g.predict(xnew, derivs= 1, full_cov= False)
+    gd.predict(xnew, derivs= 1, full_cov= False)
+    for attr in ['f', 'fvar', 'df', 'dfvar']:
+        assert np.allclose(getattr(g, attr), getattr(gd, attr), rtol= 1e-6, atol= 1e-8), attr
+
+
+def test_toeplitz_falls_back_to_dense():
+    # too few points
+    x, y= makedata(100, uniform= True)
+    assert not makegp('sqexp', x, y).istoeplitz()
+    # too little measurement noise for the Levinson-Durbin recursion
+    x, y= makedata(400, uniform= True)
+    g, gd= makegp('sqexp', x, y), makegp('sqexp', x, y, toeplitz= False)
+    lth= np.log([1e2, 1e-1, 1e-10])
+    assert g.istoeplitz() and not g.usetoeplitz(lth)
+    assert g.nlml(lth) == gd.nlml(lth)
+    assert np.array_equal(g.jacnlml(lth), gd.jacnlml(lth))
+
+
+@pytest.mark.parametrize('multioutput', [False, True])
+def test_append_matches_refit(multioutput):
+    x, y= makedata()
+    if multioutput:
+        y= np.column_stack((y, 2*y + 0.05*np.random.default_rng(1).standard_normal(len(y))))
+    lth= np.array(lths['sqexp'])
+    g= makegp('sqexp', x[:30], y[:30])
+    g.lth_opt= lth
+    g.predict(x[:30])
+    g.append(x[30:], y[30:])
+    # the Cholesky factor was extended rather than discarded
+    assert g._factor[0] == ('dense', lth.tobytes())
+    gf= makegp('sqexp', x, y)
+    gf.lth_opt= lth
+    assert g.nlml(lth) == pytest.approx(gf.nlml(lth), rel= 1e-10)
+    assert np.allclose(g.jacnlml(lth), gf.jacnlml(lth), rtol= 1e-8, atol= 1e-10)
+    xnew= np.linspace(0, 10, 25)
+    g.predict(xnew, derivs= 1)
+    gf.predict(xnew, derivs= 1)
+    for attr in ['f', 'fvar', 'df', 'dfvar']:
+        assert np.allclose(getattr(g, attr), getattr(gf, attr), rtol= 1e-8, atol= 1e-10), attr
+
+
+@pytest.mark.parametrize('n, kernel', [(40, 'sqexp'), (40, 'matern'), (400, 'sqexp'), (400, 'matern')])
+def test_multioutput_jacobian(n, kernel):
+    x, y= makedata(n, uniform= True)
+    y= np.column_stack((y, 2*y + 0.05*np.random.default_rng(1).standard_normal(n), -y))
+    g= makegp(kernel, x, y)
+    lth= np.array(lths[kernel])
+    assert g.usetoeplitz(lth) == (n >= 300)
+    assert np.allclose(g.jacnlml(lth), fdjac(g, lth), rtol= 1e-5, atol= 1e-5)
+    # the outputs are independent
+    nlmls= [makegp(kernel, x, y[:,i]).nlml(lth) for i in range(y.shape[1])]
+    assert g.nlml(lth) == pytest.approx(np.sum(nlmls), rel= 1e-10)
+
+
+def test_multioutput_rejected_by_sparse_and_statespace():
+    x, y= makedata()
+    y= np.column_stack((y, y))
+    with pytest.raises(gp.gaussianprocessException):
+        makegp('sqexp', x, y, inducing= 10)
+    with pytest.raises(gp.gaussianprocessException):
+        makegp('maternss', x, y).nlml(np.array(lths['matern']))
+
+
+@pytest.mark.parametrize('kernel, n', [('sqexp', 40), ('matern', 40), ('sqexp', 400)])
+def test_chunked_predictions(kernel, n):
+    x, y= makedata(n, uniform= True)
+    g= makegp(kernel, x, y)
+    g.lth_opt= np.array(lths[kernel])
+    xnew= np.linspace(-1, 11, 53)
+    attrs= ['f', 'fvar', 'df', 'dfvar', 'ddf', 'ddfvar']
+    g.predict(xnew, derivs= 2, full_cov= True)
+    full= {attr: getattr(g, attr).copy() for attr in attrs}
+    assert np.allclose(np.diag(g.covp), np.concatenate([full['fvar'], full['dfvar'], full['ddfvar']]))
+    for chunksize in [None, 7]:
+        g.predict(xnew, derivs= 2, full_cov= False, chunksize= chunksize)
+        for attr in attrs:
+            assert np.allclose(getattr(g, attr), full[attr], rtol= 1e-8, atol= 1e-12), (chunksize, attr)
+
+
+@pytest.mark.parametrize('pool', ['thread', 'process'])
+def test_concurrent_runs_are_deterministic(pool):
+    x, y= makedata()
+    g= makegp('sqexp', x, y)
+    g.findhyperparameters(4, nojobs= 1, seed= 0)
+    lth= g.lth_opt.copy()
+    g.findhyperparameters(4, nojobs= 2, pool= pool, seed= 0)
+    assert np.array_equal(g.lth_opt, lth)
+
+
+def test_concurrent_runs_reuse_executor():
+    from concurrent import futures
+    x, y= makedata()
+    g= makegp('sqexp', x, y)
+    g.findhyperparameters(4, nojobs= 1, seed= 0)
+    lth= g.lth_opt.copy()
+    with futures.ThreadPoolExecutor(max_workers= 2) as executor:
+        g.findhyperparameters(4, nojobs= 2, pool= executor, seed= 0)
+        assert np.array_equal(g.lth_opt, lth)
+        # the executor is not shut down
+        assert executor.submit(sum, [1, 2]).result() == 3
+
+
+def test_kernel_jacobian_is_lazy():
+    x, y= makedata()
+    g= makegp('sqexp', x, y)
+    lth= np.array(lths['sqexp'])
+    g.nlml(lth)
+    g.lth_opt= lth
+    g.predict(x)
+    # the Jacobian of the kernel matrix is not needed for the likelihood or predictions
+    assert g._factor[2] is None
+    L= g._factor[3]
+    jac= g.jacnlml(lth)
+    assert g._factor[2].shape == (len(x), len(x), g.noparams)
+    # the Cholesky factor is reused
+    assert g._factor[3] is L
+    assert np.allclose(jac, fdjac(g, lth), rtol= 1e-5, atol= 1e-5)
+
+
+@pytest.mark.parametrize('lower', [False, True])
+def test_choinverse(lower):
+    a= np.random.default_rng(0).standard_normal((20, 20))
+    k= np.dot(a, a.T) + 20*np.identity(20)
+    assert np.allclose(gp._choinverse(gp.linalg.cho_factor(k, lower= lower)), np.linalg.inv(k))
+
+
+def test_sparse_samples():
+    x, y= makedata(60)
+    g= makegp('sqexp', x, y, inducing= 15)
+    g.lth_opt= np.array(lths['sqexp'])
+    xnew= np.linspace(0, 10, 30)
+    g.predict(xnew, derivs= 1, full_cov= False)
+    varp= np.concatenate((g.fvar, g.dfvar))
+    assert np.allclose(np.diag(g.covp), varp, rtol= 1e-8, atol= 1e-12)
+    s= g.sample(20000, rng= 0)
+    assert np.allclose(np.mean(s, 1), g.mnp, atol= 4*np.sqrt(varp.max()/20000))
+    assert np.allclose(np.var(s, 1), varp, rtol= 0.05)
+    # the samples are smooth: the posterior covariance of neighbouring points is not neglected
+    assert np.allclose(np.cov(s), g.covp, atol= 0.05*varp.max())
@@ -0,0 +1,439 @@
+import numpy as np
+import pytest
+import scipy.integrate
+from diaux import model
+
+AVO = 6.022E23
+OD_CONV = 6E17
+GAMMA_MAX = 17.1 * 3600 / 7459
+
+
+def single_setup(num_muts=3):
+    """
+    Returns the parameters and arguments, excluding the number of mutants,
+    of `single_nutrient` for mutants with different ribosomal allocations.
+    """
+    phi_R = np.linspace(0.15, 0.25, num_muts)
+    phi_P = 0.48 - phi_R
+    M = np.ones(num_muts) * 0.04 * OD_CONV / num_muts
+    params = np.concatenate([M, phi_R * M, phi_P * M, 4.5E-4 * M,
+                             [0.006 * AVO * 1E-3]])
+    args = (GAMMA_MAX, 2.5, 2E-3, 5E-6, 0.37, phi_R, phi_P)
+    return params, args
+
+
+def diauxic_setup(num_muts=3):
+    """
+    Returns the parameters and arguments, excluding the number of mutants,
+    of `diauxic_nutrient` for mutants with different allocations to the
+    first nutrient, with both nutrients near their Monod constants.
+    """
+    M = np.ones(num_muts) * 0.04 * OD_CONV / num_muts
+    nutrients = np.array([5E-6, 1E-5]) * AVO * 1E-3
+    params = np.concatenate([M, 0.2 * M, 0.1 * M, 0.05 * M, 2E-4 * M,
+                             nutrients])
+    args = (GAMMA_MAX, 2.5, 5, 2E-3, 5E-6, 5E-6, 0.3, 0.1, 0.2,
+            np.linspace(0.2, 0.3, num_muts), 0.1)
+    return params, args
+
+
+def fd_jacobian(fun, params, args, eps=1E-6):
+    """
+    Returns the Jacobian of `fun` with respect to the parameters by central
+    differences with steps relative to each parameter.
+    """
+    params = np.asarray(params, dtype=float)
+    jac = np.empty((len(params), len(params)))
+    for j in range(len(params)):
+        step = np.zeros(len(params))
+        step[j] = eps * abs(params[j])
+        jac[:, j] = (np.hstack(fun(params + step, 0, *args)) -
+                     np.hstack(fun(params - step, 0, *args))) / (2 * step[j])
+    return jac
+
+
+def sample_phi_R(rng, values):
+    phi_R = np.clip(values[0] + rng.normal(0, 0.02, values.shape[1]),
+                    0.05, 0.45)
+    return np.array([phi_R, 0.48 - phi_R])
+
+
+def test_compete_lineages_events_follow_introduced_lineages():
+    params, args = single_setup()
+    threshold = 0.5 * OD_CONV
+    abundance, lineages = model.compete_lineages(
+        np.linspace(0, 10, 50), model.single_nutrient, params, args,
+        {-1: params[-1]}, {'phi_R': 5, 'phi_P': 6}, sample_phi_R,
+        mutation_rate=2, num_dilutions=8, target_mass=0.04 * OD_CONV,
+        num_muts=3, colnames=['M', 'Mr', 'Mp', 'precursors'],
+        events=[model.mass_threshold(threshold, num_muts=None)], seed=0)
+    sizes = abundance.groupby('dilution_cycle').size()
+    assert len(lineages) > 3 and sizes.max() > 3
+    # every cycle stops once the mass of all lineages, including the new
+    # ones, reaches the threshold
+    total = abundance.groupby('dilution_cycle')['M'].sum()
+    assert np.allclose(total, threshold, rtol=1E-6)
+
+
+def test_compete_lineages_rejects_fixed_events():
+    params, args = single_setup()
+    with pytest.raises(ValueError):
+        model.compete_lineages(
+            np.linspace(0, 10, 50), model.single_nutrient, params, args,
+            {-1: params[-1]}, {'phi_R': 5, 'phi_P': 6}, sample_phi_R,
+            num_dilutions=2, target_mass=0.04 * OD_CONV, num_muts=3,
+            events=[model.mass_threshold(0.5 * OD_CONV, num_muts=3)])
+
+
+def test_stream_dilutions_resume_matches_dilution_cycle(tmp_path):
+    params, args = single_setup()
+    args = args + (3,)
+    time = np.linspace(0, 3, 20)
+    kwargs = dict(target_mass=0.04 * OD_CONV, num_muts=3,
+                  jac=model.single_nutrient_jacobian)
+    traj, times = model.dilution_cycle(time, model.single_nutrient, params,
+                                       args, {-1: params[-1]},
+                                       num_dilutions=6, return_array=True,
+                                       **kwargs)
+    # interrupt the run after four cycles and resume it
+    assert model.stream_dilutions(tmp_path, time, model.single_nutrient,
+                                  params, args, {-1: params[-1]},
+                                  num_dilutions=3, **kwargs) == 4
+    assert model.stream_dilutions(tmp_path, time, model.single_nutrient,
+                                  params, args, {-1: params[-1]},
+                                  num_dilutions=6, **kwargs) == 7
+    streamed, streamed_times = model.load_dilutions(tmp_path)
+    assert np.allclose(streamed, traj, rtol=1E-10)
+    assert np.allclose(streamed_times, times)
+
+
+def test_stream_dilutions_restart_removes_checkpoint(tmp_path):
+    params, args = single_setup()
+    args = args + (3,)
+    time = np.linspace(0, 3, 20)
+    model.stream_dilutions(tmp_path, time, model.single_nutrient, params,
+                           args, {-1: params[-1]}, num_dilutions=2,
+                           target_mass=0.04 * OD_CONV, num_muts=3)
+    # a restart interrupted before its first cycle leaves nothing to resume
+    def interrupted(*args):
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        model.stream_dilutions(tmp_path, time, interrupted, params, args,
+                               {-1: params[-1]}, resume=False)
+    assert not list(tmp_path.iterdir())
+
+
+def test_dilution_cycle_dataframe_matches_array():
+    params, args = single_setup()
+    time = np.linspace(0, 3, 20)
+    colnames = [f'{q}_{i}' for q in ['M', 'Mr', 'Mp', 'precursors']
+                for i in range(3)] + ['nutrients']
+    kwargs = dict(num_dilutions=3, target_mass=0.04 * OD_CONV, num_muts=3)
+    dil_df = model.dilution_cycle(time, model.single_nutrient, params,
+                                  args + (3,), {-1: params[-1]},
+                                  colnames=colnames, **kwargs)
+    traj, times = model.dilution_cycle(time, model.single_nutrient, params,
+                                       args + (3,), {-1: params[-1]},
+                                       return_array=True, **kwargs)
+    # the index restarts for each cycle
+    assert list(dil_df.index) == list(range(len(time))) * 4
+    assert np.array_equal(dil_df[colnames].values, traj.reshape(-1, 13))
+    assert np.array_equal(dil_df['time'].values, times.ravel())
+    tidy_df = model.tidy_dilution(traj, times, ['M', 'Mr', 'Mp',
+                                                'precursors'],
+                                  ['nutrients'], num_muts=3)
+    mutant = tidy_df[tidy_df['idx'] == 1]
+    assert np.array_equal(mutant['Mr'].values, dil_df['Mr_1'].values)
+    assert np.array_equal(mutant['nutrients'].values,
+                          dil_df['nutrients'].values)
+
+
+@pytest.mark.parametrize('num_muts', [1, 3])
+def test_single_nutrient_jacobian(num_muts):
+    params, args = single_setup(num_muts)
+    args = args + (num_muts,)
+    jac = model.single_nutrient_jacobian(params, 0, *args)
+    scale = np.abs(jac).max(axis=1, keepdims=True)
+    assert np.allclose(jac, fd_jacobian(model.single_nutrient, params, args),
+                       rtol=1E-5, atol=1E-7 * scale)
+
+
+@pytest.mark.parametrize('num_muts', [1, 3])
+def test_diauxic_nutrient_jacobian(num_muts):
+    params, args = diauxic_setup(num_muts)
+    args = args + (num_muts,)
+    jac = model.diauxic_nutrient_jacobian(params, 0, *args)
+    scale = np.abs(jac).max(axis=1, keepdims=True)
+    assert np.allclose(jac, fd_jacobian(model.diauxic_nutrient, params, args),
+                       rtol=1E-5, atol=1E-7 * scale)
+
+
+def test_diauxic_nutrient_uses_both_nutrients():
+    params, args = diauxic_setup()
+    time = np.linspace(0, 10, 100)
+    out = scipy.integrate.odeint(model.diauxic_nutrient, params, time,
+                                 args=args + (3,),
+                                 Dfun=model.diauxic_nutrient_jacobian)
+    # both nutrients are consumed and the biomass grows
+    assert np.all(out[-1, -2:] < 0.01 * params[-2:])
+    mass = out[:, :3].sum(axis=1)
+    assert np.all(np.diff(mass) >= 0) and mass[-1] > mass[0]
+
+
+@pytest.mark.parametrize('jac', [None, model.single_nutrient_jacobian])
+def test_integrate_sweep_matches_odeint(jac):
+    rng = np.random.default_rng(0)
+    num_models = 5
+    nu_max = rng.uniform(1, 5, num_models)
+    phi_R = rng.uniform(0.1, 0.3, num_models)
+    M = 0.04 * OD_CONV
+    params = np.stack([np.full(num_models, M), phi_R * M, (0.48 - phi_R) * M,
+                       np.full(num_models, 4.5E-4 * M),
+                       np.full(num_models, 0.006 * AVO * 1E-3)], axis=1)
+    time = np.linspace(0, 3, 50)
+    args = (GAMMA_MAX, nu_max, 2E-3, 5E-6, 0.37, phi_R, 0.48 - phi_R)
+    out = model.integrate_sweep(model.single_nutrient, params, time, args,
+                                jac=jac, chunksize=2)
+    for k in range(num_models):
+        _args = (GAMMA_MAX, nu_max[k], 2E-3, 5E-6, 0.37, phi_R[k],
+                 0.48 - phi_R[k])
+        ref = scipy.integrate.odeint(model.single_nutrient, params[k], time,
+                                     args=_args)
+        assert np.allclose(out[k], ref, rtol=1E-5,
+                           atol=1E-5 * np.abs(ref).max(axis=0))
+
+
+def test_integrate_sweep_varied_arguments():
+    M = 0.04 * OD_CONV
+    params = np.array([M, 0.2 * M, 0.28 * M, 4.5E-4 * M, 0.006 * AVO * 1E-3])
+    time = np.linspace(0, 1, 10)
+    nu_max = np.array([1.0, 2.0, 3.0])
+    args = (GAMMA_MAX, nu_max, 2E-3, 5E-6, 0.37, 0.2, 0.28)
+    # varied arguments of different lengths are an error
+    with pytest.raises(ValueError):
+        model.integrate_sweep(model.single_nutrient, params, time,
+                              args[:5] + (np.full(2, 0.2), 0.28))
+    with pytest.raises(ValueError):
+        model.integrate_sweep(model.single_nutrient, np.tile(params, (2, 1)),
+                              time, args)
+    out = model.integrate_sweep(model.single_nutrient, params, time, args)
+    assert out.shape == (3, len(time), len(params))
+    assert np.array_equal(model.integrate_sweep(model.single_nutrient, 
+                                                params, time, args, 
+                                                varied=[1]), out)
+
+
+def test_compete_lineages_without_mutants_matches_dilution_cycle():
+    params, args = single_setup()
+    time = np.linspace(0, 3, 20)
+    abundance, lineages = model.compete_lineages(
+        time, model.single_nutrient, params, args, {-1: params[-1]},
+        {'phi_R': 5, 'phi_P': 6}, sample_phi_R, mutation_rate=0,
+        num_dilutions=4, target_mass=0.04 * OD_CONV, num_muts=3,
+        colnames=['M', 'Mr', 'Mp', 'precursors'])
+    traj, times = model.dilution_cycle(time, model.single_nutrient, params,
+                                       args + (3,), {-1: params[-1]},
+                                       num_dilutions=4, num_muts=3,
+                                       target_mass=0.04 * OD_CONV,
+                                       return_array=True)
+    assert np.allclose(abundance['M'].values, traj[:, -1, :3].ravel(),
+                       rtol=1E-10)
+    assert np.allclose(abundance['time'].unique(), times[:, -1])
+    assert list(lineages['parent']) == [-1] * 3
+
+
+def test_compete_lineages_bookkeeping():
+    params, args = single_setup()
+    abundance, lineages = model.compete_lineages(
+        np.linspace(0, 3, 20), model.single_nutrient, params, args,
+        {-1: params[-1]}, {'phi_R': 5, 'phi_P': 6}, sample_phi_R,
+        mutation_rate=2, founder_fraction=1E-3,
+        extinction_mass=1E-5 * OD_CONV, num_dilutions=30,
+        target_mass=0.04 * OD_CONV, num_muts=3,
+        colnames=['M', 'Mr', 'Mp', 'precursors'], seed=1)
+    assert list(lineages['lineage']) == list(range(len(lineages)))
+    # every mutant descends from an earlier lineage alive at its birth
+    mutants = lineages[lineages['parent'] >= 0]
+    parents = lineages.loc[mutants['parent']]
+    assert len(mutants) > 0
+    assert np.all(parents['birth_cycle'].values < mutants['birth_cycle'].values)
+    assert np.all((parents['extinction_cycle'].values == -1) |
+                  (parents['extinction_cycle'].values >
+                   mutants['birth_cycle'].values))
+    assert np.allclose(mutants['phi_R'] + mutants['phi_P'], 0.48)
+    # each cycle records exactly the lineages alive during it
+    for n, cycle in abundance.groupby('dilution_cycle'):
+        alive = lineages[(lineages['birth_cycle'] <= n) &
+                         ((lineages['extinction_cycle'] == -1) |
+                          (lineages['extinction_cycle'] > n))]
+        assert sorted(cycle['lineage']) == list(alive['lineage'])
+    extinct = lineages[lineages['extinction_cycle'] >= 0]
+    assert len(extinct) > 0
+    last = abundance.groupby('lineage')['dilution_cycle'].max()
+    assert np.all(last[extinct['lineage']].values ==
+                  extinct['extinction_cycle'].values - 1)
+
+
+def test_compete_lineages_continues_after_fixation():
+    # the second lineage is rare and slow growing, so it goes extinct
+    phi_R = np.array([0.2, 0.05])
+    M = np.array([0.999, 0.001]) * 0.04 * OD_CONV
+    params = np.concatenate([M, phi_R * M, (0.48 - phi_R) * M, 4.5E-4 * M,
+                             [0.006 * AVO * 1E-3]])
+    args = (GAMMA_MAX, 2.5, 2E-3, 5E-6, 0.37, phi_R, 0.48 - phi_R)
+    abundance, lineages = model.compete_lineages(
+        np.linspace(0, 3, 20), model.single_nutrient, params, args,
+        {-1: params[-1]}, {'phi_R': 5, 'phi_P': 6}, sample_phi_R,
+        mutation_rate=0, extinction_mass=4E-7 * OD_CONV, num_dilutions=10,
+        target_mass=0.04 * OD_CONV, num_muts=2,
+        colnames=['M', 'Mr', 'Mp', 'precursors'])
+    assert list(lineages['extinction_cycle']) == [-1, 6]
+    sizes = abundance.groupby('dilution_cycle').size()
+    assert list(sizes) == [2] * 6 + [1] * 5
+
+
+@pytest.mark.parametrize('fun, setup, lineage_args, num_shared', [
+    (model.single_nutrient, single_setup, {'phi_R': 5, 'phi_P': 6}, 1),
+    (model.diauxic_nutrient, diauxic_setup, {'phi_x_max': 9}, 2)])
+def test_compete_lineages_single_founder(fun, setup, lineage_args,
+                                         num_shared):
+    params, args = setup(1)
+    nutrient_dict = {-k: params[-k] for k in range(1, num_shared + 1)}
+    abundance, lineages = model.compete_lineages(
+        np.linspace(0, 3, 20), fun, params, args, nutrient_dict,
+        lineage_args, lambda rng, values: values, mutation_rate=0,
+        num_dilutions=3, target_mass=0.04 * OD_CONV, num_muts=1,
+        num_shared=num_shared)
+    traj, times = model.dilution_cycle(np.linspace(0, 3, 20), fun, params,
+                                       args + (1,), nutrient_dict,
+                                       num_dilutions=3,
+                                       target_mass=0.04 * OD_CONV,
+                                       return_array=True)
+    assert np.allclose(abundance['0'].values, traj[:, -1, 0], rtol=1E-10)
+
+
+def kernel_args(args, num_muts, per_mutant):
+    """
+    Returns the arguments of the compiled kernels, with the per-mutant
+    arguments, at the indices `per_mutant`, broadcast to arrays.
+    """
+    return tuple(model._per_mutant(a, num_muts) if i in per_mutant else a
+                 for i, a in enumerate(args)) + (num_muts, 1E-3)
+
+
+@pytest.mark.parametrize('num_muts', [1, 3, 20])
+@pytest.mark.parametrize('fun, jac, loops, jac_loops, setup, per_mutant', [
+    (model.single_nutrient, model.single_nutrient_jacobian,
+     model._single_nutrient_loops, model._single_nutrient_jacobian_loops,
+     single_setup, (5, 6)),
+    (model.diauxic_nutrient, model.diauxic_nutrient_jacobian,
+     model._diauxic_nutrient_loops, model._diauxic_nutrient_jacobian_loops,
+     diauxic_setup, (8, 9, 10))])
+def test_kernels_match_numpy(monkeypatch, num_muts, fun, jac, loops,
+                             jac_loops, setup, per_mutant):
+    monkeypatch.setattr(model, 'USE_NUMBA', False)
+    params, args = setup(num_muts)
+    _args = kernel_args(args, num_muts, per_mutant)
+    assert np.array_equal(loops(params, *_args),
+                          np.hstack(fun(params, 0, *args, num_muts)))
+    assert np.array_equal(jac_loops(params, *_args),
+                          jac(params, 0, *args, num_muts))
+
+
+@pytest.mark.parametrize('fun, jac, loops, jac_loops, setup, per_mutant', [
+    (model.single_nutrient, model.single_nutrient_jacobian,
+     model._single_nutrient_loops, model._single_nutrient_jacobian_loops,
+     single_setup, (5, 6)),
+    (model.diauxic_nutrient, model.diauxic_nutrient_jacobian,
+     model._diauxic_nutrient_loops, model._diauxic_nutrient_jacobian_loops,
+     diauxic_setup, (8, 9, 10))])
+def test_kernels_match_numpy_scalar_arguments(monkeypatch, fun, jac, loops,
+                                              jac_loops, setup, per_mutant):
+    # a single mutant with scalar arguments uses the unstacked layout
+    monkeypatch.setattr(model, 'USE_NUMBA', False)
+    params, args = setup(1)
+    args = tuple(float(a[0]) if np.ndim(a) else a for a in args)
+    _args = kernel_args(args, 1, per_mutant)
+    assert np.array_equal(loops(params, *_args),
+                          np.hstack(fun(params, 0, *args)))
+    assert np.array_equal(jac_loops(params, *_args), jac(params, 0, *args))
+
+
+@pytest.mark.parametrize('num_muts', [1, 3])
+def test_numba_dispatch_matches_numpy(monkeypatch, num_muts):
+    pytest.importorskip('numba')
+    params, args = single_setup(num_muts)
+    args = args + (num_muts,)
+    monkeypatch.setattr(model, 'USE_NUMBA', True)
+    compiled = (np.hstack(model.single_nutrient(params, 0, *args)),
+                model.single_nutrient_jacobian(params, 0, *args))
+    monkeypatch.setattr(model, 'USE_NUMBA', False)
+    assert np.array_equal(compiled[0],
+                          np.hstack(model.single_nutrient(params, 0, *args)))
+    assert np.array_equal(compiled[1],
+                          model.single_nutrient_jacobian(params, 0, *args))
+    params, args = diauxic_setup(num_muts)
+    args = args + (num_muts,)
+    monkeypatch.setattr(model, 'USE_NUMBA', True)
+    compiled = (np.hstack(model.diauxic_nutrient(params, 0, *args)),
+                model.diauxic_nutrient_jacobian(params, 0, *args))
+    monkeypatch.setattr(model, 'USE_NUMBA', False)
+    assert np.array_equal(compiled[0],
+                          np.hstack(model.diauxic_nutrient(params, 0, *args)))
+    assert np.array_equal(compiled[1],
+                          model.diauxic_nutrient_jacobian(params, 0, *args))
+
+
+@pytest.mark.parametrize('event', [
+    model.nutrient_exhaustion(0.001 * AVO * 1E-3),
+    model.mass_threshold(0.2 * OD_CONV, num_muts=3)])
+def test_dilution_cycle_events(event):
+    params, args = single_setup()
+    args = args + (3,)
+    time = np.linspace(0, 10, 50)
+    target_mass = 0.04 * OD_CONV
+    traj, times = model.dilution_cycle(time, model.single_nutrient, params,
+                                       args, {-1: params[-1]},
+                                       num_dilutions=2, num_muts=3,
+                                       target_mass=target_mass,
+                                       events=[event], return_array=True)
+    # the cycle is cut short by the event
+    ref = scipy.integrate.solve_ivp(
+        lambda t, y: model.single_nutrient(y, t, *args), (0, 10), params,
+        method='LSODA', events=lambda t, y: event(y, t, *args),
+        rtol=1.49012E-8, atol=1.49012E-8)
+    t_event, y_event = ref.t_events[0][0], ref.y_events[0][0]
+    after = time > t_event
+    assert after.any() and not after.all()
+    assert np.all(np.isnan(traj[0, after])) and np.all(np.isnan(times[0, after]))
+    assert np.all(np.isfinite(traj[0, ~after]))
+    # the next cycle starts from the diluted state at the event
+    dilution_factor = y_event[:3].sum() / target_mass
+    assert np.allclose(traj[1, 0, :-1], y_event[:-1] / dilution_factor,
+                       rtol=1E-5)
+    assert traj[1, 0, -1] == pytest.approx(params[-1], rel=1E-12)
+    assert times[1, 0] == pytest.approx(t_event, rel=1E-5)
+
+
+def test_dilution_cycle_stops_at_steady_state():
+    # a single mutant, whose cycles converge rather than being taken over
+    params, args = single_setup(1)
+    args = args + (1,)
+    time = np.linspace(0, 10, 50)
+    kwargs = dict(num_muts=1, target_mass=0.04 * OD_CONV,
+                  events=[model.nutrient_exhaustion(0.001 * AVO * 1E-3)])
+    traj, times = model.dilution_cycle(time, model.single_nutrient, params,
+                                       args, {-1: params[-1]},
+                                       num_dilutions=200, ss_rtol=1E-8,
+                                       return_array=True, **kwargs)
+    num_cycles = len(traj)
+    assert 3 < num_cycles < 201 and times.shape == traj.shape[:2]
+    # the starting states of the last two cycles agree
+    assert np.allclose(traj[-1, 0], traj[-2, 0], rtol=1E-8, atol=0)
+    assert not np.allclose(traj[-2, 0], traj[-3, 0], rtol=1E-8, atol=0)
+    # and the cycles run match those of an unchecked run
+    full, _ = model.dilution_cycle(time, model.single_nutrient, params, args,
+                                   {-1: params[-1]},
+                                   num_dilutions=num_cycles - 1,
+                                   return_array=True, **kwargs)
+    assert np.array_equal(traj, full, equal_nan=True)